@@ -0,0 +1,664 @@
+import base64
+import binascii
+import contextlib
+import os
+from datetime import date
+
+import requests
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.authentication import AuthCredentials, AuthenticationBackend, AuthenticationError, SimpleUser, requires
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.authentication import AuthenticationMiddleware
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app import init_db, login_user
+from services import bria_client, downloads
+from services.llm import get_llm
+from services.logo_generator import agenerate_logos
+from services.image_editor import aedit_image
+from services.local_edits import LOCAL_PRESETS, ASPECT_RATIOS, arun_local_edit
+from services.brand_kit_generator import ASSET_CONFIGS, agenerate_brand_assets, agenerate_caption, agenerate_brand_kit_batch
+from services.brand_story_generator import LENGTH_TO_TOKENS, MAX_CANDIDATES, agenerate_story, agenerate_story_candidates, astream_story, arefine_story
+from services.brand_style_guide import agenerate_style_guide
+from services.style_guide_pdf import MAX_PDF_LOGOS, generate_style_guide_pdf
+from services.export import iter_zip, blob_entries
+from services.sessions import create_session, validate_session, revoke_session
+from services.usage import ametered, check_quota, QuotaExceededError
+from services.circuit_breaker import CircuitOpenError
+from services.admission import aadmit, AdmissionRejectedError
+from services.image_formats import OUTPUT_FORMATS
+from services.prewarm import aprewarm, readiness
+from services.image_index import index_image
+from services.history import record_generation
+from services.style_guide_schema import style_guide_text
+from services.image_ingest import check_content_length, aread_limited, open_image, ImageRejectedError, ImageTooLargeError
+
+# Run with: uvicorn api:app --host 0.0.0.0 --port 8000
+
+RESOLUTIONS = (256, 512, 1024)
+NUM_RESULTS = (1, 2)
+MAX_BATCH_JOBS = 50
+MAX_EXPORT_ASSETS = 200
+BATCH_CONCURRENCY = 8
+
+class BasicAuthBackend(AuthenticationBackend):
+    """Authenticate HTTP Basic credentials against the users table, or a Bearer session token"""
+
+    async def authenticate(self, conn):
+        if "Authorization" not in conn.headers:
+            return None
+        try:
+            scheme, credentials = conn.headers["Authorization"].split(" ", 1)
+            if scheme.lower() == "bearer":
+                # Session tokens are checked with an HMAC and one indexed lookup instead of bcrypt
+                username = await run_in_threadpool(validate_session, credentials)
+                if not username:
+                    raise AuthenticationError("Invalid or expired session token")
+                return AuthCredentials(["authenticated"]), SimpleUser(username)
+            if scheme.lower() != "basic":
+                return None
+            decoded = base64.b64decode(credentials).decode("utf-8")
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise AuthenticationError("Invalid basic auth credentials")
+        username, _, password = decoded.partition(":")
+        # bcrypt is deliberately slow, so keep it off the event loop
+        if not username or not await run_in_threadpool(login_user, username, password):
+            raise AuthenticationError("Invalid username or password")
+        return AuthCredentials(["authenticated"]), SimpleUser(username)
+
+def on_auth_error(conn, exc):
+    return JSONResponse({"error": str(exc)}, status_code=401, headers={"WWW-Authenticate": "Basic"})
+
+def error_response(message, status_code=400):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+def store_image(image, username):
+    """Write a PIL image to the download store for username and return the URL it can be fetched from"""
+    blob_id = downloads.store_image(image)
+    downloads.grant_blob(blob_id, username)
+    return f"/api/assets/{blob_id}"
+
+def image_results(images, source, labels, username):
+    """Store generated images for download and add them to the user's similarity index, as the tool pages do.
+
+    Returns the asset URLs and index ids, both with None for images that failed.
+    """
+    urls = []
+    image_ids = []
+    for image, label in zip(images, labels):
+        if image is None:
+            urls.append(None)
+            image_ids.append(None)
+            continue
+        urls.append(store_image(image, username))
+        try:
+            image_id, _ = index_image(image, source, label, username)
+        except Exception:
+            # The similarity index is a convenience; it never fails the request
+            image_id = None
+        image_ids.append(image_id)
+    return urls, image_ids
+
+async def metered_stream(chunks, usage, on_complete=None):
+    """Stream chunks within the quota meter; on_complete(text) runs once the whole text was sent"""
+    parts = []
+    async with ametered(*usage):
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    if on_complete is not None:
+        await run_in_threadpool(on_complete, "".join(parts))
+
+def require_env(name):
+    value = os.getenv(name)
+    if not value:
+        raise LookupError(f"Server is missing the '{name}' environment variable.")
+    return value
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ValueError("Request body must be valid JSON.")
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object.")
+    return body
+
+def quota_response(e):
+    return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+
+async def call_backend(aw, action="generating image", usage=None, admission=None):
+    """Await an async service call and map backend failures to responses.
+
+    `usage` is (username, tool, units, resolution) for calls that count
+    against the user's quota; they are checked first and then recorded.
+    `admission` names the tool whose generation slots the call waits for.
+    """
+    try:
+        async with ametered(*usage) if usage else contextlib.nullcontext():
+            async with aadmit(admission) if admission else contextlib.nullcontext():
+                return await aw, None
+    except QuotaExceededError as e:
+        aw.close()
+        return None, quota_response(e)
+    except AdmissionRejectedError as e:
+        aw.close()
+        return None, JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+    except CircuitOpenError as e:
+        return None, JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else 502
+        return None, error_response(bria_client.error_message(status_code, action), 502 if status_code >= 500 else status_code)
+    except Exception as e:
+        return None, error_response(f"An error occurred: {str(e)}", 502)
+
+def backend_error(e, action):
+    """Describe a failed job of a batch request"""
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return bria_client.error_message(e.response.status_code, action)
+    return f"An error occurred: {str(e)}"
+
+async def read_image_body(request):
+    """Stream an uploaded image up to MAX_IMAGE_BYTES and check its header before anything decodes it"""
+    try:
+        check_content_length(request.headers.get("Content-Length"))
+        image_bytes = await aread_limited(request.stream())
+        if not image_bytes:
+            return None, error_response("Request body must contain the image to edit.")
+        await run_in_threadpool(open_image, image_bytes)
+    except ImageTooLargeError as e:
+        return None, error_response(str(e), 413)
+    except ImageRejectedError as e:
+        return None, error_response(str(e))
+    return image_bytes, None
+
+def parse_image_options(params):
+    num_results = int(params.get("num_results", 1))
+    resolution = int(params.get("resolution", 512))
+    if num_results not in NUM_RESULTS:
+        raise ValueError(f"num_results must be one of {NUM_RESULTS}.")
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {RESOLUTIONS}.")
+    return num_results, resolution
+
+@requires("authenticated", status_code=401)
+async def logos(request):
+    try:
+        body = await read_json(request)
+        api_key = require_env("BRIA_API_TOKEN")
+        prompt = body.get("prompt")
+        if not prompt:
+            return error_response("Please provide a brand description in 'prompt'.")
+        num_results, resolution = parse_image_options(body)
+        # Pass a preview's seed back with resolution 1024 to upgrade that logo to HD
+        seed = int(body["seed"]) if body.get("seed") is not None else None
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except (TypeError, ValueError) as e:
+        return error_response(str(e))
+
+    result, error = await call_backend(
+        agenerate_logos(api_key, prompt, num_results, resolution, seed), action="generating logo",
+        usage=(request.user.username, "logo_hd" if seed is not None else "logo", num_results, resolution),
+        admission="logo"
+    )
+    if error:
+        return error
+    data, images = result
+    label = "Logo HD" if seed is not None else "Logo"
+    urls, image_ids = await run_in_threadpool(
+        image_results, images, "logo", [f"{label} {i + 1}: {prompt}" for i in range(len(images))], request.user.username
+    )
+    params = {"num_results": num_results, "resolution": resolution}
+    if seed is not None:
+        params["seed"] = seed
+    await run_in_threadpool(
+        record_generation, "logo", prompt, params=params, image_ids=image_ids, username=request.user.username,
+        seeds=bria_client.result_seeds(data)
+    )
+    return JSONResponse({"resolution": resolution, "images": urls, "seeds": bria_client.result_seeds(data)})
+
+@requires("authenticated", status_code=401)
+async def edits(request):
+    if "preset" in request.query_params:
+        return await local_edit(request)
+    try:
+        api_key = require_env("BRIA_API_TOKEN")
+        edit_prompt = request.query_params.get("prompt")
+        if not edit_prompt:
+            return error_response("Please provide an edit description in the 'prompt' query parameter.")
+        num_results, resolution = parse_image_options(request.query_params)
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except (TypeError, ValueError) as e:
+        return error_response(str(e))
+
+    image_bytes, error = await read_image_body(request)
+    if error:
+        return error
+    result, error = await call_backend(
+        aedit_image(api_key, image_bytes, edit_prompt, num_results, resolution), action="editing logo",
+        usage=(request.user.username, "edit", num_results, resolution),
+        admission="edit"
+    )
+    if error:
+        return error
+    data, images = result
+    urls, image_ids = await run_in_threadpool(
+        image_results, images, "edit", [f"Edited Logo {i + 1}: {edit_prompt}" for i in range(len(images))],
+        request.user.username
+    )
+    await run_in_threadpool(
+        record_generation, "edit", edit_prompt,
+        params={"resolution": resolution, "num_results": num_results, "source": "API upload"},
+        image_ids=image_ids, username=request.user.username
+    )
+    return JSONResponse({"resolution": resolution, "images": urls})
+
+async def local_edit(request):
+    """Apply a local edit preset in the process pool without calling Bria"""
+    params = request.query_params
+    preset = params["preset"]
+    if preset not in LOCAL_PRESETS:
+        return error_response(f"preset must be one of {list(LOCAL_PRESETS)}.")
+    aspect_ratio = params.get("aspect_ratio", "1:1 (Square)")
+    if aspect_ratio not in ASPECT_RATIOS:
+        return error_response(f"aspect_ratio must be one of {list(ASPECT_RATIOS)}.")
+    image_bytes, error = await read_image_body(request)
+    if error:
+        return error
+    try:
+        image = await arun_local_edit(
+            image_bytes,
+            preset,
+            color=params.get("color", "#000000"),
+            aspect_ratio=aspect_ratio,
+            pad_color=params.get("pad_color")
+        )
+    except Exception as e:
+        return error_response(f"Error applying preset: {str(e)}")
+    urls, image_ids = await run_in_threadpool(image_results, [image], "edit", [f"{preset}: API upload"], request.user.username)
+    await run_in_threadpool(
+        record_generation, "image_edit", f"{preset}: API upload",
+        params={
+            "preset": preset, "color": params.get("color", "#000000"), "aspect_ratio": aspect_ratio,
+            "pad_color": params.get("pad_color"), "source": "API upload"
+        },
+        image_ids=image_ids, username=request.user.username
+    )
+    return JSONResponse({"preset": preset, "images": urls})
+
+@requires("authenticated", status_code=401)
+async def brand_kit(request):
+    try:
+        body = await read_json(request)
+        bria_api_key = require_env("BRIA_API_TOKEN")
+        google_api_key = require_env("GOOGLE_API_KEY")
+        prompt = body.get("prompt")
+        asset_type = body.get("asset_type", "Instagram Post (1080x1080)")
+        num_results = int(body.get("num_results", 1))
+        if not prompt:
+            return error_response("Please provide a brand asset prompt in 'prompt'.")
+        if asset_type not in ASSET_CONFIGS:
+            return error_response(f"asset_type must be one of {list(ASSET_CONFIGS)}.")
+        if num_results not in NUM_RESULTS:
+            return error_response(f"num_results must be one of {NUM_RESULTS}.")
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except (TypeError, ValueError) as e:
+        return error_response(str(e))
+
+    result, error = await call_backend(
+        agenerate_brand_assets(bria_api_key, prompt, asset_type, num_results), action="generating asset",
+        usage=(request.user.username, "brand_kit", num_results, ASSET_CONFIGS[asset_type]["width"]),
+        admission="brand_kit"
+    )
+    if error:
+        return error
+    data, images = result
+
+    # Generate caption for Instagram Post
+    caption = None
+    if asset_type == "Instagram Post (1080x1080)":
+        llm = get_llm(google_api_key, max_tokens=200, tool="caption")
+        caption, error = await call_backend(
+            agenerate_caption(llm, prompt), action="generating caption", usage=(request.user.username, "caption")
+        )
+        if error:
+            return error
+
+    config = ASSET_CONFIGS[asset_type]
+    urls, image_ids = await run_in_threadpool(
+        image_results, images, "kit", [f"{config['name'].capitalize()} {i + 1}: {prompt}" for i in range(len(images))],
+        request.user.username
+    )
+    await run_in_threadpool(
+        record_generation, "kit", prompt, output=caption, params={"asset_type": asset_type, "num_results": num_results},
+        image_ids=image_ids, username=request.user.username
+    )
+    return JSONResponse({
+        "asset_type": asset_type,
+        "width": config["width"],
+        "height": config["height"],
+        "images": urls,
+        "caption": caption
+    })
+
+@requires("authenticated", status_code=401)
+async def brand_kit_batch(request):
+    try:
+        body = await read_json(request)
+        bria_api_key = require_env("BRIA_API_TOKEN")
+        google_api_key = os.getenv("GOOGLE_API_KEY")
+        jobs = body.get("jobs")
+        if not isinstance(jobs, list) or not jobs:
+            return error_response("Please provide a non-empty list of jobs in 'jobs'.")
+        if len(jobs) > MAX_BATCH_JOBS:
+            return error_response(f"A batch can contain at most {MAX_BATCH_JOBS} jobs.")
+        for job in jobs:
+            if not isinstance(job, dict) or not job.get("prompt"):
+                return error_response("Every job needs a 'prompt'.")
+            job.setdefault("asset_type", "Instagram Post (1080x1080)")
+            job["num_results"] = int(job.get("num_results", 1))
+            if job["asset_type"] not in ASSET_CONFIGS:
+                return error_response(f"asset_type must be one of {list(ASSET_CONFIGS)}.")
+            if job["num_results"] not in NUM_RESULTS:
+                return error_response(f"num_results must be one of {NUM_RESULTS}.")
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except (TypeError, ValueError) as e:
+        return error_response(str(e))
+
+    try:
+        await run_in_threadpool(check_quota, request.user.username, "brand_kit", sum(job["num_results"] for job in jobs))
+    except QuotaExceededError as e:
+        return quota_response(e)
+
+    # All jobs share one event loop; the semaphore bounds in-flight backend calls
+    llm = get_llm(google_api_key, max_tokens=200, tool="caption") if google_api_key else None
+    outcomes = await agenerate_brand_kit_batch(
+        bria_api_key, jobs, llm=llm, concurrency=BATCH_CONCURRENCY, username=request.user.username
+    )
+
+    results = []
+    for job, outcome in zip(jobs, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"asset_type": job["asset_type"], "error": backend_error(outcome, "generating asset")})
+            continue
+        data, images, caption = outcome
+        name = ASSET_CONFIGS[job["asset_type"]]["name"].capitalize()
+        urls, image_ids = await run_in_threadpool(
+            image_results, images, "kit", [f"{name} {i + 1}: {job['prompt']}" for i in range(len(images))],
+            request.user.username
+        )
+        await run_in_threadpool(
+            record_generation, "kit", job["prompt"], output=caption,
+            params={"asset_type": job["asset_type"], "num_results": job["num_results"]},
+            image_ids=image_ids, username=request.user.username
+        )
+        results.append({"asset_type": job["asset_type"], "images": urls, "caption": caption})
+    return JSONResponse({"results": results})
+
+@requires("authenticated", status_code=401)
+async def brand_story(request):
+    try:
+        body = await read_json(request)
+        api_key = require_env("GOOGLE_API_KEY")
+        prompt = body.get("prompt")
+        story_length = body.get("story_length", "Medium (~500 words)")
+        num_candidates = int(body.get("candidates", 1))
+        if not prompt:
+            return error_response("Please provide a brand story prompt in 'prompt'.")
+        if story_length not in LENGTH_TO_TOKENS:
+            return error_response(f"story_length must be one of {list(LENGTH_TO_TOKENS)}.")
+        if not 1 <= num_candidates <= MAX_CANDIDATES:
+            return error_response(f"candidates must be between 1 and {MAX_CANDIDATES}.")
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except (TypeError, ValueError) as e:
+        return error_response(str(e))
+
+    llm = get_llm(api_key, max_tokens=1000, tool="brand_story")
+    word_count = LENGTH_TO_TOKENS[story_length] // 3
+    usage = (request.user.username, "brand_story")
+    params = {"length": story_length, "candidates": num_candidates}
+
+    def record(story):
+        record_generation("brand_story", prompt, output=story, params=params, username=request.user.username)
+
+    if body.get("stream"):
+        # The status is sent before the first chunk, so the quota is checked up front
+        try:
+            await run_in_threadpool(check_quota, *usage)
+        except QuotaExceededError as e:
+            return quota_response(e)
+        return StreamingResponse(metered_stream(astream_story(llm, prompt, word_count), usage, record), media_type="text/plain; charset=utf-8")
+    if num_candidates > 1:
+        candidates, error = await call_backend(
+            agenerate_story_candidates(llm, prompt, word_count, num_candidates), action="generating story", usage=usage,
+            admission="brand_story"
+        )
+        if error:
+            return error
+        await run_in_threadpool(record, candidates[0]["story"])
+        return JSONResponse({"story": candidates[0]["story"], "candidates": candidates})
+    story, error = await call_backend(
+        agenerate_story(llm, prompt, word_count), action="generating story", usage=usage, admission="brand_story"
+    )
+    if error:
+        return error
+    await run_in_threadpool(record, story)
+    return JSONResponse({"story": story})
+
+@requires("authenticated", status_code=401)
+async def refine_brand_story(request):
+    try:
+        body = await read_json(request)
+        api_key = require_env("GOOGLE_API_KEY")
+        story = body.get("story")
+        if not story:
+            return error_response("Please provide the story to refine in 'story'.")
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except ValueError as e:
+        return error_response(str(e))
+
+    llm = get_llm(api_key, max_tokens=1000, tool="brand_story")
+    story, error = await call_backend(
+        arefine_story(llm, story, body.get("feedback")), action="refining story",
+        usage=(request.user.username, "brand_story"),
+        admission="brand_story"
+    )
+    if error:
+        return error
+    await run_in_threadpool(
+        record_generation, "brand_story_refine", body.get("feedback") or "", output=story,
+        params={"mode": "Full rewrite"}, username=request.user.username
+    )
+    return JSONResponse({"story": story})
+
+@requires("authenticated", status_code=401)
+async def style_guide(request):
+    try:
+        body = await read_json(request)
+        api_key = require_env("GOOGLE_API_KEY")
+        brand_name = body.get("brand_name")
+        brand_description = body.get("brand_description")
+        page_size = body.get("page_size", "Letter (8.5x11)")
+        include_sections = body.get("include_sections", ["Brand Overview", "Color Palette", "Typography", "Logo Usage"])
+        if not brand_name or not brand_description:
+            return error_response("Please provide 'brand_name' and 'brand_description'.")
+        # Logos are referenced by the asset URLs or ids returned from /api/logos
+        logo_ids = [os.path.basename(str(logo)) for logo in body.get("logos", [])[:MAX_PDF_LOGOS]]
+        logo_paths = [downloads.blob_path(logo_id) for logo_id in logo_ids]
+    except LookupError as e:
+        return error_response(str(e), 503)
+    except ValueError as e:
+        return error_response(str(e))
+    except KeyError:
+        return error_response("'logos' must list asset URLs returned by this API.")
+    if not await run_in_threadpool(downloads.owns_blobs, logo_ids, request.user.username):
+        return error_response("A logo asset was not found or has expired.", 404)
+
+    llm = get_llm(api_key, max_tokens=2000, tool="style_guide")
+    result, error = await call_backend(
+        agenerate_style_guide(
+            llm,
+            brand_name,
+            brand_description,
+            body.get("primary_colors", ""),
+            body.get("secondary_colors", ""),
+            body.get("fonts", "")
+        ),
+        action="generating style guide",
+        usage=(request.user.username, "style_guide"),
+        admission="style_guide"
+    )
+    if error:
+        return error
+    await run_in_threadpool(
+        record_generation, "style_guide", f"{brand_name}: {brand_description}", output=style_guide_text(result),
+        params={
+            "primary_colors": body.get("primary_colors", ""),
+            "secondary_colors": body.get("secondary_colors", ""),
+            "fonts": body.get("fonts", "")
+        },
+        username=request.user.username
+    )
+    fonts = [font.strip() for font in body.get("fonts", "").split(",") if font.strip()]
+
+    def build_pdf():
+        logos = []
+        for path in logo_paths:
+            with Image.open(path) as logo:
+                logos.append(logo.copy())
+        blob_id = downloads.store_file(lambda output: generate_style_guide_pdf(
+            output, brand_name, result, page_size, include_sections, date.today().isoformat(), logos=logos, fonts=fonts
+        ), ".pdf")
+        downloads.grant_blob(blob_id, request.user.username)
+        return blob_id
+
+    try:
+        blob_id = await run_in_threadpool(build_pdf)
+    except FileNotFoundError:
+        return error_response("A logo asset has expired. Please generate it again.", 404)
+    file_name = f"{brand_name.replace(' ', '_')}_style_guide.pdf"
+    return FileResponse(downloads.blob_path(blob_id), media_type="application/pdf", filename=file_name)
+
+def negotiate_format(accept):
+    """Pick the smallest image format the client's Accept header allows"""
+    for output_format, mime_type in (("avif", "image/avif"), ("webp", "image/webp")):
+        if mime_type in accept:
+            return output_format
+    return "png"
+
+@requires("authenticated", status_code=401)
+async def asset(request):
+    # Served from disk in chunks, so stored assets never sit in server memory
+    asset_id = request.path_params["asset_id"]
+    output_format = request.query_params.get("format", "png")
+    headers = {}
+    try:
+        path = downloads.blob_path(asset_id)
+        if output_format == "auto":
+            output_format = negotiate_format(request.headers.get("Accept", ""))
+            headers["Vary"] = "Accept"
+        if output_format not in OUTPUT_FORMATS:
+            return error_response(f"format must be 'auto' or one of {list(OUTPUT_FORMATS)}.")
+        quality = request.query_params.get("quality")
+        quality = int(quality) if quality is not None else None
+    except KeyError:
+        return error_response("Asset not found or expired.", 404)
+    except ValueError:
+        return error_response("quality must be an integer between 1 and 100.")
+    # Assets of other users are reported as missing rather than forbidden, so ids can't be probed
+    if not os.path.exists(path) or not await run_in_threadpool(downloads.owns_blobs, [asset_id], request.user.username):
+        return error_response("Asset not found or expired.", 404)
+    if output_format != "png":
+        if not asset_id.endswith(".png"):
+            return error_response("Only image assets can be converted.")
+        asset_id = await run_in_threadpool(downloads.image_variant, asset_id, output_format, quality)
+        path = downloads.blob_path(asset_id)
+    return FileResponse(path, media_type=downloads.blob_mime_type(asset_id), headers=headers)
+
+@requires("authenticated", status_code=401)
+async def export(request):
+    """Stream a zip of previously generated assets, given their /api/assets URLs or ids"""
+    try:
+        body = await read_json(request)
+        assets = body.get("assets")
+        if not isinstance(assets, list) or not assets:
+            return error_response("Please provide a non-empty 'assets' list.")
+        if len(assets) > MAX_EXPORT_ASSETS:
+            return error_response(f"At most {MAX_EXPORT_ASSETS} assets can be exported at once.")
+        asset_ids = [str(asset).rstrip("/").rsplit("/", 1)[-1] for asset in assets]
+        entries = blob_entries(asset_ids)
+    except KeyError:
+        return error_response("Unknown asset in 'assets'.", 404)
+    except ValueError as e:
+        return error_response(str(e))
+    if not await run_in_threadpool(downloads.owns_blobs, asset_ids, request.user.username):
+        return error_response("Unknown asset in 'assets'.", 404)
+    missing = [entry["label"] for entry in entries if not os.path.exists(entry["path"])]
+    if missing:
+        return error_response(f"Asset not found or expired: {missing[0]}", 404)
+    # iter_zip does blocking file reads; Starlette iterates sync generators in a threadpool
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="brandforge_assets.zip"'}
+    )
+
+@requires("authenticated", status_code=401)
+async def create_api_session(request):
+    """Exchange credentials for a session token to send as 'Authorization: Bearer <token>'"""
+    token, expires_at = await run_in_threadpool(create_session, request.user.username)
+    return JSONResponse({"token": token, "expires_at": expires_at})
+
+@requires("authenticated", status_code=401)
+async def delete_api_session(request):
+    scheme, _, credentials = request.headers["Authorization"].partition(" ")
+    if scheme.lower() == "bearer":
+        await run_in_threadpool(revoke_session, credentials)
+    return JSONResponse({"status": "ok"})
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+async def ready(request):
+    """Readiness check: 503 until this process has warmed up its database, clients and connections"""
+    report = readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+routes = [
+    Route("/health", health),
+    Route("/ready", ready),
+    Route("/api/sessions", create_api_session, methods=["POST"]),
+    Route("/api/sessions", delete_api_session, methods=["DELETE"]),
+    Route("/api/logos", logos, methods=["POST"]),
+    Route("/api/edits", edits, methods=["POST"]),
+    Route("/api/brand-kit", brand_kit, methods=["POST"]),
+    Route("/api/brand-kit/batch", brand_kit_batch, methods=["POST"]),
+    Route("/api/brand-story", brand_story, methods=["POST"]),
+    Route("/api/brand-story/refine", refine_brand_story, methods=["POST"]),
+    Route("/api/style-guide", style_guide, methods=["POST"]),
+    Route("/api/assets/{asset_id}", asset),
+    Route("/api/export", export, methods=["POST"]),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    init_db()
+    # Uvicorn accepts traffic only once startup finishes, so the first request finds everything warm
+    await aprewarm()
+    yield
+    await bria_client.close_async_client()
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(AuthenticationMiddleware, backend=BasicAuthBackend(), on_error=on_auth_error)],
+    lifespan=lifespan
+)
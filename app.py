@@ -1,19 +1,33 @@
 import streamlit as st
 import sqlite3
+import os
 import bcrypt
 from services.logo_generator import show_logo_generator
 from services.image_editor import show_image_editor
 from services.brand_story_generator import show_brand_story_generator
 from services.brand_kit_generator import show_brand_kit_generator
+from services.brand_style_guide import show_brand_style_guide
+from services.history import search_history
+from services.image_index import get_indexed_images
+from services.export import show_session_export
+from services.sessions import COOKIE_NAME, SESSION_TTL, create_session, validate_session, revoke_session
+from services.prewarm import start_prewarm
+
+_db_ready = False
 
 # Database setup
 def init_db():
+    # Streamlit reruns main() on every interaction; the table only needs creating once per process
+    global _db_ready
+    if _db_ready:
+        return
     conn = sqlite3.connect('brandforge.db')
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS users
                  (username TEXT PRIMARY KEY, password TEXT)''')
     conn.commit()
     conn.close()
+    _db_ready = True
 
 # User authentication
 def register_user(username, password):
@@ -39,6 +53,35 @@ def login_user(username, password):
         return True
     return False
 
+# Streamlit can read cookies but not set them, so the browser sets the session cookie itself
+def set_session_cookie(token, max_age):
+    st.iframe(
+        f"""<script>
+        parent.document.cookie = "{COOKIE_NAME}={token}; Max-Age={max_age}; Path=/; SameSite=Strict"
+            + (parent.location.protocol === "https:" ? "; Secure" : "");
+        </script>""",
+        height="content"
+    )
+
+# Sidebar search over the user's past generations; typing reruns only this fragment
+@st.fragment
+def show_history_search():
+    query = st.text_input("Search History", key="history_search", placeholder="e.g. coffee logo")
+    if not query:
+        return
+    results = search_history(query, username=st.session_state.username)
+    if not results:
+        st.caption("No matching generations.")
+        return
+    for result in results:
+        with st.expander(f"{result['tool'].replace('_', ' ').title()}: {result['prompt'][:40]}"):
+            st.markdown(result["snippet"])
+            if result["output"]:
+                st.text(result["output"])
+            for record in get_indexed_images(result["metadata"].get("image_ids", [])):
+                if os.path.exists(record["path"]):
+                    st.image(record["path"], caption=record["label"], use_column_width=True)
+
 def main():
     # Custom CSS for navbar and app styling
     st.markdown(
@@ -67,8 +110,19 @@ def main():
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
         st.session_state.username = ""
+    if "session_cookie" in st.session_state:
+        set_session_cookie(*st.session_state.pop("session_cookie"))
 
     if not st.session_state.logged_in:
+        # A valid session cookie from an earlier login skips the form and bcrypt
+        token = st.context.cookies.get(COOKIE_NAME)
+        username = validate_session(token)
+        if username:
+            st.session_state.logged_in = True
+            st.session_state.username = username
+            st.session_state.session_token = token
+            st.rerun()
+
         choice = st.selectbox("Select Action", ["Login", "Signup"], key="auth_action")
         
         username = st.text_input("Username", key="username_input")
@@ -90,6 +144,8 @@ def main():
                     if login_user(username, password):
                         st.session_state.logged_in = True
                         st.session_state.username = username
+                        st.session_state.session_token, _ = create_session(username)
+                        st.session_state.session_cookie = (st.session_state.session_token, SESSION_TTL)
                         st.rerun()
                     else:
                         st.error("Invalid username or password.")
@@ -101,12 +157,18 @@ def main():
         st.sidebar.markdown('<div class="navbar">ImageProAI Navigation</div>', unsafe_allow_html=True)
         page = st.sidebar.selectbox(
             "Select a Tool",
-            ["Logo Generator", "Image Editor", "Brand Story Generator", "Brand Kit Generator"],
+            ["Logo Generator", "Image Editor", "Brand Story Generator", "Brand Kit Generator", "Brand Style Guide"],
             key="navbar_select"
         )
         st.sidebar.write(f"Logged in as: {st.session_state.username}")
+        with st.sidebar:
+            show_history_search()
+            st.markdown("**Export Session**")
+            show_session_export()
         
         if st.sidebar.button("Logout", key="logout_button"):
+            revoke_session(st.session_state.pop("session_token", None))
+            st.session_state.session_cookie = ("", 0)
             st.session_state.logged_in = False
             st.session_state.username = ""
             st.rerun()
@@ -120,6 +182,11 @@ def main():
             show_brand_story_generator()
         elif page == "Brand Kit Generator":
             show_brand_kit_generator()
+        elif page == "Brand Style Guide":
+            show_brand_style_guide()
 
 if __name__ == "__main__":
+    # Warms the database, LLM clients, PDF styles and Bria connections in the background,
+    # once per server process, so the first page renders without waiting for it
+    start_prewarm()
     main()
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Benchmark palette extraction on a synthetic 1024x1024 logo.
+
+Run from the repository root: python benchmarks/bench_palette.py
+"""
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.palette import extract_palette
+
+TARGET_MS = 100
+RUNS = 20
+
+def make_logo(size=1024, transparent=True):
+    """Draw a flat multi-color logo with noise, on a transparent or white canvas"""
+    background = (0, 0, 0, 0) if transparent else (255, 255, 255, 255)
+    image = Image.new("RGBA", (size, size), background)
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((100, 100, 700, 700), fill=(30, 90, 200, 255))
+    draw.rectangle((400, 400, 900, 900), fill=(240, 180, 20, 255))
+    draw.polygon([(512, 60), (960, 500), (600, 980)], fill=(200, 40, 60, 255))
+    draw.text((200, 850), "BRANDFORGE", fill=(20, 20, 20, 255))
+    array = np.asarray(image).astype(np.int16)
+    noise = np.random.default_rng(0).integers(-6, 7, size=array.shape[:2] + (3,))
+    array[..., :3] = np.clip(array[..., :3] + noise, 0, 255)
+    return Image.fromarray(array.astype(np.uint8), "RGBA")
+
+def bench(label, image):
+    extract_palette(image)  # warm up
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        palette = extract_palette(image)
+        timings.append((time.perf_counter() - start) * 1000)
+    median = float(np.median(timings))
+    status = "OK" if median < TARGET_MS else "SLOW"
+    print(f"{label:<28} median {median:6.1f} ms  max {max(timings):6.1f} ms  [{status}]")
+    print(f"{'':<28} {', '.join(f'{h} {s:.0%}' for h, s in palette)}")
+    return median
+
+if __name__ == "__main__":
+    results = [
+        bench("1024x1024 transparent", make_logo(transparent=True)),
+        bench("1024x1024 white background", make_logo(transparent=False).convert("RGB")),
+    ]
+    sys.exit(0 if max(results) < TARGET_MS else 1)
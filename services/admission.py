@@ -0,0 +1,192 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import contextlib
+from collections import deque
+import streamlit as st
+from services.usage import mark_admitted
+
+# Load shedding can be switched off, e.g. for local development
+ADMISSION_ENABLED = os.getenv("BRANDFORGE_ADMISSION", "1") == "1"
+# Concurrent generations and waiting requests per tool. Image tools hold decoded
+# PIL images while they run, so they get fewer slots than the text tools.
+# Override with e.g. BRANDFORGE_BRAND_KIT_CONCURRENCY and BRANDFORGE_BRAND_KIT_QUEUE.
+TOOL_LIMITS = {
+    "logo": (4, 16),
+    "edit": (4, 16),
+    "brand_kit": (3, 12),
+    "brand_story": (8, 32),
+    "style_guide": (4, 16)
+}
+# Admitted requests that wait longer than this are turned away
+MAX_WAIT_SECONDS = 120
+POSITION_POLL_SECONDS = 1.0
+# Assumed duration of a generation until one has been measured
+INITIAL_ESTIMATE_SECONDS = 15.0
+
+class AdmissionRejectedError(Exception):
+    """Raised when a tool's queue is full or a queued request waited too long"""
+
+    def __init__(self, tool, retry_after):
+        self.tool = tool
+        self.retry_after = retry_after
+        super().__init__(
+            f"The {tool.replace('_', ' ')} tool is busy right now. "
+            f"Please try again in about {retry_after} seconds."
+        )
+
+class _Ticket:
+    def __init__(self, wake):
+        self.wake = wake
+        self.admitted = False
+
+class AdmissionController:
+    """Admit at most `concurrency` requests for a tool and queue up to `queue_size` more.
+
+    Waiting requests are admitted in arrival order; a request that would
+    overflow the queue is rejected straight away with a retry estimate, so
+    the requests already admitted keep their latency.
+    """
+
+    def __init__(self, tool, concurrency, queue_size):
+        self.tool = tool
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.active = 0
+        self._waiting = deque()
+        self._avg_seconds = INITIAL_ESTIMATE_SECONDS
+        self._lock = threading.Lock()
+
+    def _retry_after(self):
+        # Time for the queue ahead to drain through the available slots
+        return max(math.ceil(self._avg_seconds * (len(self._waiting) + 1) / self.concurrency), 1)
+
+    def _enqueue(self, wake):
+        with self._lock:
+            if self.active < self.concurrency and not self._waiting:
+                self.active += 1
+                return None
+            if len(self._waiting) >= self.queue_size:
+                raise AdmissionRejectedError(self.tool, self._retry_after())
+            ticket = _Ticket(wake)
+            self._waiting.append(ticket)
+            return ticket
+
+    def _release_slot(self):
+        # Hand the slot straight to the next waiting request, if any
+        if self._waiting:
+            ticket = self._waiting.popleft()
+            ticket.admitted = True
+            ticket.wake()
+        else:
+            self.active -= 1
+
+    def _release(self, elapsed):
+        with self._lock:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._release_slot()
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if ticket.admitted:
+                self._release_slot()
+            else:
+                self._waiting.remove(ticket)
+
+    def position(self, ticket):
+        """1-based place of a waiting request in the queue, or 0 once it is admitted"""
+        with self._lock:
+            return 0 if ticket.admitted else self._waiting.index(ticket) + 1
+
+    def _timed_out(self, ticket):
+        self._abandon(ticket)
+        with self._lock:
+            return AdmissionRejectedError(self.tool, self._retry_after())
+
+    @contextlib.contextmanager
+    def admit(self, on_wait=None, timeout=MAX_WAIT_SECONDS):
+        """Hold a slot for the block; on_wait(position) is called while queued"""
+        event = threading.Event()
+        ticket = self._enqueue(event.set)
+        if ticket is not None:
+            deadline = time.monotonic() + timeout
+            last_position = None
+            try:
+                while True:
+                    position = self.position(ticket)
+                    if position and on_wait is not None and position != last_position:
+                        on_wait(position)
+                        last_position = position
+                    if event.wait(POSITION_POLL_SECONDS):
+                        break
+                    if time.monotonic() >= deadline:
+                        raise self._timed_out(ticket)
+            except AdmissionRejectedError:
+                raise
+            except BaseException:
+                self._abandon(ticket)
+                raise
+        mark_admitted()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(self, timeout=MAX_WAIT_SECONDS):
+        """Async variant of admit for event-loop callers"""
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(None))
+
+        ticket = self._enqueue(wake)
+        if ticket is not None:
+            try:
+                await asyncio.wait_for(admitted, timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out(ticket)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+        mark_admitted()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+def _limits(tool, concurrency, queue_size):
+    prefix = f"BRANDFORGE_{tool.upper()}"
+    return (
+        int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        int(os.getenv(f"{prefix}_QUEUE", queue_size))
+    )
+
+CONTROLLERS = {tool: AdmissionController(tool, *_limits(tool, *limits)) for tool, limits in TOOL_LIMITS.items()}
+
+def admit(tool, on_wait=None):
+    """Hold one of the tool's generation slots for the block, queueing if they are all taken"""
+    if not ADMISSION_ENABLED:
+        return contextlib.nullcontext()
+    return CONTROLLERS[tool].admit(on_wait)
+
+def aadmit(tool):
+    """Async variant of admit"""
+    if not ADMISSION_ENABLED:
+        return contextlib.nullcontext()
+    return CONTROLLERS[tool].aadmit()
+
+@contextlib.contextmanager
+def queued(tool):
+    """admit for tool pages, showing the user's place in the queue while they wait"""
+    notice = st.empty()
+    with admit(tool, lambda position: notice.info(
+        f"Many requests are running right now. You are number {position} in the queue."
+    )):
+        notice.empty()
+        yield
@@ -0,0 +1,13 @@
+import asyncio
+
+DEFAULT_CONCURRENCY = 8
+
+async def gather_bounded(aws, limit=DEFAULT_CONCURRENCY, return_exceptions=False):
+    """Await coroutines concurrently with at most `limit` running at once, preserving order"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=return_exceptions)
@@ -1,11 +1,283 @@
 import streamlit as st
 import requests
-import io
-from PIL import Image
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
+from services import bria_client
+from services.gallery import add_to_gallery
+from services.downloads import store_image, store_blob, blob_path, download_button, show_format_options, selected_format, image_download_button
+from services.history import record_generation, find_previous_images, request_key
+from services.single_flight import single_flight, asingle_flight, encode_image_result, decode_image_result
+from services.llm import get_llm
+from services.async_utils import gather_bounded, DEFAULT_CONCURRENCY
+from services.usage import metered, ametered, mark_shared, QuotaExceededError
+from services.circuit_breaker import BREAKERS, CircuitOpenError, show_backend_status
+from services.admission import queued, aadmit, AdmissionRejectedError
+
+# Resolution and naming for each supported asset type
+ASSET_CONFIGS = {
+    "Instagram Post (1080x1080)": {"width": 1080, "height": 1080, "name": "post"},
+    "Instagram Story (1080x1920)": {"width": 1080, "height": 1920, "name": "story"},
+    "Banner (1200x628)": {"width": 1200, "height": 628, "name": "banner"},
+    "Profile Icon (512x512)": {"width": 512, "height": 512, "name": "icon"}
+}
+
+CAPTION_SYSTEM_PROMPT = (
+    "You are a social media content creator specializing in Instagram captions. "
+    "Generate a concise, engaging caption (50-150 words) for an Instagram post based on the provided prompt. "
+    "Ensure the caption aligns with the brand’s identity, is emotionally resonant, and includes a call-to-action. "
+    "Use hashtags relevant to the brand and theme."
+)
+
+def generate_brand_assets(api_key, prompt, asset_type, num_results):
+    """Generate brand kit images with Bria and return the raw response and fetched images.
+
+    Identical requests already in flight share one Bria call.
+    """
+    config = ASSET_CONFIGS[asset_type]
+
+    def call():
+        data = bria_client.text_to_image(
+            api_key,
+            f"Professional {config['name']} for social media: {prompt}",
+            num_results,
+            config["width"],
+            config["height"]
+        )
+        return data, bria_client.load_images(bria_client.fetch_result_images(data))
+
+    key = request_key("kit", prompt, {"asset_type": asset_type, "num_results": num_results})
+    result, shared = single_flight(key, call, encode_image_result, decode_image_result)
+    if shared:
+        mark_shared()
+    return result
+
+def _caption_chain(llm, prompt):
+    caption_prompt = ChatPromptTemplate.from_messages([
+        ("system", CAPTION_SYSTEM_PROMPT),
+        ("human", prompt)
+    ])
+    return caption_prompt | llm
+
+def generate_caption(llm, prompt):
+    """Generate an Instagram caption for the given brand asset prompt"""
+    with BREAKERS["gemini"].call():
+        return _caption_chain(llm, prompt).invoke({"prompt": prompt}).content
+
+async def agenerate_brand_assets(api_key, prompt, asset_type, num_results):
+    """Async variant of generate_brand_assets for event-loop callers"""
+    config = ASSET_CONFIGS[asset_type]
+
+    async def call():
+        data = await bria_client.atext_to_image(
+            api_key,
+            f"Professional {config['name']} for social media: {prompt}",
+            num_results,
+            config["width"],
+            config["height"]
+        )
+        return data, bria_client.load_images(await bria_client.afetch_result_images(data))
+
+    key = request_key("kit", prompt, {"asset_type": asset_type, "num_results": num_results})
+    result, shared = await asingle_flight(key, call, encode_image_result, decode_image_result)
+    if shared:
+        mark_shared()
+    return result
+
+async def agenerate_caption(llm, prompt):
+    """Async variant of generate_caption"""
+    with BREAKERS["gemini"].call():
+        response = await _caption_chain(llm, prompt).ainvoke({"prompt": prompt})
+    return response.content
+
+async def agenerate_brand_kit_batch(api_key, jobs, llm=None, concurrency=DEFAULT_CONCURRENCY, username=""):
+    """Generate many kit assets on one event loop with bounded concurrency.
+
+    Each job is a dict with "prompt", "asset_type" and optional "num_results".
+    Instagram posts also get a caption when an llm is given. Every call is
+    metered against `username`'s quota and image generations wait for the
+    brand kit admission slots shared with other requests. Returns one
+    (data, images, caption) tuple or exception per job, in job order.
+    """
+    async def run(job):
+        asset_type = job["asset_type"]
+        num_results = job.get("num_results", 1)
+        async with ametered(username, "brand_kit", num_results, ASSET_CONFIGS[asset_type]["width"]):
+            async with aadmit("brand_kit"):
+                data, images = await agenerate_brand_assets(api_key, job["prompt"], asset_type, num_results)
+        caption = None
+        if llm is not None and asset_type == "Instagram Post (1080x1080)":
+            async with ametered(username, "caption"):
+                caption = await agenerate_caption(llm, job["prompt"])
+        return data, images, caption
+
+    return await gather_bounded((run(job) for job in jobs), limit=concurrency, return_exceptions=True)
+
+@st.fragment
+def show_kit_options():
+    """Asset options; changing them reruns only this fragment"""
+    with st.container():
+        st.markdown('<div class="sub-header">Asset Options</div>', unsafe_allow_html=True)
+        st.selectbox(
+            "Number of Assets to Generate",
+            options=[1, 2],
+            index=0,
+            key="num_results_kit"
+        )
+        st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
+        st.write("More settings coming soon (e.g., styles, themes).")
+
+def run_kit_generation(bria_api_key, llm, prompt, asset_type, reuse_previous):
+    """Generate assets (and a caption for posts) and keep references to them in session state"""
+    config = ASSET_CONFIGS[asset_type]
+    num_results = st.session_state.get("num_results_kit", 1)
+    try:
+        username = st.session_state.get("username", "")
+        params = {"asset_type": asset_type, "num_results": num_results}
+        previous = find_previous_images("kit", prompt, params, username) if reuse_previous else None
+        if previous:
+            data, fetched_images = previous
+        else:
+            # Bria AI API request for image
+            with metered(username, "brand_kit", num_results, config["width"]), queued("brand_kit"):
+                data, fetched_images = generate_brand_assets(bria_api_key, prompt, asset_type, num_results)
+
+        if not ("result" in data and data["result"]):
+            st.session_state.kit_results = None
+            st.error(
+                "No assets generated. Try a more specific prompt, e.g., "
+                "'A vibrant Instagram post for MaddyTrends, women’s fashion, bold pinks, modern and empowering'."
+            )
+            return
+
+        # Generate caption for Instagram Post
+        st.session_state.brand_kit_captions = []
+        if asset_type == "Instagram Post (1080x1080)" and previous and previous[0]["output"]:
+            st.session_state.brand_kit_captions = [previous[0]["output"]] * num_results
+        elif asset_type == "Instagram Post (1080x1080)":
+            try:
+                with metered(username, "caption"):
+                    caption = generate_caption(llm, prompt)
+                st.session_state.brand_kit_captions = [caption] * num_results
+            except Exception as e:
+                st.error(f"Error generating caption: {str(e)}")
+                st.session_state.brand_kit_captions = [""] * num_results
+
+        assets = []
+        image_ids = []
+        for i, image in enumerate(fetched_images):
+            asset = {"index": i + 1, "blob_id": None, "is_duplicate": False}
+            if image is not None:
+                # Encoded once to disk for both display and download
+                asset["blob_id"] = store_image(image)
+                image_id, is_duplicate = add_to_gallery(image, "kit", f"{config['name'].capitalize()} {i+1}: {prompt}")
+                image_ids.append(image_id)
+                asset["is_duplicate"] = is_duplicate and not previous
+            assets.append(asset)
+        if not previous:
+            caption = st.session_state.brand_kit_captions[0] if st.session_state.brand_kit_captions else ""
+            record_generation("kit", prompt, output=caption, params=params,
+                              image_ids=image_ids, username=username)
+
+        st.session_state.kit_results = {
+            "data": data,
+            "asset_type": asset_type,
+            "reused": previous is not None,
+            "assets": assets
+        }
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else None
+        if status_code == 401:
+            st.error("Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/.")
+        elif status_code == 429:
+            st.error("API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan.")
+        elif status_code == 408:
+            st.error("Prompt rejected due to content moderation. Please revise your prompt to comply with Bria's ethical guidelines.")
+        else:
+            st.error(f"Error generating asset: {str(e)}")
+    except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
+def _kit_caption(results, asset):
+    captions = st.session_state.get("brand_kit_captions", [])
+    if results["asset_type"] != "Instagram Post (1080x1080)" or asset["index"] > len(captions):
+        return ""
+    return captions[asset["index"] - 1]
+
+@st.fragment
+def show_kit_downloads():
+    """Format options and download buttons; changing the format reruns only this fragment"""
+    results = st.session_state.get("kit_results")
+    if not results:
+        return
+    config = ASSET_CONFIGS[results["asset_type"]]
+    st.markdown('<div class="sub-header">Download Assets</div>', unsafe_allow_html=True)
+    show_format_options("kit_download", default="webp")
+    output_format, quality = selected_format("kit_download", default="webp")
+    for asset in results["assets"]:
+        if asset["blob_id"] is None:
+            continue
+        i = asset["index"]
+        # Download image
+        st.markdown('<div class="download-button">', unsafe_allow_html=True)
+        image_download_button(
+            f"Download {config['name'].capitalize()} {i}",
+            asset["blob_id"],
+            f"brand_{config['name']}_{i}",
+            key=f"download_kit_button_{i}",
+            output_format=output_format,
+            quality=quality
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Download caption for Instagram Post
+        caption = _kit_caption(results, asset)
+        if caption:
+            st.markdown('<div class="download-button">', unsafe_allow_html=True)
+            download_button(
+                f"Download Caption {i} as TXT",
+                store_blob(caption, ".txt"),
+                f"brand_caption_{i}.txt",
+                key=f"download_caption_button_{i}"
+            )
+            st.markdown('</div>', unsafe_allow_html=True)
+
+def show_kit_results(download_column):
+    """Show the latest assets and captions, with their downloads in download_column"""
+    results = st.session_state.get("kit_results")
+    if not results:
+        return
+    if results["reused"]:
+        st.info("Showing your earlier assets for this exact prompt. Untick 'Reuse earlier results' to generate new ones.")
+
+    # Debug: Show raw API response
+    with st.expander("Debug: View Raw API Response"):
+        st.json(results["data"])
+
+    config = ASSET_CONFIGS[results["asset_type"]]
+    for asset in results["assets"]:
+        if asset["blob_id"] is None:
+            st.error(f"No image URL found for result {asset['index']}. Please try a different prompt.")
+            continue
+        # Display image and caption (if applicable)
+        st.image(
+            blob_path(asset["blob_id"]),
+            caption=f"Generated {config['name'].capitalize()} {asset['index']} ({config['width']}x{config['height']})",
+            use_column_width=True
+        )
+        if asset["is_duplicate"]:
+            st.caption("This asset closely matches one you generated before.")
+        caption = _kit_caption(results, asset)
+        if caption:
+            st.markdown('<div class="caption-display">', unsafe_allow_html=True)
+            st.markdown(f"**Caption {asset['index']}**:\n{caption}")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    # Display download buttons in right column
+    with download_column:
+        show_kit_downloads()
 
 def show_brand_kit_generator():
     # Custom CSS for professional styling
@@ -70,6 +342,7 @@ def show_brand_kit_generator():
 
     # Main header
     st.markdown('<div class="main-header">Brand Kit Generator</div>', unsafe_allow_html=True)
+    show_backend_status("bria", "gemini")
     st.markdown(
         """
         <div class="sub-header">
@@ -101,12 +374,7 @@ def show_brand_kit_generator():
 
     # Initialize LangChain LLM for captions
     try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=google_api_key,
-            temperature=0.7,
-            max_tokens=200
-        )
+        llm = get_llm(google_api_key, max_tokens=200, tool="caption")
     except Exception as e:
         st.error(f"Failed to initialize Google Generative AI: {str(e)}")
         return
@@ -120,16 +388,7 @@ def show_brand_kit_generator():
 
     # Right column: Controls
     with col2:
-        with st.container():
-            st.markdown('<div class="sub-header">Asset Options</div>', unsafe_allow_html=True)
-            num_results = st.selectbox(
-                "Number of Assets to Generate",
-                options=[1, 2],
-                index=0,
-                key="num_results_kit"
-            )
-            st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
-            st.write("More settings coming soon (e.g., styles, themes).")
+        show_kit_options()
 
     # Left column: Form and image/caption display
     with col1:
@@ -144,6 +403,12 @@ def show_brand_kit_generator():
                 options=["Instagram Post (1080x1080)", "Instagram Story (1080x1920)", "Banner (1200x628)", "Profile Icon (512x512)"],
                 key="asset_type"
             )
+            reuse_previous = st.checkbox(
+                "Reuse earlier results for repeated prompts",
+                value=True,
+                key="reuse_previous_kit",
+                help="Show your stored assets for an identical prompt and asset type instead of calling Bria again."
+            )
             st.markdown('<div class="generate-button">', unsafe_allow_html=True)
             generate_button = st.form_submit_button("Generate Asset")
             st.markdown('</div>', unsafe_allow_html=True)
@@ -152,125 +417,7 @@ def show_brand_kit_generator():
                 if not prompt:
                     st.error("Please enter a brand asset prompt.")
                 else:
-                    # Set resolution based on asset type
-                    asset_configs = {
-                        "Instagram Post (1080x1080)": {"width": 1080, "height": 1080, "name": "post"},
-                        "Instagram Story (1080x1920)": {"width": 1080, "height": 1920, "name": "story"},
-                        "Banner (1200x628)": {"width": 1200, "height": 628, "name": "banner"},
-                        "Profile Icon (512x512)": {"width": 512, "height": 512, "name": "icon"}
-                    }
-                    config = asset_configs[asset_type]
-
-                    # Bria AI API request for image
-                    model_version = "2.3"
-                    url = f"https://engine.prod.bria-api.com/v1/text-to-image/base/{model_version}"
-                    payload = {
-                        "prompt": f"Professional {config['name']} for social media: {prompt}",
-                        "num_results": num_results,
-                        "sync": True,
-                        "height": config["height"],
-                        "width": config["width"]
-                    }
-                    headers = {
-                        "Content-Type": "application/json",
-                        "api_token": bria_api_key
-                    }
-
-                    try:
-                        response = requests.post(url, json=payload, headers=headers)
-                        response.raise_for_status()
-                        data = response.json()
-
-                        # Debug: Show raw API response
-                        with st.expander("Debug: View Raw API Response"):
-                            st.json(data)
-
-                        if "result" in data and data["result"]:
-                            # Store images and captions
-                            images = []
-                            st.session_state.brand_kit_captions = []
-                            
-                            # Generate caption for Instagram Post
-                            if asset_type == "Instagram Post (1080x1080)":
-                                caption_prompt = ChatPromptTemplate.from_messages([
-                                    ("system", (
-                                        "You are a social media content creator specializing in Instagram captions. "
-                                        "Generate a concise, engaging caption (50-150 words) for an Instagram post based on the provided prompt. "
-                                        "Ensure the caption aligns with the brand’s identity, is emotionally resonant, and includes a call-to-action. "
-                                        "Use hashtags relevant to the brand and theme."
-                                    )),
-                                    ("human", prompt)
-                                ])
-                                chain = caption_prompt | llm
-                                try:
-                                    caption_response = chain.invoke({"prompt": prompt})
-                                    st.session_state.brand_kit_captions = [caption_response.content] * num_results
-                                except Exception as e:
-                                    st.error(f"Error generating caption: {str(e)}")
-                                    st.session_state.brand_kit_captions = [""] * num_results
-
-                            # Process images
-                            for i, result in enumerate(data["result"]):
-                                if "urls" in result and result["urls"]:
-                                    # Fetch image from URL
-                                    image_url = result["urls"][0]
-                                    image_response = requests.get(image_url)
-                                    image_response.raise_for_status()
-                                    image = Image.open(io.BytesIO(image_response.content))
-                                    images.append(image)
-                                    
-                                    # Display image and caption (if applicable)
-                                    st.image(image, caption=f"Generated {config['name'].capitalize()} {i+1} ({config['width']}x{config['height']})", use_column_width=True)
-                                    if asset_type == "Instagram Post (1080x1080)" and st.session_state.brand_kit_captions[i]:
-                                        st.markdown('<div class="caption-display">', unsafe_allow_html=True)
-                                        st.markdown(f"**Caption {i+1}**:\n{st.session_state.brand_kit_captions[i]}")
-                                        st.markdown('</div>', unsafe_allow_html=True)
-                                else:
-                                    st.error(f"No image URL found for result {i+1}. Please try a different prompt.")
-
-                            # Display download buttons in right column
-                            with col2:
-                                st.markdown('<div class="sub-header">Download Assets</div>', unsafe_allow_html=True)
-                                for i, image in enumerate(images):
-                                    # Download image
-                                    img_buffer = io.BytesIO()
-                                    image.save(img_buffer, format="PNG")
-                                    img_buffer.seek(0)
-                                    st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                                    st.download_button(
-                                        label=f"Download {config['name'].capitalize()} {i+1} as PNG",
-                                        data=img_buffer,
-                                        file_name=f"brand_{config['name']}_{i+1}.png",
-                                        mime="image/png",
-                                        key=f"download_kit_button_{i+1}"
-                                    )
-                                    st.markdown('</div>', unsafe_allow_html=True)
-                                    
-                                    # Download caption for Instagram Post
-                                    if asset_type == "Instagram Post (1080x1080)" and st.session_state.brand_kit_captions[i]:
-                                        caption_buffer = io.StringIO(st.session_state.brand_kit_captions[i])
-                                        st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                                        st.download_button(
-                                            label=f"Download Caption {i+1} as TXT",
-                                            data=caption_buffer.getvalue(),
-                                            file_name=f"brand_caption_{i+1}.txt",
-                                            mime="text/plain",
-                                            key=f"download_caption_button_{i+1}"
-                                        )
-                                        st.markdown('</div>', unsafe_allow_html=True)
-                        else:
-                            st.error(
-                                "No assets generated. Try a more specific prompt, e.g., "
-                                "'A vibrant Instagram post for MaddyTrends, women’s fashion, bold pinks, modern and empowering'."
-                            )
-                    except requests.exceptions.HTTPError as e:
-                        if response.status_code == 401:
-                            st.error("Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/.")
-                        elif response.status_code == 429:
-                            st.error("API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan.")
-                        elif response.status_code == 408:
-                            st.error("Prompt rejected due to content moderation. Please revise your prompt to comply with Bria's ethical guidelines.")
-                        else:
-                            st.error(f"Error generating asset: {str(e)}")
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+                    run_kit_generation(bria_api_key, llm, prompt, asset_type, reuse_previous)
+
+        # Results persist in session state, so other widgets no longer wipe them
+        show_kit_results(col2)
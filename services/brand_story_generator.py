@@ -1,9 +1,232 @@
 import streamlit as st
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
-import io
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from services.llm import get_llm
+from services.story_history import StoryHistory
+from services.story_refinement import refine_story_targeted, summarize_usage
+from services.history import record_generation
+from services.story_ranking import rank_stories
+from services.downloads import store_blob, download_button
+from services.usage import metered, QuotaExceededError
+from services.circuit_breaker import BREAKERS, CircuitOpenError, show_backend_status
+from services.admission import queued, AdmissionRejectedError
+
+# Define prompts
+STORY_SYSTEM_PROMPT = (
+    "You are a creative storytelling assistant specializing in brand narratives. "
+    "Generate an immersive, engaging brand story based on the user's prompt, incorporating the brand's values, target audience, and desired tone. "
+    "The story should be compelling, emotionally resonant, and aligned with the brand's identity. "
+    "Structure the story with a clear beginning, middle, and end, and aim for approximately {word_count} words."
+)
+REFLECTION_SYSTEM_PROMPT = (
+    "You are a critical editor reviewing a brand story. "
+    "Analyze the provided story for strengths, weaknesses, and alignment with the brand’s values and audience. "
+    "Provide constructive feedback, identifying specific areas for improvement (e.g., emotional impact, clarity, brand consistency). "
+    "If user feedback is provided, prioritize it in your critique. "
+    "Then, suggest a revised version of the story incorporating the feedback."
+)
+
+# Token usage entries kept per session
+MAX_TOKEN_USAGE_ENTRIES = 20
+
+# Each extra candidate takes a different angle, which also keeps their prompt cache entries apart
+CANDIDATE_ANGLES = (
+    None,
+    "Tell it as the brand's origin story.",
+    "Tell it through the eyes of one customer.",
+    "Focus on the future the brand is building."
+)
+MAX_CANDIDATES = len(CANDIDATE_ANGLES)
+
+# Map story length options to approximate token counts
+LENGTH_TO_TOKENS = {
+    "Short (~300 words)": 400,
+    "Medium (~500 words)": 700,
+    "Long (~800 words)": 1000
+}
+
+def _story_chain(llm):
+    generate_prompt = ChatPromptTemplate.from_messages([
+        ("system", STORY_SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="messages")
+    ])
+    return generate_prompt | llm
+
+def generate_story(llm, prompt, word_count):
+    """Generate a brand story of roughly word_count words from the prompt"""
+    with BREAKERS["gemini"].call():
+        response = _story_chain(llm).invoke({
+            "messages": [HumanMessage(content=prompt)],
+            "word_count": word_count
+        })
+    return response.content
+
+def _candidate_inputs(prompt, word_count, num_candidates):
+    return [
+        {
+            # The angle is an instruction, so it goes in a system message and the prompt cache keys on it exactly
+            "messages": ([SystemMessage(content=angle)] if angle else []) + [HumanMessage(content=prompt)],
+            "word_count": word_count
+        }
+        for angle in CANDIDATE_ANGLES[:num_candidates]
+    ]
+
+def _successful_stories(responses):
+    stories = [response.content for response in responses if not isinstance(response, Exception)]
+    if not stories:
+        raise responses[0]
+    return stories
+
+def generate_story_candidates(llm, prompt, word_count, num_candidates):
+    """Generate up to MAX_CANDIDATES alternative stories concurrently and rank them.
+
+    Failed candidates are dropped; the call fails only if all of them do.
+    Returns the rank_stories result, best first.
+    """
+    with BREAKERS["gemini"].call():
+        responses = _story_chain(llm).batch(
+            _candidate_inputs(prompt, word_count, num_candidates),
+            config={"max_concurrency": num_candidates},
+            return_exceptions=True
+        )
+        stories = _successful_stories(responses)
+    return rank_stories(stories, prompt, word_count)
+
+def _refine_chain(llm):
+    reflection_prompt_template = ChatPromptTemplate.from_messages([
+        ("system", REFLECTION_SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="messages")
+    ])
+    return reflection_prompt_template | llm
+
+def _refine_messages(story, feedback):
+    feedback_text = feedback if feedback else "No user feedback provided."
+    # Separate messages keep the prompt cache from matching a different feedback on a similar story
+    return [
+        HumanMessage(content=f"Original story: {story}"),
+        HumanMessage(content=f"User feedback: {feedback_text}")
+    ]
+
+def refine_story(llm, story, feedback):
+    """Critique and rewrite an existing brand story using optional user feedback"""
+    with BREAKERS["gemini"].call():
+        response = _refine_chain(llm).invoke({"messages": _refine_messages(story, feedback)})
+    return response.content
+
+async def agenerate_story(llm, prompt, word_count):
+    """Async variant of generate_story"""
+    with BREAKERS["gemini"].call():
+        response = await _story_chain(llm).ainvoke({
+            "messages": [HumanMessage(content=prompt)],
+            "word_count": word_count
+        })
+    return response.content
+
+async def agenerate_story_candidates(llm, prompt, word_count, num_candidates):
+    """Async variant of generate_story_candidates"""
+    with BREAKERS["gemini"].call():
+        responses = await _story_chain(llm).abatch(
+            _candidate_inputs(prompt, word_count, num_candidates),
+            config={"max_concurrency": num_candidates},
+            return_exceptions=True
+        )
+        stories = _successful_stories(responses)
+    return rank_stories(stories, prompt, word_count)
+
+async def astream_story(llm, prompt, word_count):
+    """Yield the brand story text in chunks as Gemini produces it"""
+    with BREAKERS["gemini"].call():
+        async for chunk in _story_chain(llm).astream({
+            "messages": [HumanMessage(content=prompt)],
+            "word_count": word_count
+        }):
+            if chunk.content:
+                yield chunk.content
+
+async def arefine_story(llm, story, feedback):
+    """Async variant of refine_story"""
+    with BREAKERS["gemini"].call():
+        response = await _refine_chain(llm).ainvoke({"messages": _refine_messages(story, feedback)})
+    return response.content
+
+def record_token_usage(action, usage_metadata):
+    """Append one iteration's token usage to the session, keeping the latest entries"""
+    entry = {"action": action, **summarize_usage(usage_metadata)}
+    usage_log = st.session_state.story_token_usage
+    usage_log.append(entry)
+    del usage_log[:-MAX_TOKEN_USAGE_ENTRIES]
+
+@st.fragment
+def show_story_options():
+    """Story options; changing them reruns only this fragment"""
+    with st.container():
+        st.markdown('<div class="sub-header">Story Options</div>', unsafe_allow_html=True)
+        st.selectbox(
+            "Story Length",
+            options=["Short (~300 words)", "Medium (~500 words)", "Long (~800 words)"],
+            index=1,
+            key="story_length"
+        )
+        st.selectbox(
+            "Candidates",
+            options=range(1, MAX_CANDIDATES + 1),
+            index=0,
+            key="story_candidates",
+            help="Generate several stories at once and compare them side by side."
+        )
+        st.radio(
+            "Refinement Mode",
+            options=["Targeted paragraphs", "Full rewrite"],
+            index=0,
+            key="refine_mode",
+            help="Targeted mode sends only the paragraphs your feedback mentions, plus a short outline."
+        )
+        st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
+        st.write("More settings coming soon (e.g., tone, themes).")
+
+def select_story(story):
+    st.session_state.brand_story = story
+    st.session_state.story_history.append("Selected", story)
+
+@st.fragment
+def show_story_candidates():
+    """Ranked candidates side by side; the best one starts out as the current story"""
+    candidates = st.session_state.get("story_candidates_ranked")
+    if not candidates:
+        return
+    st.markdown('<div class="sub-header">Story Candidates</div>', unsafe_allow_html=True)
+    for i, (column, candidate) in enumerate(zip(st.columns(len(candidates)), candidates)):
+        with column:
+            st.markdown(f"**#{i + 1}** · score {candidate['score']:.2f}")
+            st.caption(
+                f"{candidate['word_count']} words · length fit {candidate['length_fit']:.0%} · "
+                f"keywords {candidate['keyword_coverage']:.0%} · reading ease {candidate['reading_ease']:.0f}"
+            )
+            if candidate["story"] == st.session_state.brand_story:
+                st.success("Current story")
+            else:
+                st.button("Use This Story", key=f"use_story_candidate_{i}", on_click=select_story, args=(candidate["story"],))
+            st.write(candidate["story"])
+
+@st.fragment
+def show_story_history():
+    """Debug: Show history, decoding only the selected version"""
+    history = st.session_state.story_history
+    if len(history):
+        with st.expander(f"Debug: View Story History ({len(history)} versions)"):
+            if st.toggle("Load story history", key="load_story_history"):
+                labels = history.labels()
+                version = st.selectbox(
+                    "Version",
+                    options=range(len(history)),
+                    index=len(history) - 1,
+                    format_func=lambda i: labels[i],
+                    key="story_history_version"
+                )
+                action, story = history.get(version)
+                st.write(f"{labels[version]}:")
+                st.write(story)
 
 def show_brand_story_generator():
     # Custom CSS for professional styling (consistent with other services)
@@ -68,6 +291,7 @@ def show_brand_story_generator():
 
     # Main header
     st.markdown('<div class="main-header">Brand Story Generator</div>', unsafe_allow_html=True)
+    show_backend_status("gemini")
     st.markdown(
         """
         <div class="sub-header">
@@ -93,12 +317,7 @@ def show_brand_story_generator():
 
     # Initialize LangChain LLM
     try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=api_key,
-            temperature=0.7,
-            max_tokens=1000
-        )
+        llm = get_llm(api_key, max_tokens=1000, tool="brand_story")
     except Exception as e:
         st.error(f"Failed to initialize Google Generative AI: {str(e)}")
         return
@@ -106,30 +325,15 @@ def show_brand_story_generator():
     # Initialize session state for story and history
     if "brand_story" not in st.session_state:
         st.session_state.brand_story = ""
-        st.session_state.story_history = []
+        st.session_state.story_history = StoryHistory()
+        st.session_state.story_token_usage = []
 
     # Create two columns: left for inputs and story, right for controls
     col1, col2 = st.columns([3, 1])
 
     # Right column: Controls
     with col2:
-        with st.container():
-            st.markdown('<div class="sub-header">Story Options</div>', unsafe_allow_html=True)
-            story_length = st.selectbox(
-                "Story Length",
-                options=["Short (~300 words)", "Medium (~500 words)", "Long (~800 words)"],
-                index=1,
-                key="story_length"
-            )
-            # Map to approximate token counts
-            length_to_tokens = {
-                "Short (~300 words)": 400,
-                "Medium (~500 words)": 700,
-                "Long (~800 words)": 1000
-            }
-            max_tokens = length_to_tokens[story_length]
-            st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
-            st.write("More settings coming soon (e.g., tone, themes).")
+        show_story_options()
 
     # Left column: Form and story display
     with col1:
@@ -155,45 +359,35 @@ def show_brand_story_generator():
                 st.markdown('</div>', unsafe_allow_html=True)
 
             if generate_button or refine_button:
+                story_length = st.session_state.get("story_length", "Medium (~500 words)")
+                # Map to approximate token counts
+                max_tokens = LENGTH_TO_TOKENS[story_length]
+                refine_mode = st.session_state.get("refine_mode", "Targeted paragraphs")
                 if not prompt:
                     st.error("Please enter a brand story prompt.")
                 else:
-                    # Define prompts
-                    system_prompt = (
-                        "You are a creative storytelling assistant specializing in brand narratives. "
-                        "Generate an immersive, engaging brand story based on the user's prompt, incorporating the brand's values, target audience, and desired tone. "
-                        "The story should be compelling, emotionally resonant, and aligned with the brand's identity. "
-                        "Structure the story with a clear beginning, middle, and end, and aim for approximately {word_count} words."
-                    )
-                    reflection_prompt = (
-                        "You are a critical editor reviewing a brand story. "
-                        "Analyze the provided story for strengths, weaknesses, and alignment with the brand’s values and audience. "
-                        "Provide constructive feedback, identifying specific areas for improvement (e.g., emotional impact, clarity, brand consistency). "
-                        "If user feedback is provided, prioritize it in your critique. "
-                        "Then, suggest a revised version of the story incorporating the feedback."
-                    )
-
-                    # Create LangChain prompt templates
-                    generate_prompt = ChatPromptTemplate.from_messages([
-                        ("system", system_prompt),
-                        MessagesPlaceholder(variable_name="messages")
-                    ])
-                    reflection_prompt_template = ChatPromptTemplate.from_messages([
-                        ("system", reflection_prompt),
-                        MessagesPlaceholder(variable_name="messages")
-                    ])
-
-                    # Prepare messages
                     if generate_button:
-                        messages = [HumanMessage(content=prompt)]
-                        chain = generate_prompt | llm
+                        num_candidates = st.session_state.get("story_candidates", 1)
                         try:
-                            response = chain.invoke({
-                                "messages": messages,
-                                "word_count": max_tokens // 3  # Approximate word count
-                            })
-                            st.session_state.brand_story = response.content
-                            st.session_state.story_history.append(("Generated", response.content))
+                            with metered(st.session_state.get("username", ""), "brand_story") as usage, queued("brand_story"):
+                                if num_candidates > 1:
+                                    candidates = generate_story_candidates(llm, prompt, max_tokens // 3, num_candidates)
+                                    story = candidates[0]["story"]
+                                else:
+                                    candidates = []
+                                    story = generate_story(llm, prompt, max_tokens // 3)  # Approximate word count
+                            action = f"Generated {len(candidates)} candidates" if candidates else "Generated"
+                            record_token_usage(action, usage["usage_metadata"])
+                            st.session_state.brand_story = story
+                            st.session_state.story_candidates_ranked = candidates
+                            st.session_state.story_history.append("Generated", story)
+                            record_generation(
+                                "brand_story", prompt, output=story,
+                                params={"length": story_length, "candidates": num_candidates},
+                                username=st.session_state.get("username", "")
+                            )
+                        except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+                            st.error(str(e))
                         except Exception as e:
                             st.error(f"Error generating story: {str(e)}")
                             return
@@ -201,15 +395,28 @@ def show_brand_story_generator():
                         if not st.session_state.brand_story:
                             st.error("No story to refine. Please generate a story first.")
                             return
-                        feedback_text = feedback if feedback else "No user feedback provided."
-                        messages = [
-                            HumanMessage(content=f"Original story: {st.session_state.brand_story}\nUser feedback: {feedback_text}")
-                        ]
-                        chain = reflection_prompt_template | llm
                         try:
-                            response = chain.invoke({"messages": messages})
-                            st.session_state.brand_story = response.content
-                            st.session_state.story_history.append(("Refined", response.content))
+                            targets = None
+                            with metered(st.session_state.get("username", ""), "brand_story") as usage, queued("brand_story"):
+                                if refine_mode == "Targeted paragraphs":
+                                    story, targets = refine_story_targeted(llm, st.session_state.brand_story, feedback)
+                                # Feedback about the whole story still needs a full rewrite
+                                if targets is None:
+                                    story = refine_story(llm, st.session_state.brand_story, feedback)
+                            if targets is None:
+                                record_token_usage("Refined", usage["usage_metadata"])
+                            else:
+                                paragraph_list = ", ".join(str(index + 1) for index in targets)
+                                record_token_usage(f"Refined paragraphs {paragraph_list}", usage["usage_metadata"])
+                            st.session_state.brand_story = story
+                            st.session_state.story_history.append("Refined", story)
+                            record_generation(
+                                "brand_story_refine", feedback or prompt, output=story,
+                                params={"mode": refine_mode},
+                                username=st.session_state.get("username", "")
+                            )
+                        except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+                            st.error(str(e))
                         except Exception as e:
                             st.error(f"Error refining story: {str(e)}")
                             return
@@ -223,19 +430,24 @@ def show_brand_story_generator():
                         # Download button in right column
                         with col2:
                             st.markdown('<div class="sub-header">Download Story</div>', unsafe_allow_html=True)
-                            story_buffer = io.StringIO(st.session_state.brand_story)
                             st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                            st.download_button(
-                                label="Download Story as TXT",
-                                data=story_buffer.getvalue(),
-                                file_name="brand_story.txt",
-                                mime="text/plain",
+                            download_button(
+                                "Download Story as TXT",
+                                store_blob(st.session_state.brand_story, ".txt"),
+                                "brand_story.txt",
                                 key="download_story_button"
                             )
                             st.markdown('</div>', unsafe_allow_html=True)
 
-                    # Debug: Show history
-                    with st.expander("Debug: View Story History"):
-                        for i, (action, story) in enumerate(st.session_state.story_history):
-                            st.write(f"{action} Story {i+1}:")
-                            st.write(story)
\ No newline at end of file
+        show_story_candidates()
+
+        # Token usage per generate/refine iteration
+        if st.session_state.story_token_usage:
+            with col2:
+                st.markdown('<div class="sub-header">Token Usage</div>', unsafe_allow_html=True)
+                last = st.session_state.story_token_usage[-1]
+                st.write(f"{last['action']}: {last['input_tokens']} in / {last['output_tokens']} out")
+                with st.expander("All iterations"):
+                    st.table(st.session_state.story_token_usage)
+
+        show_story_history()
\ No newline at end of file
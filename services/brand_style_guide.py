@@ -1,17 +1,29 @@
 import streamlit as st
 import os
-import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
-from PIL import Image
 import base64
+import json
+from operator import itemgetter
+from services.llm import get_llm
+from services.gallery import get_gallery
+from services.palette import extract_palette, split_palette
+from services.style_guide_schema import (
+    StyleGuide, SECTION_FIELDS, load_json_object, invalid_fields, repair_schema, section_text, style_guide_text
+)
+from services.history import record_generation
+from services.style_guide_pdf import MAX_PDF_LOGOS, generate_style_guide_pdf
+from services.downloads import store_blob, store_file, download_button
+from services.usage import metered, QuotaExceededError
+from services.circuit_breaker import BREAKERS, CircuitOpenError, show_backend_status
+from services.admission import queued, AdmissionRejectedError
+from services.image_ingest import open_upload, ImageRejectedError
+
+# Rounds of re-requesting only the fields that failed validation
+MAX_REPAIR_ATTEMPTS = 2
+# Rewriting a single section needs far fewer tokens than the full guide
+SECTION_MAX_TOKENS = 800
+MAX_SECTION_VERSIONS = 10
 
 def show_brand_style_guide():
     # Custom CSS for professional styling (consistent with other services)
@@ -83,6 +95,7 @@ def show_brand_style_guide():
 
     # Main header
     st.markdown('<div class="main-header">Brand Style Guide Generator</div>', unsafe_allow_html=True)
+    show_backend_status("gemini")
     st.markdown(
         """
         <div class="sub-header">
@@ -109,12 +122,7 @@ def show_brand_style_guide():
 
     # Initialize LangChain LLM
     try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=google_api_key,
-            temperature=0.7,
-            max_tokens=2000
-        )
+        llm = get_llm(google_api_key, max_tokens=2000, tool="style_guide")
     except Exception as e:
         st.error(f"Failed to initialize Google Generative AI: {str(e)}")
         return
@@ -122,30 +130,11 @@ def show_brand_style_guide():
     # Initialize session state for style guide
     if "brand_style_guide" not in st.session_state:
         st.session_state.brand_style_guide = ""
-        st.session_state.style_guide_sections = {}
+        st.session_state.style_guide = None
 
     # Create two columns: left for inputs and preview, right for controls
     col1, col2 = st.columns([3, 1])
 
-    # Right column: Controls
-    with col2:
-        with st.container():
-            st.markdown('<div class="sub-header">Style Guide Options</div>', unsafe_allow_html=True)
-            page_size = st.selectbox(
-                "Page Size",
-                options=["Letter (8.5x11)", "A4 (210x297mm)"],
-                index=0,
-                key="page_size"
-            )
-            include_sections = st.multiselect(
-                "Include Sections",
-                options=["Brand Overview", "Color Palette", "Typography", "Logo Usage", "Imagery Guidelines", "Voice & Tone", "Applications"],
-                default=["Brand Overview", "Color Palette", "Typography", "Logo Usage"],
-                key="include_sections"
-            )
-            st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
-            st.write("More settings coming soon (e.g., custom templates).")
-
     # Left column: Form and style guide display
     with col1:
         with st.form("brand_style_guide_form"):
@@ -182,205 +171,372 @@ def show_brand_style_guide():
                 if not brand_name or not brand_description:
                     st.error("Please enter a brand name and description.")
                 else:
-                    # Prepare the prompt for style guide generation
-                    style_guide_prompt = f"""
-                    Create a comprehensive brand style guide for {brand_name}.
-                    
-                    Brand Description: {brand_description}
-                    
-                    Primary Colors: {primary_colors if primary_colors else 'Not specified'}
-                    Secondary Colors: {secondary_colors if secondary_colors else 'Not specified'}
-                    Fonts: {fonts if fonts else 'Not specified'}
-                    
-                    Please generate the following sections in a structured format:
-                    
-                    1. BRAND OVERVIEW
-                    - Brand mission and vision
-                    - Target audience
-                    - Brand personality and values
-                    
-                    2. COLOR PALETTE
-                    - Primary colors with hex codes and usage guidelines
-                    - Secondary colors with hex codes and usage guidelines
-                    - Color combinations and accessibility considerations
-                    
-                    3. TYPOGRAPHY
-                    - Primary font family and usage
-                    - Secondary font family and usage
-                    - Font hierarchy and sizing guidelines
-                    
-                    4. LOGO USAGE
-                    - Logo variations and clear space requirements
-                    - Minimum size requirements
-                    - Logo placement guidelines
-                    - What not to do with the logo
-                    
-                    5. IMAGERY GUIDELINES
-                    - Photography style and aesthetic
-                    - Icon style and usage
-                    - Graphic elements and patterns
-                    
-                    6. VOICE & TONE
-                    - Brand voice characteristics
-                    - Tone variations for different contexts
-                    - Writing style guidelines
-                    
-                    7. APPLICATIONS
-                    - Digital applications (website, social media)
-                    - Print applications (business cards, brochures)
-                    - Environmental applications (signage, packaging)
-                    
-                    Format the response with clear section headers and detailed guidelines for each section.
-                    """
-
                     # Generate style guide content
                     try:
-                        response = llm.invoke([HumanMessage(content=style_guide_prompt)])
-                        st.session_state.brand_style_guide = response.content
-                        
-                        # Parse sections for PDF generation
-                        sections = parse_style_guide_sections(response.content)
-                        st.session_state.style_guide_sections = sections
-                        
-                        # Display preview
-                        st.markdown('<div class="style-guide-display">', unsafe_allow_html=True)
-                        st.markdown(f"**Style Guide Preview**:\n{st.session_state.brand_style_guide}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                        # Generate and display download button
-                        with col2:
-                            st.markdown('<div class="sub-header">Download Style Guide</div>', unsafe_allow_html=True)
-                            
-                            # Generate PDF
-                            pdf_buffer = generate_style_guide_pdf(
-                                brand_name, 
-                                st.session_state.style_guide_sections, 
-                                page_size,
-                                include_sections
+                        with metered(st.session_state.get("username", ""), "style_guide"), queued("style_guide"):
+                            guide = generate_style_guide(
+                                llm, brand_name, brand_description, primary_colors, secondary_colors, fonts
                             )
-                            
-                            st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                            st.download_button(
-                                label="Download Style Guide as PDF",
-                                data=pdf_buffer.getvalue(),
-                                file_name=f"{brand_name.replace(' ', '_')}_style_guide.pdf",
-                                mime="application/pdf",
-                                key="download_style_guide_button"
-                            )
-                            st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            # Download text version
-                            text_buffer = io.StringIO(str(st.session_state.brand_style_guide))
-                            st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                            st.download_button(
-                                label="Download as TXT",
-                                data=text_buffer.getvalue(),
-                                file_name=f"{brand_name.replace(' ', '_')}_style_guide.txt",
-                                mime="text/plain",
-                                key="download_text_button"
-                            )
-                            st.markdown('</div>', unsafe_allow_html=True)
-                            
+                        content = style_guide_text(guide)
+                        set_style_guide(guide)
+                        record_generation(
+                            "style_guide", f"{brand_name}: {brand_description}", output=content,
+                            params={"primary_colors": primary_colors, "secondary_colors": secondary_colors, "fonts": fonts},
+                            username=st.session_state.get("username", "")
+                        )
+                        st.session_state.style_guide_sections = {
+                            section: [{"version": 1, "fields": guide.model_dump(include=set(fields))}]
+                            for section, fields in SECTION_FIELDS.items()
+                        }
+                        st.session_state.style_guide_brand_name = brand_name
+                        st.session_state.style_guide_brand_description = brand_description
+                        st.session_state.style_guide_fonts = [font.strip() for font in fonts.split(",") if font.strip()]
+                        # Files rendered for the previous guide are stale now
+                        st.session_state.style_guide_pdfs = {}
+                    except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+                        st.error(str(e))
                     except Exception as e:
                         st.error(f"Error generating style guide: {str(e)}")
                         return
 
-def parse_style_guide_sections(content):
-    """Parse the generated content into sections for PDF generation"""
-    sections = {}
-    current_section = None
-    current_content = []
+        # Display preview
+        if st.session_state.brand_style_guide:
+            st.markdown('<div class="style-guide-display">', unsafe_allow_html=True)
+            st.markdown(f"**Style Guide Preview**:\n{st.session_state.brand_style_guide}")
+            st.markdown('</div>', unsafe_allow_html=True)
+            show_section_editor(google_api_key)
+
+    # Right column: Controls, filled after the form so they reflect a guide generated in this run
+    with col2:
+        show_style_guide_export()
+        show_logo_palette_panel()
+        st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
+        st.write("More settings coming soon (e.g., custom templates).")
+
+def set_style_guide(guide):
+    st.session_state.style_guide = guide
+    st.session_state.brand_style_guide = style_guide_text(guide)
+
+def _replace_section(section, guide):
+    set_style_guide(guide)
+    # Only files that contain the changed section need rendering again
+    st.session_state.style_guide_pdfs = {
+        key: blob_id for key, blob_id in st.session_state.get("style_guide_pdfs", {}).items()
+        if key != "style_guide_txt" and section not in key[1]
+    }
+
+def add_section_version(section, guide):
+    """Make `guide` current and record its `section` as a new version"""
+    versions = st.session_state.style_guide_sections[section]
+    versions.append({
+        "version": versions[-1]["version"] + 1,
+        "fields": guide.model_dump(include=set(SECTION_FIELDS[section]))
+    })
+    del versions[:-MAX_SECTION_VERSIONS]
+    _replace_section(section, guide)
+
+def revert_section(section):
+    """Drop the latest version of a section and restore the one before it"""
+    versions = st.session_state.style_guide_sections[section]
+    versions.pop()
+    guide = StyleGuide.model_validate({**st.session_state.style_guide.model_dump(), **versions[-1]["fields"]})
+    _replace_section(section, guide)
+
+@st.fragment
+def show_section_editor(google_api_key):
+    """Rewrite one section with a small LLM call instead of regenerating the whole guide"""
+    st.markdown('<div class="sub-header">Edit a Section</div>', unsafe_allow_html=True)
+    section = st.selectbox("Section", options=list(SECTION_FIELDS), key="edit_section")
+    versions = st.session_state.style_guide_sections[section]
+    st.caption(f"Version {versions[-1]['version']}")
+    instructions = st.text_input(
+        "What should change?",
+        placeholder="e.g., a more playful, informal tone",
+        key="section_instructions"
+    )
+    if st.button("Regenerate Section", key="regenerate_section_button"):
+        try:
+            llm = get_llm(google_api_key, max_tokens=SECTION_MAX_TOKENS, tool="style_guide")
+            with st.spinner(f"Rewriting {section}..."), metered(st.session_state.get("username", ""), "style_guide"), queued("style_guide"):
+                guide = regenerate_section(
+                    llm,
+                    st.session_state.style_guide,
+                    section,
+                    st.session_state.style_guide_brand_name,
+                    st.session_state.style_guide_brand_description,
+                    instructions
+                )
+        except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+            st.error(str(e))
+            return
+        except Exception as e:
+            st.error(f"Error regenerating section: {str(e)}")
+            return
+        add_section_version(section, guide)
+        record_generation(
+            "style_guide_section", f"{st.session_state.style_guide_brand_name}: {section}: {instructions}",
+            output=section_text(guide, section), params={"section": section},
+            username=st.session_state.get("username", "")
+        )
+        # The preview and the downloads live outside this fragment
+        st.rerun()
+    if len(versions) > 1 and st.button(f"Revert to Version {versions[-2]['version']}", key="revert_section_button"):
+        revert_section(section)
+        st.rerun()
+
+@st.fragment
+def show_style_guide_export():
+    """PDF options and downloads; changing the options reruns only this fragment"""
+    with st.container():
+        st.markdown('<div class="sub-header">Style Guide Options</div>', unsafe_allow_html=True)
+        page_size = st.selectbox(
+            "Page Size",
+            options=["Letter (8.5x11)", "A4 (210x297mm)"],
+            index=0,
+            key="page_size"
+        )
+        include_sections = st.multiselect(
+            "Include Sections",
+            options=list(SECTION_FIELDS),
+            default=["Brand Overview", "Color Palette", "Typography", "Logo Usage"],
+            key="include_sections"
+        )
+
+    if not st.session_state.get("brand_style_guide"):
+        return
+    brand_name = st.session_state.style_guide_brand_name
+    st.markdown('<div class="sub-header">Download Style Guide</div>', unsafe_allow_html=True)
+
+    # Render each page size and section selection at most once per guide, straight to disk
+    pdfs = st.session_state.setdefault("style_guide_pdfs", {})
+    pdf_key = (page_size, tuple(include_sections))
+    if pdf_key not in pdfs:
+        logos = [entry["image"] for entry in get_gallery() if entry["source"] == "logo"][-MAX_PDF_LOGOS:]
+        pdfs[pdf_key] = store_file(lambda path: generate_style_guide_pdf(
+            path,
+            brand_name,
+            st.session_state.style_guide,
+            page_size,
+            include_sections,
+            st.session_state.get('generation_date', 'Current Date'),
+            logos=logos,
+            fonts=st.session_state.get("style_guide_fonts", []),
+            flowable_cache=st.session_state.setdefault("style_guide_flowables", {})
+        ), ".pdf")
+    if "style_guide_txt" not in pdfs:
+        pdfs["style_guide_txt"] = store_blob(str(st.session_state.brand_style_guide), ".txt")
+
+    st.markdown('<div class="download-button">', unsafe_allow_html=True)
+    download_button(
+        "Download Style Guide as PDF",
+        pdfs[pdf_key],
+        f"{brand_name.replace(' ', '_')}_style_guide.pdf",
+        key="download_style_guide_button"
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
     
-    lines = content.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check if this is a section header
-        if line.isupper() or (line.startswith('#') and '#' in line) or any(keyword in line.upper() for keyword in ['BRAND OVERVIEW', 'COLOR PALETTE', 'TYPOGRAPHY', 'LOGO USAGE', 'IMAGERY GUIDELINES', 'VOICE & TONE', 'APPLICATIONS']):
-            if current_section:
-                sections[current_section] = '\n'.join(current_content)
-            current_section = line.replace('#', '').strip()
-            current_content = []
+    # Download text version
+    st.markdown('<div class="download-button">', unsafe_allow_html=True)
+    download_button(
+        "Download as TXT",
+        pdfs["style_guide_txt"],
+        f"{brand_name.replace(' ', '_')}_style_guide.txt",
+        key="download_text_button"
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def show_logo_palette_panel():
+    """Pre-fill the color fields from a generated or uploaded logo"""
+    st.markdown('<div class="sub-header">Colors from Logo</div>', unsafe_allow_html=True)
+    gallery = get_gallery()
+    source_labels = ["Upload an image"] + [entry["label"] for entry in gallery]
+    palette_source = st.selectbox(
+        "Logo Source",
+        options=range(len(source_labels)),
+        index=len(gallery),
+        format_func=lambda i: source_labels[i],
+        key="palette_source"
+    )
+    palette_upload = None
+    if palette_source == 0:
+        palette_upload = st.file_uploader(
+            "Logo Image",
+            type=["jpg", "jpeg", "png", "webp"],
+            key="palette_upload"
+        )
+    if st.button("Extract Colors", key="extract_colors_button"):
+        if palette_source > 0:
+            logo_image = gallery[palette_source - 1]["image"]
+        elif palette_upload:
+            try:
+                logo_image = open_upload(palette_upload)
+            except ImageRejectedError as e:
+                st.error(str(e))
+                return
         else:
-            if current_section:
-                current_content.append(line)
-    
-    # Add the last section
-    if current_section and current_content:
-        sections[current_section] = '\n'.join(current_content)
-    
-    return sections
+            logo_image = None
+        if logo_image is None:
+            st.error("Please upload a logo image or generate one first.")
+        else:
+            try:
+                palette = extract_palette(logo_image)
+                st.session_state.primary_colors, st.session_state.secondary_colors = split_palette(palette)
+                st.session_state.extracted_palette = palette
+                # The color fields live in the form outside this fragment
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error extracting colors: {str(e)}")
+    if st.session_state.get("extracted_palette"):
+        swatches = "".join(
+            f'<div class="color-swatch" style="background-color: {hex_code};" title="{hex_code} ({share:.0%})"></div>'
+            for hex_code, share in st.session_state.extracted_palette
+        )
+        st.markdown(f'<div class="color-palette">{swatches}</div>', unsafe_allow_html=True)
 
-def generate_style_guide_pdf(brand_name, sections, page_size, include_sections):
-    """Generate a PDF style guide"""
-    buffer = io.BytesIO()
+def build_style_guide_prompt(brand_name, brand_description, primary_colors, secondary_colors, fonts):
+    """Build the Gemini prompt for a full brand style guide"""
+    # Prepare the prompt for style guide generation
+    style_guide_prompt = f"""
+    Create a comprehensive brand style guide for {brand_name}.
     
-    # Set page size
-    if page_size == "A4 (210x297mm)":
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-    else:
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
+    Brand Description: {brand_description}
     
-    # Get styles
-    styles = getSampleStyleSheet()
+    Primary Colors: {primary_colors if primary_colors else 'Not specified'}
+    Secondary Colors: {secondary_colors if secondary_colors else 'Not specified'}
+    Fonts: {fonts if fonts else 'Not specified'}
     
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#2c3e50')
-    )
-    
-    section_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=18,
-        spaceAfter=12,
-        spaceBefore=20,
-        textColor=colors.HexColor('#34495e')
-    )
+    Please generate the following sections in a structured format:
     
-    body_style = ParagraphStyle(
-        'BodyText',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6,
-        leading=14
-    )
+    1. BRAND OVERVIEW
+    - Brand mission and vision
+    - Target audience
+    - Brand personality and values
     
-    # Build the story
-    story = []
+    2. COLOR PALETTE
+    - Primary colors with hex codes and usage guidelines
+    - Secondary colors with hex codes and usage guidelines
+    - Color combinations and accessibility considerations
     
-    # Title page
-    story.append(Paragraph(f"{brand_name.upper()}", title_style))
-    story.append(Paragraph("BRAND STYLE GUIDE", title_style))
-    story.append(Spacer(1, 50))
-    story.append(Paragraph(f"Generated on {st.session_state.get('generation_date', 'Current Date')}", body_style))
-    story.append(PageBreak())
+    3. TYPOGRAPHY
+    - Primary font family and usage
+    - Secondary font family and usage
+    - Font hierarchy and sizing guidelines
     
-    # Table of contents (simplified)
-    story.append(Paragraph("TABLE OF CONTENTS", section_style))
-    story.append(Spacer(1, 20))
+    4. LOGO USAGE
+    - Logo variations and clear space requirements
+    - Minimum size requirements
+    - Logo placement guidelines
+    - What not to do with the logo
     
-    for section in include_sections:
-        if section in sections:
-            story.append(Paragraph(f"• {section}", body_style))
+    5. IMAGERY GUIDELINES
+    - Photography style and aesthetic
+    - Icon style and usage
+    - Graphic elements and patterns
     
-    story.append(PageBreak())
+    6. VOICE & TONE
+    - Brand voice characteristics
+    - Tone variations for different contexts
+    - Writing style guidelines
     
-    # Add sections
-    for section in include_sections:
-        if section in sections:
-            story.append(Paragraph(section.upper(), section_style))
-            story.append(Paragraph(sections[section], body_style))
-            story.append(Spacer(1, 20))
+    7. APPLICATIONS
+    - Digital applications (website, social media)
+    - Print applications (business cards, brochures)
+    - Environmental applications (signage, packaging)
     
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer 
\ No newline at end of file
+    Respond with a single JSON object with these fields: brand_overview, primary_colors,
+    secondary_colors, color_guidelines, typography, logo_usage, imagery_guidelines,
+    voice_and_tone and applications. Every color is an object with a name, a hex code
+    in the form #RRGGBB and its usage. All other fields are detailed plain-text guidelines.
+    """
+    return style_guide_prompt
+
+def _json_llm(llm, schema):
+    # Constrain decoding to the schema where the model supports it; the raw text is validated below
+    try:
+        return llm.with_structured_output(schema, include_raw=True) | itemgetter("raw")
+    except NotImplementedError:
+        return llm
+
+def _repair_message(data, errors):
+    values = json.dumps({field: data.get(field) for field in errors}, indent=2)
+    problems = "\n".join(f"- {field}: {message}" for field, message in errors.items())
+    return HumanMessage(content=(
+        f"These fields of a brand style guide JSON object failed validation:\n{problems}\n\n"
+        f"Their current values:\n{values}\n\n"
+        "Return a JSON object containing only these fields, corrected. Keep the brand's content and intent."
+    ))
+
+def _merge_repair(data, errors, content):
+    repaired = load_json_object(content)
+    data.update({field: repaired[field] for field in errors if field in repaired})
+    return data
+
+def _validate_with_repairs(llm, data):
+    for _ in range(MAX_REPAIR_ATTEMPTS):
+        errors = invalid_fields(data)
+        if not errors:
+            break
+        with BREAKERS["gemini"].call():
+            repair = _json_llm(llm, repair_schema(errors)).invoke([_repair_message(data, errors)])
+        data = _merge_repair(data, errors, repair.content)
+    return StyleGuide.model_validate(data)
+
+def generate_style_guide(llm, brand_name, brand_description, primary_colors="", secondary_colors="", fonts=""):
+    """Generate a validated StyleGuide with Gemini.
+
+    Fields that fail validation are re-requested on their own, up to
+    MAX_REPAIR_ATTEMPTS times, instead of regenerating the whole guide.
+    """
+    style_guide_prompt = build_style_guide_prompt(
+        brand_name, brand_description, primary_colors, secondary_colors, fonts
+    )
+    with BREAKERS["gemini"].call():
+        response = _json_llm(llm, StyleGuide).invoke([HumanMessage(content=style_guide_prompt)])
+    return _validate_with_repairs(llm, load_json_object(response.content))
+
+async def agenerate_style_guide(llm, brand_name, brand_description, primary_colors="", secondary_colors="", fonts=""):
+    """Async variant of generate_style_guide"""
+    style_guide_prompt = build_style_guide_prompt(
+        brand_name, brand_description, primary_colors, secondary_colors, fonts
+    )
+    with BREAKERS["gemini"].call():
+        response = await _json_llm(llm, StyleGuide).ainvoke([HumanMessage(content=style_guide_prompt)])
+    data = load_json_object(response.content)
+    for _ in range(MAX_REPAIR_ATTEMPTS):
+        errors = invalid_fields(data)
+        if not errors:
+            break
+        with BREAKERS["gemini"].call():
+            repair = await _json_llm(llm, repair_schema(errors)).ainvoke([_repair_message(data, errors)])
+        data = _merge_repair(data, errors, repair.content)
+    return StyleGuide.model_validate(data)
+
+def build_section_prompt(guide, section, brand_name, brand_description, instructions=""):
+    """Build the Gemini prompt for rewriting one section of an existing style guide"""
+    current = json.dumps(guide.model_dump(include=set(SECTION_FIELDS[section])), indent=2)
+    return f"""
+    You are revising the {section} section of the brand style guide for {brand_name}.
+
+    Brand Description: {brand_description}
+    Brand Overview: {guide.brand_overview}
+
+    Current {section} section:
+    {current}
+
+    Requested changes: {instructions if instructions else 'Write a fresh alternative that fits the brand.'}
+
+    Respond with a single JSON object with the same fields as the current section. Every color
+    is an object with a name, a hex code in the form #RRGGBB and its usage.
+    """
+
+def regenerate_section(llm, guide, section, brand_name, brand_description, instructions=""):
+    """Rewrite one section of a StyleGuide and return the updated guide; other sections are kept as they are"""
+    fields = SECTION_FIELDS[section]
+    section_prompt = build_section_prompt(guide, section, brand_name, brand_description, instructions)
+    with BREAKERS["gemini"].call():
+        response = _json_llm(llm, repair_schema(fields)).invoke([HumanMessage(content=section_prompt)])
+    rewritten = load_json_object(response.content)
+    data = guide.model_dump()
+    data.update({field: rewritten[field] for field in fields if field in rewritten})
+    return _validate_with_repairs(llm, data)
@@ -0,0 +1,183 @@
+import asyncio
+import weakref
+import httpx
+import requests
+from services.circuit_breaker import BREAKERS
+from services.image_ingest import CHUNK_SIZE, check_content_length, read_limited, aread_limited, open_image
+
+BRIA_BASE_URL = "https://engine.prod.bria-api.com/v1"
+MODEL_VERSION = "2.3"
+
+# Sync generation can take a while, so only the connect phase is kept short
+REQUEST_TIMEOUT = (10.0, 120.0)
+ASYNC_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+ASYNC_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=16)
+# Used only to open the first connections at startup
+WARM_TIMEOUT = 5.0
+
+# Pooled, so sync calls reuse the DNS lookup and TLS session of earlier ones
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# One pooled async client per event loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def _headers(api_key):
+    return {
+        "Content-Type": "application/json",
+        "api_token": api_key
+    }
+
+def _post(url, payload, api_key):
+    with BREAKERS["bria"].call():
+        response = _session.post(url, json=payload, headers=_headers(api_key), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+    return response.json()
+
+def text_to_image(api_key, prompt, num_results, width, height, seed=None):
+    """Call the Bria text-to-image endpoint and return the JSON response.
+
+    Each result carries the seed it was generated with; pass it back as `seed`
+    to reproduce that result, e.g. at a higher resolution.
+    """
+    url = f"{BRIA_BASE_URL}/text-to-image/base/{MODEL_VERSION}"
+    payload = {
+        "prompt": prompt,
+        "num_results": num_results,
+        "sync": True,
+        "height": height,
+        "width": width
+    }
+    if seed is not None:
+        payload["seed"] = seed
+    return _post(url, payload, api_key)
+
+def reimagine(api_key, prompt, image_base64, num_results, width, height):
+    """Call the Bria reimagine endpoint with a Base64 image and return the JSON response"""
+    url = f"{BRIA_BASE_URL}/reimagine"
+    payload = {
+        "prompt": prompt,
+        "file": image_base64,
+        "num_results": num_results,
+        "sync": True,
+        "height": height,
+        "width": width
+    }
+    return _post(url, payload, api_key)
+
+def fetch_image(image_url):
+    """Download a generated image in bounded chunks and open it lazily with PIL"""
+    with _session.get(image_url, timeout=REQUEST_TIMEOUT, stream=True) as image_response:
+        image_response.raise_for_status()
+        check_content_length(image_response.headers.get("Content-Length"))
+        return open_image(read_limited(image_response.iter_content(CHUNK_SIZE)))
+
+def fetch_result_images(data):
+    """Fetch the first image of every result, using None where a result has no URL"""
+    images = []
+    for result in data.get("result") or []:
+        if "urls" in result and result["urls"]:
+            images.append(fetch_image(result["urls"][0]))
+        else:
+            images.append(None)
+    return images
+
+def load_images(images):
+    """Decode lazily opened images now so the result can be shared between threads"""
+    for image in images:
+        if image is not None:
+            image.load()
+    return images
+
+def result_seeds(data):
+    """Return the seed of every result, or None where Bria did not report one"""
+    return [result.get("seed") for result in data.get("result") or []]
+
+def get_async_client():
+    """Return the pooled async HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=ASYNC_TIMEOUT, limits=ASYNC_LIMITS)
+        _async_clients[loop] = client
+    return client
+
+def warm_connections():
+    """Open a pooled sync connection to Bria so the first generation skips DNS and TLS setup"""
+    _session.head(BRIA_BASE_URL, timeout=WARM_TIMEOUT).close()
+
+async def awarm_connections():
+    """Async variant of warm_connections, for the running event loop's client"""
+    await get_async_client().head(BRIA_BASE_URL, timeout=WARM_TIMEOUT)
+
+async def close_async_client():
+    """Close the async HTTP client of the running event loop, if any"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _raise_for_status(response):
+    # Raise the same exception type as the sync path so callers handle both alike
+    if response.is_error:
+        raise requests.exceptions.HTTPError(
+            f"{response.status_code} Error: {response.reason_phrase} for url: {response.url}",
+            response=response
+        )
+
+async def _apost(url, payload, api_key):
+    with BREAKERS["bria"].call():
+        response = await get_async_client().post(url, json=payload, headers=_headers(api_key))
+        _raise_for_status(response)
+    return response.json()
+
+async def atext_to_image(api_key, prompt, num_results, width, height, seed=None):
+    """Async variant of text_to_image"""
+    url = f"{BRIA_BASE_URL}/text-to-image/base/{MODEL_VERSION}"
+    payload = {
+        "prompt": prompt,
+        "num_results": num_results,
+        "sync": True,
+        "height": height,
+        "width": width
+    }
+    if seed is not None:
+        payload["seed"] = seed
+    return await _apost(url, payload, api_key)
+
+async def areimagine(api_key, prompt, image_base64, num_results, width, height):
+    """Async variant of reimagine"""
+    url = f"{BRIA_BASE_URL}/reimagine"
+    payload = {
+        "prompt": prompt,
+        "file": image_base64,
+        "num_results": num_results,
+        "sync": True,
+        "height": height,
+        "width": width
+    }
+    return await _apost(url, payload, api_key)
+
+async def afetch_image(image_url):
+    """Async variant of fetch_image"""
+    async with get_async_client().stream("GET", image_url) as image_response:
+        _raise_for_status(image_response)
+        check_content_length(image_response.headers.get("Content-Length"))
+        return open_image(await aread_limited(image_response.aiter_bytes(CHUNK_SIZE)))
+
+async def afetch_result_images(data):
+    """Fetch the first image of every result concurrently, using None where a result has no URL"""
+    async def fetch(result):
+        if "urls" in result and result["urls"]:
+            return await afetch_image(result["urls"][0])
+        return None
+    return list(await asyncio.gather(*(fetch(result) for result in data.get("result") or [])))
+
+def error_message(status_code, action="generating image"):
+    """Map a Bria HTTP status code to a user-facing error message"""
+    if status_code == 401:
+        return "Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/."
+    if status_code == 429:
+        return "API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan."
+    if status_code == 408:
+        return "Prompt rejected due to content moderation. Please revise your prompt to comply with Bria's ethical guidelines."
+    return f"Error {action}: HTTP {status_code}"
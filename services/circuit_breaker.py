@@ -0,0 +1,151 @@
+import time
+import threading
+import contextlib
+from collections import deque
+import streamlit as st
+
+# Outcomes older than this no longer count toward the error and slow-call rates
+WINDOW_SECONDS = 60
+WINDOW_SIZE = 20
+# Rates are only judged once the window holds this many calls
+MIN_CALLS = 5
+FAILURE_RATE_THRESHOLD = 0.5
+SLOW_CALL_RATE_THRESHOLD = 0.5
+# How long an open breaker fails fast before letting a probe call through
+OPEN_SECONDS = 30
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose breaker is open"""
+
+    def __init__(self, backend, retry_after):
+        self.backend = backend
+        self.retry_after = retry_after
+        super().__init__(degraded_message(backend, retry_after))
+
+def degraded_message(backend, retry_after):
+    return (
+        f"{backend} is currently failing or responding slowly, so new requests are paused "
+        f"for about {max(retry_after, 1)} seconds. Please try again shortly."
+    )
+
+def _status_code(e):
+    # Bria errors carry an HTTP response; Gemini errors carry a code, possibly on a wrapped cause
+    while e is not None:
+        response = getattr(e, "response", None)
+        status_code = getattr(response, "status_code", None) or getattr(e, "code", None)
+        if isinstance(status_code, int):
+            return status_code
+        e = e.__cause__
+    return None
+
+def is_backend_failure(e):
+    """Whether an exception says the backend is unhealthy rather than that the request was bad"""
+    status_code = _status_code(e)
+    return status_code is None or status_code >= 500 or status_code == 429
+
+class CircuitBreaker:
+    """Fail fast on a backend with a high recent error or slow-call rate.
+
+    The breaker opens when enough of the recent calls failed or took longer
+    than `slow_call_seconds`. While open, calls raise CircuitOpenError
+    without reaching the backend. After OPEN_SECONDS a single probe call is
+    let through (half-open); it closes the breaker if it succeeds quickly and
+    reopens it otherwise.
+    """
+
+    def __init__(self, name, slow_call_seconds):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=WINDOW_SIZE)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until an open breaker lets a probe through; 0 when calls are allowed"""
+        with self._lock:
+            if self.state == CLOSED:
+                return 0
+            return max(int(self._opened_at + OPEN_SECONDS - time.monotonic()), 0)
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= OPEN_SECONDS:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(self.name, max(int(self._opened_at + OPEN_SECONDS - now), 1))
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+
+    def _record(self, failed, elapsed):
+        now = time.monotonic()
+        slow = elapsed > self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                return
+            if self.state != CLOSED:
+                return
+            self._outcomes.append((now, failed, slow))
+            while self._outcomes and now - self._outcomes[0][0] > WINDOW_SECONDS:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            if calls < MIN_CALLS:
+                return
+            failures = sum(1 for _, failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, _, slow in self._outcomes if slow)
+            if failures / calls >= FAILURE_RATE_THRESHOLD or slow_calls / calls >= SLOW_CALL_RATE_THRESHOLD:
+                self._open(now)
+
+    def _abandon_probe(self):
+        # A cancelled probe tells nothing about the backend, so the next caller probes instead
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    @contextlib.contextmanager
+    def call(self):
+        """Guard one backend call; works around both blocking and awaited calls"""
+        self._before_call()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            # Client errors such as a bad API key say nothing about backend health
+            self._record(is_backend_failure(e), time.monotonic() - start)
+            raise
+        except BaseException:
+            # Cancelled calls never finished, so they are not counted either way
+            self._abandon_probe()
+            raise
+        self._record(False, time.monotonic() - start)
+
+# Sync Bria generation routinely takes tens of seconds; Gemini answers much faster
+BREAKERS = {
+    "bria": CircuitBreaker("Bria AI", slow_call_seconds=60),
+    "gemini": CircuitBreaker("Gemini", slow_call_seconds=30)
+}
+
+def show_backend_status(*backends):
+    """Warn on a tool page when a backend it depends on is failing fast"""
+    for backend in backends:
+        breaker = BREAKERS[backend]
+        if breaker.state != CLOSED:
+            st.warning(degraded_message(breaker.name, breaker.retry_after()))
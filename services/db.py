@@ -0,0 +1,7 @@
+import sqlite3
+
+DB_PATH = 'brandforge.db'
+
+def get_connection():
+    """Open a connection to the BrandForge SQLite database"""
+    return sqlite3.connect(DB_PATH, timeout=30)
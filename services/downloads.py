@@ -0,0 +1,250 @@
+import io
+import os
+import re
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import streamlit as st
+from services.image_formats import OUTPUT_FORMATS, DEFAULT_QUALITY, output_quality, encode_bytes
+from services.local_edits import get_executor
+from services.db import get_connection
+
+# Generated artifacts are written here once and served from disk by reference
+BLOB_DIR = os.path.join(tempfile.gettempdir(), "brandforge_downloads")
+# Blobs not written or read for this long are deleted
+BLOB_TTL = 6 * 3600
+SWEEP_INTERVAL = 300
+BLOB_MIME_TYPES = {
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".jpg": "image/jpeg",
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".json": "application/json",
+    ".zip": "application/zip"
+}
+READ_CHUNK_SIZE = 64 * 1024
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+_db_ready = False
+
+def blob_path(blob_id):
+    """Return the on-disk path of a blob, rejecting ids that could escape BLOB_DIR"""
+    if not _BLOB_ID.match(blob_id) or os.path.splitext(blob_id)[1] not in BLOB_MIME_TYPES:
+        raise KeyError("Unknown download.")
+    return os.path.join(BLOB_DIR, blob_id)
+
+def blob_mime_type(blob_id):
+    return BLOB_MIME_TYPES[os.path.splitext(blob_id)[1]]
+
+def init_blob_owners_db():
+    """Create the table of which API users stored which blobs, if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    # Blobs are content-addressed, so users who generate the same bytes share a blob
+    c.execute('''CREATE TABLE IF NOT EXISTS blob_owners
+                 (blob_id TEXT, username TEXT, PRIMARY KEY (blob_id, username))''')
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def grant_blob(blob_id, username):
+    """Record that username stored blob_id, so the API serves it to them"""
+    init_blob_owners_db()
+    conn = get_connection()
+    conn.execute("INSERT OR IGNORE INTO blob_owners (blob_id, username) VALUES (?, ?)", (blob_id, username))
+    conn.commit()
+    conn.close()
+
+def owns_blobs(blob_ids, username):
+    """Whether username stored every one of blob_ids"""
+    blob_ids = set(blob_ids)
+    if not blob_ids:
+        return True
+    init_blob_owners_db()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''SELECT COUNT(*) FROM blob_owners
+                  WHERE username = ? AND blob_id IN ({','.join('?' * len(blob_ids))})''',
+              (username, *blob_ids))
+    owned = c.fetchone()[0]
+    conn.close()
+    return owned == len(blob_ids)
+
+def _forget_owners(blob_ids):
+    init_blob_owners_db()
+    conn = get_connection()
+    conn.executemany("DELETE FROM blob_owners WHERE blob_id = ?", [(blob_id,) for blob_id in blob_ids])
+    conn.commit()
+    conn.close()
+
+def store_blob(data, suffix):
+    """Write bytes or text once and return its content-addressed blob id"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    blob_id = f"{hashlib.sha256(data).hexdigest()}{suffix}"
+    write_blob(blob_id, data)
+    return blob_id
+
+def write_blob(blob_id, data):
+    """Write bytes under a given blob id unless it is already stored"""
+    path = blob_path(blob_id)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        # Write to a temporary name first so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    sweep_expired()
+
+def store_stream(chunks, suffix):
+    """Write an iterable of byte chunks to the blob directory without holding them in memory"""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(BLOB_DIR, f"{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+        blob_id = f"{digest.hexdigest()}{suffix}"
+        os.replace(tmp_path, blob_path(blob_id))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    sweep_expired()
+    return blob_id
+
+def store_file(write, suffix):
+    """Store the file that write(path) creates in the blob directory, for outputs built straight to disk"""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp_path = os.path.join(BLOB_DIR, f"{uuid.uuid4().hex}.tmp")
+    try:
+        write(tmp_path)
+        with open(tmp_path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256")
+        blob_id = f"{digest.hexdigest()}{suffix}"
+        os.replace(tmp_path, blob_path(blob_id))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    sweep_expired()
+    return blob_id
+
+def store_image(image):
+    """Encode a PIL image as PNG into the blob directory and return its blob id"""
+    img_buffer = io.BytesIO()
+    image.save(img_buffer, format="PNG")
+    return store_blob(img_buffer.getvalue(), ".png")
+
+def image_variant(blob_id, output_format="png", quality=None):
+    """Return the blob id of a stored PNG asset encoded in output_format.
+
+    Variants are stored under an id derived from (asset, format, quality), so
+    each one is encoded at most once, in the worker pool, and shared by every
+    session and process until it expires.
+    """
+    quality = output_quality(output_format, quality)
+    if output_format == "png":
+        return blob_id
+    key = f"{blob_id}|{output_format}|{quality}".encode("utf-8")
+    variant_id = f"{hashlib.sha256(key).hexdigest()}{OUTPUT_FORMATS[output_format]['suffix']}"
+    path = blob_path(variant_id)
+    if os.path.exists(path):
+        os.utime(path)
+        return variant_id
+    data = get_executor().submit(encode_bytes, read_blob(blob_id), output_format, quality).result()
+    write_blob(variant_id, data)
+    return variant_id
+
+def read_blob(blob_id):
+    """Return a blob's bytes, refreshing its expiry"""
+    path = blob_path(blob_id)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError("This download has expired. Please generate it again.")
+    os.utime(path)
+    return data
+
+def iter_blob(blob_id, chunk_size=READ_CHUNK_SIZE):
+    """Yield a blob from disk in chunks"""
+    with open(blob_path(blob_id), "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+def sweep_expired(force=False):
+    """Delete blobs past BLOB_TTL, at most once per SWEEP_INTERVAL unless forced"""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    try:
+        entries = list(os.scandir(BLOB_DIR))
+    except FileNotFoundError:
+        return
+    removed = []
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > BLOB_TTL:
+                os.remove(entry.path)
+                removed.append(entry.name)
+        except OSError:
+            pass
+    if removed:
+        _forget_owners(removed)
+
+def download_button(label, blob_id, file_name, key):
+    """Render a download button that reads the blob from disk only when clicked"""
+    return st.download_button(
+        label=label,
+        data=lambda: read_blob(blob_id),
+        file_name=file_name,
+        mime=blob_mime_type(blob_id),
+        key=key,
+        on_click="ignore"
+    )
+
+def show_format_options(key, default="png"):
+    """Download format and quality widgets for an image tool"""
+    output_format = st.selectbox(
+        "Download Format",
+        options=list(OUTPUT_FORMATS),
+        index=list(OUTPUT_FORMATS).index(default),
+        format_func=lambda name: OUTPUT_FORMATS[name]["label"],
+        key=f"{key}_format"
+    )
+    if OUTPUT_FORMATS[output_format]["lossy"]:
+        st.slider("Quality", min_value=40, max_value=100, value=DEFAULT_QUALITY, step=5, key=f"{key}_quality")
+
+def selected_format(key, default="png"):
+    """The (format, quality) chosen with show_format_options"""
+    return st.session_state.get(f"{key}_format", default), st.session_state.get(f"{key}_quality")
+
+def image_download_button(label, blob_id, file_stem, key, output_format="png", quality=None):
+    """Download button for an image asset in the chosen format, encoded only when clicked"""
+    suffix = OUTPUT_FORMATS[output_format]["suffix"]
+    return st.download_button(
+        label=f"{label} as {suffix[1:].upper()}",
+        data=lambda: read_blob(image_variant(blob_id, output_format, quality)),
+        file_name=f"{file_stem}{suffix}",
+        mime=BLOB_MIME_TYPES[suffix],
+        key=key,
+        on_click="ignore"
+    )
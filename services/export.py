@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import zipfile
+import streamlit as st
+from services.gallery import get_gallery
+from services.image_index import get_indexed_images
+from services.downloads import store_image, store_stream, blob_path, blob_mime_type, download_button
+
+# Formats that are already compressed; deflating them again only costs CPU
+STORED_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".pdf", ".zip"}
+COPY_CHUNK_SIZE = 64 * 1024
+MANIFEST_NAME = "manifest.json"
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained after every write"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+def _compress_type(arcname):
+    if os.path.splitext(arcname)[1].lower() in STORED_SUFFIXES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def iter_zip(entries):
+    """Yield a zip archive of `entries` chunk by chunk, ending with a manifest.json.
+
+    Each entry is a dict with "name", a "path" on disk or "data" as bytes or
+    text, and optional "kind" and "label" metadata for the manifest. File
+    entries are copied in chunks, so no entry is ever held in memory whole.
+    """
+    sink = _ChunkSink()
+    manifest = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "files": []}
+    with zipfile.ZipFile(sink, "w") as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry["name"], time.localtime()[:6])
+            info.compress_type = _compress_type(entry["name"])
+            size = 0
+            with archive.open(info, "w") as target:
+                if "path" in entry:
+                    with open(entry["path"], "rb") as source:
+                        while chunk := source.read(COPY_CHUNK_SIZE):
+                            target.write(chunk)
+                            size += len(chunk)
+                            yield from sink.drain()
+                else:
+                    data = entry["data"].encode("utf-8") if isinstance(entry["data"], str) else entry["data"]
+                    target.write(data)
+                    size = len(data)
+            yield from sink.drain()
+            manifest["files"].append({
+                "name": entry["name"],
+                "kind": entry.get("kind", "file"),
+                "label": entry.get("label", ""),
+                "size": size
+            })
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    yield from sink.drain()
+
+def blob_entries(blob_ids):
+    """Zip entries for blobs of the download store"""
+    return [
+        {"name": f"asset_{i + 1}{os.path.splitext(blob_id)[1]}", "path": blob_path(blob_id),
+         "kind": blob_mime_type(blob_id), "label": blob_id}
+        for i, blob_id in enumerate(blob_ids)
+    ]
+
+def collect_session_entries():
+    """Zip entries for everything generated in this session, read from disk where possible"""
+    entries = []
+    gallery = get_gallery()
+    records = {record["id"]: record for record in get_indexed_images([e["image_id"] for e in gallery if e.get("image_id")])}
+    for i, entry in enumerate(gallery):
+        record = records.get(entry.get("image_id"))
+        if record and os.path.exists(record["path"]):
+            path = record["path"]
+        else:
+            path = blob_path(store_image(entry["image"]))
+        entries.append({"name": f"images/{entry['source']}_{i + 1}.png", "path": path,
+                        "kind": entry["source"], "label": entry["label"]})
+
+    for i, caption in enumerate(dict.fromkeys(c for c in st.session_state.get("brand_kit_captions", []) if c)):
+        entries.append({"name": f"captions/caption_{i + 1}.txt", "data": caption, "kind": "caption"})
+    if st.session_state.get("brand_story"):
+        entries.append({"name": "brand_story.txt", "data": st.session_state.brand_story, "kind": "story"})
+    if st.session_state.get("brand_style_guide"):
+        entries.append({"name": "style_guide/style_guide.txt", "data": st.session_state.brand_style_guide,
+                        "kind": "style_guide"})
+        pdf_ids = [blob_id for blob_id in st.session_state.get("style_guide_pdfs", {}).values() if blob_id.endswith(".pdf")]
+        for i, blob_id in enumerate(pdf_ids):
+            if os.path.exists(blob_path(blob_id)):
+                name = "style_guide/style_guide.pdf" if i == 0 else f"style_guide/style_guide_{i + 1}.pdf"
+                entries.append({"name": name, "path": blob_path(blob_id), "kind": "style_guide"})
+    return entries
+
+@st.fragment
+def show_session_export():
+    """Sidebar panel that bundles the session's assets into one zip download"""
+    if st.button("Prepare Download", key="prepare_export_button"):
+        entries = collect_session_entries()
+        if entries:
+            st.session_state.export_blob_id = store_stream(iter_zip(entries), ".zip")
+        else:
+            st.info("Nothing generated in this session yet.")
+    blob_id = st.session_state.get("export_blob_id")
+    if blob_id and os.path.exists(blob_path(blob_id)):
+        download_button("Download Everything (ZIP)", blob_id, "brandforge_assets.zip", key="download_export_button")
@@ -0,0 +1,24 @@
+import streamlit as st
+from services.image_index import index_image
+
+# Images remembered per session for reuse across tools
+MAX_GALLERY_IMAGES = 12
+
+def add_to_gallery(image, source, label):
+    """Remember a generated image for this session and add it to the similarity index.
+
+    Returns (image_id, is_duplicate); image_id is None if indexing failed.
+    """
+    try:
+        image_id, is_duplicate = index_image(image, source, label, st.session_state.get("username", ""))
+    except Exception as e:
+        st.warning(f"Could not index image for similarity search: {str(e)}")
+        image_id, is_duplicate = None, False
+    gallery = st.session_state.setdefault("brand_gallery", [])
+    gallery.append({"image": image, "source": source, "label": label, "image_id": image_id})
+    del gallery[:-MAX_GALLERY_IMAGES]
+    return image_id, is_duplicate
+
+def get_gallery():
+    """Return the session's generated images, oldest first"""
+    return st.session_state.get("brand_gallery", [])
@@ -0,0 +1,143 @@
+import re
+import json
+import time
+import hashlib
+from PIL import Image
+from services.db import get_connection
+from services.image_index import get_indexed_images
+
+SNIPPET_TOKENS = 16
+
+_db_ready = False
+
+def init_history_db():
+    """Create the generation history table and its FTS5 index if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS generation_history
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, tool TEXT, prompt TEXT,
+                  output TEXT, metadata TEXT, request_key TEXT, created_at REAL)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_generation_history_request
+                 ON generation_history (username, request_key, created_at)''')
+    # External-content FTS5 table kept in sync by triggers
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS generation_history_fts USING fts5
+                 (prompt, output, content='generation_history', content_rowid='id',
+                  tokenize='porter unicode61')''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS generation_history_ai AFTER INSERT ON generation_history BEGIN
+                     INSERT INTO generation_history_fts (rowid, prompt, output)
+                     VALUES (new.id, new.prompt, new.output);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS generation_history_ad AFTER DELETE ON generation_history BEGIN
+                     INSERT INTO generation_history_fts (generation_history_fts, rowid, prompt, output)
+                     VALUES ('delete', old.id, old.prompt, old.output);
+                 END''')
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def request_key(tool, prompt, params=None):
+    """Hash a request so identical repeats (ignoring case and spacing) share a key"""
+    normalized = " ".join(prompt.lower().split())
+    payload = json.dumps([tool, normalized, params or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def record_generation(tool, prompt, output="", params=None, image_ids=None, username="", seeds=None):
+    """Store a finished generation so it can be searched and reused later.
+
+    `seeds` lists the Bria seed of each entry of `image_ids`, so reused
+    results can still be regenerated at another resolution.
+    """
+    init_history_db()
+    image_ids = image_ids or []
+    metadata = {"params": params or {}, "image_ids": [i for i in image_ids if i is not None]}
+    if seeds is not None:
+        metadata["seeds"] = [seed for image_id, seed in zip(image_ids, seeds) if image_id is not None]
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''INSERT INTO generation_history
+                 (username, tool, prompt, output, metadata, request_key, created_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+              (username, tool, prompt, output or "", json.dumps(metadata),
+               request_key(tool, prompt, params), time.time()))
+    conn.commit()
+    conn.close()
+
+def find_previous_images(tool, prompt, params, username=""):
+    """Return (data, images) from the latest identical image request, or None.
+
+    Only requests whose images are all still on disk count as a hit.
+    """
+    init_history_db()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''SELECT id, output, metadata FROM generation_history
+                 WHERE username = ? AND request_key = ?
+                 ORDER BY created_at DESC LIMIT 1''',
+              (username, request_key(tool, prompt, params)))
+    row = c.fetchone()
+    conn.close()
+    if not row:
+        return None
+    metadata = json.loads(row[2])
+    image_ids = metadata.get("image_ids", [])
+    seeds = dict(zip(image_ids, metadata.get("seeds", [])))
+    records = get_indexed_images(image_ids)
+    if not records or len(records) != len(image_ids):
+        return None
+    try:
+        images = [Image.open(record["path"]) for record in records]
+    except OSError:
+        return None
+    data = {
+        "history_id": row[0],
+        "output": row[1],
+        "result": [{"path": record["path"], "seed": seeds.get(record["id"])} for record in records]
+    }
+    return data, images
+
+def _fts_query(text):
+    # Quote each term so user input can't be parsed as FTS5 syntax; prefix-match the last one
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def search_history(query, username="", tool=None, limit=20):
+    """Full-text search over the user's prompts and generated text, best matches first"""
+    match = _fts_query(query)
+    if match is None:
+        return []
+    init_history_db()
+    conn = get_connection()
+    c = conn.cursor()
+    sql = f'''SELECT h.id, h.tool, h.prompt, h.output, h.metadata, h.created_at,
+                     snippet(generation_history_fts, -1, '**', '**', '...', {SNIPPET_TOKENS})
+              FROM generation_history_fts
+              JOIN generation_history h ON h.id = generation_history_fts.rowid
+              WHERE generation_history_fts MATCH ? AND h.username = ?'''
+    params = [match, username]
+    if tool:
+        sql += " AND h.tool = ?"
+        params.append(tool)
+    sql += " ORDER BY bm25(generation_history_fts) LIMIT ?"
+    params.append(limit)
+    c.execute(sql, params)
+    rows = c.fetchall()
+    conn.close()
+    return [
+        {
+            "id": row[0],
+            "tool": row[1],
+            "prompt": row[2],
+            "output": row[3],
+            "metadata": json.loads(row[4]),
+            "created_at": row[5],
+            "snippet": row[6]
+        }
+        for row in rows
+    ]
@@ -1,10 +1,215 @@
 import streamlit as st
 import requests
-import io
-from PIL import Image
 import os
 import json
 import base64
+from services import bria_client
+from services.gallery import add_to_gallery
+from services.downloads import store_image, blob_path, show_format_options, selected_format, image_download_button
+from services.history import record_generation
+from services.local_edits import LOCAL_PRESETS, ASPECT_RATIOS, run_local_edit
+from services.usage import metered, QuotaExceededError
+from services.circuit_breaker import CircuitOpenError, show_backend_status
+from services.admission import queued, AdmissionRejectedError
+from services.image_ingest import read_upload
+
+def edit_image(api_key, image_bytes, edit_prompt, num_results, resolution):
+    """Reimagine an uploaded image with Bria and return the raw response and fetched images"""
+    # Convert uploaded image to Base64
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    data = bria_client.reimagine(
+        api_key,
+        edit_prompt,
+        image_base64,
+        num_results,
+        resolution,
+        resolution
+    )
+    return data, bria_client.fetch_result_images(data)
+
+async def aedit_image(api_key, image_bytes, edit_prompt, num_results, resolution):
+    """Async variant of edit_image for event-loop callers"""
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    data = await bria_client.areimagine(
+        api_key,
+        edit_prompt,
+        image_base64,
+        num_results,
+        resolution,
+        resolution
+    )
+    return data, await bria_client.afetch_result_images(data)
+
+@st.fragment
+def show_edit_options():
+    """Edit options; changing them reruns only this fragment"""
+    with st.container():
+        st.selectbox(
+            "Number of Logos to Edit",
+            options=[1, 2],
+            index=0,
+            key="num_results_edit"
+        )
+        if st.session_state.get("edit_mode") == "Local Preset":
+            st.selectbox(
+                "Preset",
+                options=list(LOCAL_PRESETS),
+                index=0,
+                key="edit_preset"
+            )
+            st.color_picker("Brand Color", value="#000000", key="edit_preset_color")
+            st.selectbox(
+                "Aspect Ratio",
+                options=list(ASPECT_RATIOS),
+                index=0,
+                key="edit_aspect_ratio"
+            )
+            st.checkbox("Transparent padding", value=True, key="edit_pad_transparent")
+        st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
+        st.write("More settings coming soon (e.g., styles, influence levels).")
+
+def run_preset_edit(uploaded_image):
+    """Apply the selected local preset to an upload and keep a reference to the result in session state"""
+    preset = st.session_state.get("edit_preset", next(iter(LOCAL_PRESETS)))
+    preset_color = st.session_state.get("edit_preset_color", "#000000")
+    aspect_ratio = st.session_state.get("edit_aspect_ratio", next(iter(ASPECT_RATIOS)))
+    pad_color = None if st.session_state.get("edit_pad_transparent", True) else preset_color
+    try:
+        # Local edit in the process pool; no Bria call
+        image = run_local_edit(
+            read_upload(uploaded_image),
+            preset,
+            color=preset_color,
+            aspect_ratio=aspect_ratio,
+            pad_color=pad_color
+        )
+        image_id, _ = add_to_gallery(image, "edit", f"{preset}: {uploaded_image.name}")
+        record_generation(
+            "image_edit", f"{preset}: {uploaded_image.name}",
+            params={
+                "preset": preset, "color": preset_color, "aspect_ratio": aspect_ratio,
+                "pad_color": pad_color, "source": uploaded_image.name
+            },
+            image_ids=[image_id],
+            username=st.session_state.get("username", "")
+        )
+        st.session_state.edit_results = {
+            "data": None,
+            "title": "Download Edited Logo",
+            "edits": [{
+                "index": 1,
+                "blob_id": store_image(image),
+                "is_duplicate": False,
+                "caption": f"{preset} ({image.width}x{image.height})",
+                "label": "Download Edited Logo",
+                "file_stem": "edited_logo_preset",
+                "key": "download_preset_button"
+            }]
+        }
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
+def run_bria_edit(api_key, uploaded_image, edit_prompt, resolution):
+    """Reimagine an upload with Bria and keep references to the results in session state"""
+    num_results = st.session_state.get("num_results_edit", 1)
+    try:
+        image_bytes = read_upload(uploaded_image)
+        # Bria AI Reimagine API request
+        with metered(st.session_state.get("username", ""), "edit", num_results, resolution), queued("edit"):
+            data, fetched_images = edit_image(api_key, image_bytes, edit_prompt, num_results, resolution)
+
+        if not ("result" in data and data["result"]):
+            st.session_state.edit_results = None
+            st.error(
+                "No images edited. Try a more specific edit prompt, e.g., "
+                "'Change the background to a modern office setting, add blue accents'."
+            )
+            return
+
+        edits = []
+        image_ids = []
+        for i, image in enumerate(fetched_images):
+            edit = {
+                "index": i + 1,
+                "blob_id": None,
+                "is_duplicate": False,
+                "caption": f"Edited Logo {i+1} ({resolution}x{resolution})",
+                "label": f"Download Edited Logo {i+1}",
+                "file_stem": f"edited_logo_{i+1}",
+                "key": f"download_edit_button_{i+1}"
+            }
+            if image is not None:
+                # Encoded once to disk for both display and download
+                edit["blob_id"] = store_image(image)
+                image_id, is_duplicate = add_to_gallery(image, "edit", f"Edited Logo {i+1}: {edit_prompt}")
+                image_ids.append(image_id)
+                edit["is_duplicate"] = is_duplicate
+            edits.append(edit)
+        record_generation(
+            "edit", edit_prompt,
+            params={"resolution": resolution, "num_results": num_results, "source": uploaded_image.name},
+            image_ids=image_ids,
+            username=st.session_state.get("username", "")
+        )
+        st.session_state.edit_results = {"data": data, "title": "Download Edited Logos", "edits": edits}
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else None
+        if status_code == 401:
+            st.error("Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/.")
+        elif status_code == 429:
+            st.error("API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan.")
+        elif status_code == 408:
+            st.error("Prompt rejected due to content moderation. Please revise your edit prompt to comply with Bria's ethical guidelines.")
+        else:
+            st.error(f"Error editing logo: {str(e)}")
+    except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
+@st.fragment
+def show_edit_downloads():
+    """Format options and download buttons; changing the format reruns only this fragment"""
+    results = st.session_state.get("edit_results")
+    if not results:
+        return
+    st.markdown(f'<div class="sub-header">{results["title"]}</div>', unsafe_allow_html=True)
+    show_format_options("edit_download", default="webp")
+    output_format, quality = selected_format("edit_download", default="webp")
+    for edit in results["edits"]:
+        if edit["blob_id"] is None:
+            continue
+        st.markdown('<div class="download-button">', unsafe_allow_html=True)
+        image_download_button(
+            edit["label"],
+            edit["blob_id"],
+            edit["file_stem"],
+            key=edit["key"],
+            output_format=output_format,
+            quality=quality
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def show_edit_results(download_column):
+    """Show the latest edited logos, with their downloads in download_column"""
+    results = st.session_state.get("edit_results")
+    if not results:
+        return
+    if results["data"] is not None:
+        # Debug: Show raw API response
+        with st.expander("Debug: View Raw API Response"):
+            st.json(results["data"])
+    for edit in results["edits"]:
+        if edit["blob_id"] is None:
+            st.error(f"No image URL found for result {edit['index']}. Please try a different edit prompt.")
+            continue
+        st.image(blob_path(edit["blob_id"]), caption=edit["caption"], use_column_width=True)
+        if edit["is_duplicate"]:
+            st.caption("This edit closely matches an image you generated before.")
+
+    # Display download buttons in right column
+    with download_column:
+        show_edit_downloads()
 
 def show_image_editor():
     # Custom CSS for professional styling (consistent with logo_generator.py)
@@ -75,6 +280,7 @@ def show_image_editor():
 
     # Main header
     st.markdown('<div class="main-header">Image Editor</div>', unsafe_allow_html=True)
+    show_backend_status("bria")
     st.markdown(
         """
         <div class="sub-header">
@@ -104,16 +310,16 @@ def show_image_editor():
 
     # Right column: Dedicated section for controls
     with col2:
-        with st.container():
-            st.markdown('<div class="sub-header">Edit Options</div>', unsafe_allow_html=True)
-            num_results = st.selectbox(
-                "Number of Logos to Edit",
-                options=[1, 2],
-                index=0,
-                key="num_results_edit"
-            )
-            st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
-            st.write("More settings coming soon (e.g., styles, influence levels).")
+        st.markdown('<div class="sub-header">Edit Options</div>', unsafe_allow_html=True)
+        # The mode changes the form, so it reruns the whole page; the other options only rerun their fragment
+        edit_mode = st.radio(
+            "Edit Mode",
+            options=["AI Reimagine (Bria)", "Local Preset"],
+            index=0,
+            key="edit_mode",
+            help="Local presets run instantly on the server with no API cost."
+        )
+        show_edit_options()
 
     # Left column: Form and image display
     with col1:
@@ -123,25 +329,37 @@ def show_image_editor():
                 type=["jpg", "jpeg", "png", "webp"],
                 key="image_upload"
             )
-            edit_prompt = st.text_input(
-                "Edit Description",
-                placeholder="e.g., Change the background to a modern office setting, add blue accents",
-                key="edit_prompt"
-            )
-            # Create columns for multiple edit buttons
-            btn_col1, btn_col2, btn_col3 = st.columns(3)
-            with btn_col1:
-                st.markdown('<div class="generate-base">', unsafe_allow_html=True)
-                edit_base = st.form_submit_button("Edit Base")
-                st.markdown('</div>', unsafe_allow_html=True)
-            with btn_col2:
-                st.markdown('<div class="generate-hd">', unsafe_allow_html=True)
-                edit_hd = st.form_submit_button("Edit HD")
-                st.markdown('</div>', unsafe_allow_html=True)
-            with btn_col3:
+            edit_base = edit_hd = edit_fast = apply_preset = False
+            if edit_mode == "Local Preset":
                 st.markdown('<div class="generate-fast">', unsafe_allow_html=True)
-                edit_fast = st.form_submit_button("Edit Fast")
+                apply_preset = st.form_submit_button("Apply Preset")
                 st.markdown('</div>', unsafe_allow_html=True)
+            else:
+                edit_prompt = st.text_input(
+                    "Edit Description",
+                    placeholder="e.g., Change the background to a modern office setting, add blue accents",
+                    key="edit_prompt"
+                )
+                # Create columns for multiple edit buttons
+                btn_col1, btn_col2, btn_col3 = st.columns(3)
+                with btn_col1:
+                    st.markdown('<div class="generate-base">', unsafe_allow_html=True)
+                    edit_base = st.form_submit_button("Edit Base")
+                    st.markdown('</div>', unsafe_allow_html=True)
+                with btn_col2:
+                    st.markdown('<div class="generate-hd">', unsafe_allow_html=True)
+                    edit_hd = st.form_submit_button("Edit HD")
+                    st.markdown('</div>', unsafe_allow_html=True)
+                with btn_col3:
+                    st.markdown('<div class="generate-fast">', unsafe_allow_html=True)
+                    edit_fast = st.form_submit_button("Edit Fast")
+                    st.markdown('</div>', unsafe_allow_html=True)
+
+            if apply_preset:
+                if not uploaded_image:
+                    st.error("Please upload an image to edit.")
+                else:
+                    run_preset_edit(uploaded_image)
 
             if edit_base or edit_hd or edit_fast:
                 if not uploaded_image:
@@ -156,81 +374,7 @@ def show_image_editor():
                         resolution = 1024  # High quality
                     else:  # edit_fast
                         resolution = 256  # Fast generation
+                    run_bria_edit(api_key, uploaded_image, edit_prompt, resolution)
 
-                    # Convert uploaded image to Base64
-                    image_bytes = uploaded_image.read()
-                    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-                    # Bria AI Reimagine API request
-                    url = "https://engine.prod.bria-api.com/v1/reimagine"
-                    payload = {
-                        "prompt": edit_prompt,
-                        "file": image_base64,
-                        "num_results": num_results,
-                        "sync": True,
-                        "height": resolution,
-                        "width": resolution
-                    }
-                    headers = {
-                        "Content-Type": "application/json",
-                        "api_token": api_key
-                    }
-
-                    try:
-                        response = requests.post(url, json=payload, headers=headers)
-                        response.raise_for_status()
-                        data = response.json()
-
-                        # Debug: Show raw API response
-                        with st.expander("Debug: View Raw API Response"):
-                            st.json(data)
-
-                        if "result" in data and data["result"]:
-                            # Store images for download in right column
-                            images = []
-                            for i, result in enumerate(data["result"]):
-                                if "urls" in result and result["urls"]:
-                                    # Fetch image from URL
-                                    image_url = result["urls"][0]
-                                    image_response = requests.get(image_url)
-                                    image_response.raise_for_status()
-                                    image = Image.open(io.BytesIO(image_response.content))
-                                    images.append(image)
-                                    
-                                    # Display the image in left column
-                                    st.image(image, caption=f"Edited Logo {i+1} ({resolution}x{resolution})", use_column_width=True)
-                                else:
-                                    st.error(f"No image URL found for result {i+1}. Please try a different edit prompt.")
-
-                            # Display download buttons in right column
-                            with col2:
-                                st.markdown('<div class="sub-header">Download Edited Logos</div>', unsafe_allow_html=True)
-                                for i, image in enumerate(images):
-                                    img_buffer = io.BytesIO()
-                                    image.save(img_buffer, format="PNG")
-                                    img_buffer.seek(0)
-                                    st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                                    st.download_button(
-                                        label=f"Download Edited Logo {i+1} as PNG",
-                                        data=img_buffer,
-                                        file_name=f"edited_logo_{i+1}.png",
-                                        mime="image/png",
-                                        key=f"download_edit_button_{i+1}"
-                                    )
-                                    st.markdown('</div>', unsafe_allow_html=True)
-                        else:
-                            st.error(
-                                "No images edited. Try a more specific edit prompt, e.g., "
-                                "'Change the background to a modern office setting, add blue accents'."
-                            )
-                    except requests.exceptions.HTTPError as e:
-                        if response.status_code == 401:
-                            st.error("Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/.")
-                        elif response.status_code == 429:
-                            st.error("API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan.")
-                        elif response.status_code == 408:
-                            st.error("Prompt rejected due to content moderation. Please revise your edit prompt to comply with Bria's ethical guidelines.")
-                        else:
-                            st.error(f"Error editing logo: {str(e)}")
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+        # Results persist in session state, so other widgets no longer wipe them
+        show_edit_results(col2)
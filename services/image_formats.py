@@ -0,0 +1,58 @@
+import io
+from PIL import Image
+
+# Download formats: label, file suffix and whether a quality setting applies.
+# Assets are stored once as lossless PNG; other formats are encoded from it on request.
+OUTPUT_FORMATS = {
+    "png": {"label": "PNG (lossless)", "suffix": ".png", "lossy": False},
+    "png8": {"label": "Optimized PNG (256 colors, best for flat logos)", "suffix": ".png", "lossy": False},
+    "webp": {"label": "WebP", "suffix": ".webp", "lossy": True},
+    "webp_lossless": {"label": "WebP (lossless)", "suffix": ".webp", "lossy": False},
+    "avif": {"label": "AVIF", "suffix": ".avif", "lossy": True},
+    "jpeg": {"label": "JPEG (best for photographic banners)", "suffix": ".jpg", "lossy": True}
+}
+DEFAULT_QUALITY = 85
+# Encoder effort; higher values shrink files a little at a large CPU cost
+WEBP_METHOD = 4
+AVIF_SPEED = 8
+
+def output_quality(output_format, quality=None):
+    """The quality an encode uses; None for lossless formats so they share one cached result"""
+    if not OUTPUT_FORMATS[output_format]["lossy"]:
+        return None
+    return DEFAULT_QUALITY if quality is None else max(1, min(int(quality), 100))
+
+def _flatten(image, background="#FFFFFF"):
+    # JPEG has no alpha channel, so transparent areas are filled in
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        flattened = Image.new("RGB", image.size, background)
+        flattened.paste(image, mask=image.getchannel("A"))
+        return flattened
+    return image.convert("RGB")
+
+def encode_image(image, output_format, quality=None):
+    """Encode a PIL image in one of OUTPUT_FORMATS and return the bytes"""
+    quality = output_quality(output_format, quality)
+    buffer = io.BytesIO()
+    if output_format == "png":
+        image.save(buffer, format="PNG")
+    elif output_format == "png8":
+        # Median cut does not support alpha, so transparent images use the octree quantizer
+        method = Image.Quantize.FASTOCTREE if image.mode in ("RGBA", "LA", "P") else Image.Quantize.MEDIANCUT
+        source = image.convert("RGBA") if method == Image.Quantize.FASTOCTREE else image.convert("RGB")
+        source.quantize(colors=256, method=method).save(buffer, format="PNG", optimize=True)
+    elif output_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=WEBP_METHOD)
+    elif output_format == "webp_lossless":
+        image.save(buffer, format="WEBP", lossless=True, method=WEBP_METHOD)
+    elif output_format == "avif":
+        image.save(buffer, format="AVIF", quality=quality, speed=AVIF_SPEED)
+    else:
+        _flatten(image).save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+def encode_bytes(image_bytes, output_format, quality=None):
+    """Re-encode stored image bytes (runs in worker processes)"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return encode_image(image, output_format, quality)
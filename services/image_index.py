@@ -0,0 +1,207 @@
+import os
+import time
+import uuid
+import itertools
+import numpy as np
+from PIL import Image
+from services.db import get_connection
+
+# Indexed images are written here, next to brandforge.db
+IMAGE_DIR = "brandforge_images"
+# pHash distance at or below which a new image counts as a duplicate
+DUPLICATE_DISTANCE = 4
+MAX_SEARCH_DISTANCE = 11
+HASH_BITS = 64
+NUM_CHUNKS = 4
+CHUNK_BITS = HASH_BITS // NUM_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+_HASH_SIZE = 8
+_PHASH_SIZE = 32
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT = _dct_matrix(_PHASH_SIZE)
+_BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(HASH_BITS - 1, -1, -1, dtype=np.uint64))
+
+_db_ready = False
+
+def _gray(image, size):
+    # Composite transparency onto white so transparent and white canvases hash alike
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        canvas = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        canvas.alpha_composite(image)
+        image = canvas
+    return np.asarray(image.convert("L").resize(size, Image.Resampling.BOX), dtype=np.float64)
+
+def _pack(bits):
+    """Pack rows of 64 booleans into unsigned 64-bit integers"""
+    return (bits.reshape(len(bits), HASH_BITS).astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+
+def phash_batch(images):
+    """Return the 64-bit DCT perceptual hashes of many images at once"""
+    pixels = np.stack([_gray(image, (_PHASH_SIZE, _PHASH_SIZE)) for image in images])
+    # 2D DCT of every image as two batched matrix products
+    coefficients = _DCT @ pixels @ _DCT.T
+    low = coefficients[:, :_HASH_SIZE, :_HASH_SIZE].reshape(len(images), -1)
+    # Median without the DC term, which only reflects overall brightness
+    medians = np.median(low[:, 1:], axis=1)
+    return [int(h) for h in _pack(low > medians[:, None])]
+
+def dhash_batch(images):
+    """Return the 64-bit difference hashes of many images at once"""
+    pixels = np.stack([_gray(image, (_HASH_SIZE + 1, _HASH_SIZE)) for image in images])
+    return [int(h) for h in _pack(pixels[:, :, 1:] > pixels[:, :, :-1])]
+
+def phash(image):
+    return phash_batch([image])[0]
+
+def dhash(image):
+    return dhash_batch([image])[0]
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def _to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+def _chunks(value):
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(NUM_CHUNKS)]
+
+def _chunk_variants(chunk, radius):
+    """All 16-bit values within `radius` bit flips of chunk"""
+    variants = [chunk]
+    for r in range(1, radius + 1):
+        for positions in itertools.combinations(range(CHUNK_BITS), r):
+            flipped = chunk
+            for position in positions:
+                flipped ^= 1 << position
+            variants.append(flipped)
+    return variants
+
+def init_index_db():
+    """Create the image hash index tables if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS image_hashes
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, source TEXT, label TEXT,
+                  path TEXT, phash INTEGER, dhash INTEGER,
+                  c0 INTEGER, c1 INTEGER, c2 INTEGER, c3 INTEGER, created_at REAL)''')
+    # Multi-index hashing: one index per 16-bit chunk of the pHash
+    for i in range(NUM_CHUNKS):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_image_hashes_c{i} ON image_hashes (c{i})")
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def _search(c, hash_value, max_distance, username=None, limit=None, dhash_value=None):
+    """Return (distance, row) pairs within max_distance of hash_value, nearest first.
+
+    Matches at the same pHash distance are ordered by dHash distance to
+    `dhash_value`, if given, and then newest first.
+    """
+    max_distance = min(max_distance, MAX_SEARCH_DISTANCE)
+    # Pigeonhole: some chunk is within max_distance // NUM_CHUNKS bits of the query's chunk
+    chunk_radius = max_distance // NUM_CHUNKS
+    clauses = []
+    params = []
+    for i, chunk in enumerate(_chunks(hash_value)):
+        variants = _chunk_variants(chunk, chunk_radius)
+        clauses.append(f"c{i} IN ({','.join('?' * len(variants))})")
+        params.extend(variants)
+    query = f'''SELECT id, username, source, label, path, phash, created_at, dhash FROM image_hashes
+                WHERE ({' OR '.join(clauses)})'''
+    if username is not None:
+        query += " AND username = ?"
+        params.append(username)
+    c.execute(query, params)
+    matches = []
+    for row in c.fetchall():
+        distance = hamming(hash_value, _to_unsigned(row[5]))
+        if distance <= max_distance:
+            # pHash distances are small integers, so ties are common
+            tie_break = 0
+            if dhash_value is not None and row[7] is not None:
+                tie_break = hamming(dhash_value, _to_unsigned(row[7]))
+            matches.append((distance, tie_break, row))
+    matches.sort(key=lambda match: (match[0], match[1], -match[2][6]))
+    matches = [(distance, row) for distance, _, row in matches]
+    return matches[:limit] if limit else matches
+
+def _record(distance, row):
+    return {
+        "id": row[0],
+        "username": row[1],
+        "source": row[2],
+        "label": row[3],
+        "path": row[4],
+        "distance": distance,
+        "created_at": row[6]
+    }
+
+def index_image(image, source, label, username=""):
+    """Hash and store a generated image unless a near-identical one is already indexed.
+
+    Returns (image_id, is_duplicate); for duplicates image_id is the existing entry.
+    """
+    init_index_db()
+    phash_value = phash(image)
+    dhash_value = dhash(image)
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        duplicates = _search(c, phash_value, DUPLICATE_DISTANCE, username=username, limit=1, dhash_value=dhash_value)
+        if duplicates:
+            return duplicates[0][1][0], True
+
+        os.makedirs(IMAGE_DIR, exist_ok=True)
+        path = os.path.join(IMAGE_DIR, f"{uuid.uuid4().hex}.png")
+        image.save(path, format="PNG", compress_level=1)
+        chunks = _chunks(phash_value)
+        c.execute('''INSERT INTO image_hashes
+                     (username, source, label, path, phash, dhash, c0, c1, c2, c3, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (username, source, label, path, _to_signed(phash_value), _to_signed(dhash_value),
+                   *chunks, time.time()))
+        conn.commit()
+        return c.lastrowid, False
+    finally:
+        conn.close()
+
+def find_similar(image, max_distance=10, limit=12, username=None):
+    """Return indexed images visually similar to `image`, nearest first"""
+    init_index_db()
+    conn = get_connection()
+    try:
+        matches = _search(
+            conn.cursor(), phash(image), max_distance, username=username, limit=limit, dhash_value=dhash(image)
+        )
+    finally:
+        conn.close()
+    return [_record(distance, row) for distance, row in matches]
+
+def get_indexed_images(image_ids):
+    """Return index records for the given ids, in the same order, skipping unknown ids"""
+    if not image_ids:
+        return []
+    init_index_db()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''SELECT id, username, source, label, path, phash, created_at FROM image_hashes
+                  WHERE id IN ({','.join('?' * len(image_ids))})''', list(image_ids))
+    rows = {row[0]: row for row in c.fetchall()}
+    conn.close()
+    return [_record(0, rows[image_id]) for image_id in image_ids if image_id in rows]
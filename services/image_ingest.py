@@ -0,0 +1,83 @@
+import io
+import warnings
+from PIL import Image
+
+# Ceilings for any image read from the network or an upload; the decoded size of
+# an accepted image is at most MAX_IMAGE_PIXELS * 4 bytes (RGBA)
+MAX_IMAGE_BYTES = 12 * 1024 * 1024
+MAX_IMAGE_PIXELS = 4096 * 4096
+ALLOWED_FORMATS = ("PNG", "JPEG", "WEBP")
+CHUNK_SIZE = 64 * 1024
+
+# Backstop for images opened elsewhere: PIL refuses anything over twice this
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+class ImageRejectedError(ValueError):
+    """Raised for data that is not an accepted image format"""
+
+class ImageTooLargeError(ImageRejectedError):
+    """Raised for images over the byte or pixel ceiling"""
+
+def check_content_length(content_length, max_bytes=MAX_IMAGE_BYTES):
+    """Reject a body from its declared length before reading any of it"""
+    if content_length is None:
+        return
+    try:
+        content_length = int(content_length)
+    except (TypeError, ValueError):
+        raise ImageRejectedError("Content-Length must be a non-negative integer.") from None
+    if content_length < 0:
+        raise ImageRejectedError("Content-Length must be a non-negative integer.")
+    if content_length > max_bytes:
+        raise ImageTooLargeError(f"Image is larger than {max_bytes // (1024 * 1024)}MB.")
+
+def read_limited(chunks, max_bytes=MAX_IMAGE_BYTES):
+    """Join byte chunks, stopping as soon as they exceed max_bytes"""
+    data = bytearray()
+    for chunk in chunks:
+        data += chunk
+        check_content_length(len(data), max_bytes)
+    return bytes(data)
+
+async def aread_limited(chunks, max_bytes=MAX_IMAGE_BYTES):
+    """Async variant of read_limited"""
+    data = bytearray()
+    async for chunk in chunks:
+        data += chunk
+        check_content_length(len(data), max_bytes)
+    return bytes(data)
+
+def open_image(data):
+    """Open encoded image bytes after checking the format and dimensions in the header.
+
+    Only the header is parsed here; pixels are decoded when the image is
+    first used, e.g. by load(), and never for a rejected image.
+    """
+    too_large = f"Image is larger than {MAX_IMAGE_PIXELS // 1_000_000} megapixels."
+    try:
+        # PIL checks the declared size in Image.open itself: it warns above
+        # Image.MAX_IMAGE_PIXELS and raises above twice that
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(data), formats=ALLOWED_FORMATS)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ImageTooLargeError(too_large) from None
+    except (Image.UnidentifiedImageError, OSError):
+        # Also covers truncated or corrupt headers of an otherwise recognized format
+        raise ImageRejectedError("Image must be a PNG, JPEG or WebP file.") from None
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f"Image is {image.width}x{image.height}; at most {MAX_IMAGE_PIXELS // 1_000_000} megapixels are supported."
+        )
+    return image
+
+def read_upload(upload):
+    """Return the bytes of a Streamlit upload once its size and header are validated"""
+    check_content_length(upload.size)
+    data = upload.getvalue()
+    open_image(data)
+    return data
+
+def open_upload(upload):
+    """Open a Streamlit upload as a lazily decoded image"""
+    return open_image(read_upload(upload))
@@ -0,0 +1,24 @@
+import functools
+from langchain_google_genai import ChatGoogleGenerativeAI
+from services.llm_cache import PromptCache
+
+GEMINI_MODEL = "gemini-2.0-flash"
+# Bounded so a degraded Gemini fails within a minute instead of retrying for several
+REQUEST_TIMEOUT = 60
+MAX_RETRIES = 2
+
+@functools.lru_cache(maxsize=16)
+def get_llm(google_api_key, max_tokens, temperature=0.7, tool=None):
+    """Return a shared Gemini chat model for the given API key and token budget.
+
+    When a tool name is given, responses are cached per tool in the prompt cache.
+    """
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        google_api_key=google_api_key,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=MAX_RETRIES,
+        cache=PromptCache(tool) if tool else None
+    )
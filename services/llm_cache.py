@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import time
+import hashlib
+import random
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+from services.db import get_connection
+
+# Time-to-live of cached responses per tool, in seconds
+TOOL_TTLS = {
+    "brand_story": 24 * 3600,
+    "caption": 24 * 3600,
+    "style_guide": 7 * 24 * 3600
+}
+DEFAULT_TTL = 24 * 3600
+
+# Near-duplicate tier settings; the tier is off unless enabled
+NEAR_DUPLICATE_ENABLED = os.getenv("BRANDFORGE_LLM_CACHE_NEAR_DUP", "0") == "1"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("BRANDFORGE_LLM_CACHE_THRESHOLD", "0.9"))
+
+# MinHash over character shingles, bucketed with LSH bands for sub-linear lookup
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1729)
+_PERM_A = np.array([_rng.randint(1, _MAX_HASH) for _ in range(NUM_PERM)], dtype=np.uint64)
+_PERM_B = np.array([_rng.randint(0, _MAX_HASH) for _ in range(NUM_PERM)], dtype=np.uint64)
+
+_db_ready = False
+
+def init_cache_db():
+    """Create the prompt cache tables if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                 (key TEXT PRIMARY KEY, tool TEXT, llm_hash TEXT, signature BLOB,
+                  response TEXT, created_at REAL)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_llm_cache_tool_created
+                 ON llm_cache (tool, created_at)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_cache_bands
+                 (tool TEXT, llm_hash TEXT, band INTEGER, bucket TEXT, key TEXT)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_llm_cache_bands_lookup
+                 ON llm_cache_bands (tool, llm_hash, band, bucket)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_llm_cache_bands_key
+                 ON llm_cache_bands (key)''')
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def split_prompt(prompt):
+    """Split a serialized chat prompt into (fixed context, free text), or (prompt, None).
+
+    The free text is the only human message of a prompt whose instructions live
+    in system messages; only it is compared for near-duplicates. The system
+    prompt with its parameters (word count, angle, tool options) and any numbers
+    in the free text must match exactly. Prompts of any other shape, such as a
+    single templated message or a story plus feedback, are only cached exactly.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt, None
+    if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+        return prompt, None
+    kwargs = [message.get("kwargs", {}) for message in messages]
+    human = [k.get("content") for k in kwargs if k.get("type") == "human"]
+    system = [k.get("content") for k in kwargs if k.get("type") == "system"]
+    if len(human) != 1 or not isinstance(human[0], str) or not system or len(system) + 1 != len(messages):
+        return prompt, None
+    free_text = human[0]
+    context = json.dumps({"system": system, "numbers": re.findall(r"\d+", free_text)})
+    return context, free_text
+
+def normalize_prompt(text):
+    """Lowercase a prompt and drop punctuation and repeated whitespace"""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+def minhash_signature(text):
+    """Return the MinHash signature of the character shingles of a normalized prompt"""
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big") for s in shingles],
+        dtype=np.uint64
+    )
+    # (a * h + b) mod p stays below 2**64 because a, b and h are 32-bit
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+def _band_buckets(signature):
+    return [
+        (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes().hex())
+        for band in range(NUM_BANDS)
+    ]
+
+class PromptCache(BaseCache):
+    """Two-tier LangChain cache: exact prompt hashes plus optional MinHash near-duplicates"""
+
+    def __init__(self, tool, ttl=None, near_duplicate=None, threshold=None):
+        self.tool = tool
+        self.ttl = ttl if ttl is not None else TOOL_TTLS.get(tool, DEFAULT_TTL)
+        self.near_duplicate = NEAR_DUPLICATE_ENABLED if near_duplicate is None else near_duplicate
+        self.threshold = NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        init_cache_db()
+
+    def _key(self, prompt, llm_string):
+        return _sha256(f"{self.tool}\0{llm_string}\0{prompt}")
+
+    def _scope(self, llm_string, context):
+        # Stored in the llm_hash columns: near-duplicates only match under the same model settings and context
+        return _sha256(f"{llm_string}\0{context}")
+
+    def lookup(self, prompt, llm_string):
+        conn = get_connection()
+        c = conn.cursor()
+        oldest = time.time() - self.ttl
+        try:
+            # Tier one: exact match on the full prompt and model settings
+            c.execute("SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+                      (self._key(prompt, llm_string), oldest))
+            row = c.fetchone()
+            if row:
+                return [Generation(text=text) for text in json.loads(row[0])]
+            if not self.near_duplicate:
+                return None
+
+            context, free_text = split_prompt(prompt)
+            if free_text is None:
+                return None
+
+            # Tier two: candidates with the same context sharing any LSH band, ranked by estimated Jaccard similarity
+            signature = minhash_signature(normalize_prompt(free_text))
+            buckets = _band_buckets(signature)
+            clauses = " OR ".join(["(b.band = ? AND b.bucket = ?)"] * len(buckets))
+            params = [self.tool, self._scope(llm_string, context), oldest]
+            for band, bucket in buckets:
+                params.extend([band, bucket])
+            c.execute(f'''SELECT DISTINCT c.key, c.signature, c.response
+                          FROM llm_cache_bands b JOIN llm_cache c ON c.key = b.key
+                          WHERE b.tool = ? AND b.llm_hash = ? AND c.created_at >= ?
+                          AND ({clauses})''', params)
+            best_score, best_response = 0.0, None
+            for _, stored, response in c.fetchall():
+                score = float(np.mean(np.frombuffer(stored, dtype=np.uint32) == signature))
+                if score > best_score:
+                    best_score, best_response = score, response
+            if best_response is not None and best_score >= self.threshold:
+                return [Generation(text=text) for text in json.loads(best_response)]
+            return None
+        finally:
+            conn.close()
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        context, free_text = split_prompt(prompt)
+        llm_hash = self._scope(llm_string, context)
+        signature = minhash_signature(normalize_prompt(free_text)) if free_text is not None else None
+        response = json.dumps([generation.text for generation in return_val])
+        now = time.time()
+        conn = get_connection()
+        c = conn.cursor()
+        try:
+            c.execute('''INSERT OR REPLACE INTO llm_cache (key, tool, llm_hash, signature, response, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?)''',
+                      (key, self.tool, llm_hash, signature.tobytes() if signature is not None else None, response, now))
+            c.execute("DELETE FROM llm_cache_bands WHERE key = ?", (key,))
+            if signature is not None:
+                c.executemany('''INSERT INTO llm_cache_bands (tool, llm_hash, band, bucket, key)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              [(self.tool, llm_hash, band, bucket, key) for band, bucket in _band_buckets(signature)])
+            self._sweep(c, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _sweep(self, c, now):
+        # Drop this tool's expired entries so the tables stay bounded
+        oldest = now - self.ttl
+        c.execute('''DELETE FROM llm_cache_bands WHERE key IN
+                     (SELECT key FROM llm_cache WHERE tool = ? AND created_at < ?)''', (self.tool, oldest))
+        c.execute("DELETE FROM llm_cache WHERE tool = ? AND created_at < ?", (self.tool, oldest))
+
+    def clear(self, **kwargs):
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute("DELETE FROM llm_cache_bands WHERE tool = ?", (self.tool,))
+        c.execute("DELETE FROM llm_cache WHERE tool = ?", (self.tool,))
+        conn.commit()
+        conn.close()
@@ -0,0 +1,157 @@
+import io
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageColor, ImageFilter
+from services.image_ingest import open_image
+
+# Mechanical edits that run locally instead of through Bria Reimagine
+LOCAL_PRESETS = {
+    "Recolor to Brand Color": "recolor",
+    "Pad to Aspect Ratio": "pad",
+    "Add Solid Background": "background",
+    "Grayscale": "grayscale",
+    "Monochrome": "monochrome"
+}
+ASPECT_RATIOS = {
+    "1:1 (Square)": (1, 1),
+    "4:5 (Instagram Portrait)": (4, 5),
+    "9:16 (Story)": (9, 16),
+    "16:9 (Widescreen)": (16, 9),
+    "1.91:1 (Banner)": (191, 100)
+}
+ALPHA_THRESHOLD = 128
+BACKGROUND_STD = 12.0
+# Distance from the background color at which a pixel counts as fully foreground
+FOREGROUND_DISTANCE = 96.0
+MONOCHROME_THRESHOLD = 128
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Light sharpening after upscaling to offset Lanczos softening of flat logo edges
+UPSCALE_SHARPEN = ImageFilter.UnsharpMask(radius=1.0, percent=60, threshold=2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _rgba(image):
+    return np.asarray(image.convert("RGBA"), dtype=np.float32)
+
+def _luminance(rgb):
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def _background_color(array):
+    # The border color, when the border is opaque and uniform
+    border = np.concatenate([array[0], array[-1], array[:, 0], array[:, -1]])
+    if np.any(border[:, 3] < ALPHA_THRESHOLD) or np.max(border[:, :3].std(axis=0)) > BACKGROUND_STD:
+        return None
+    return np.median(border[:, :3], axis=0)
+
+def recolor(image, color):
+    """Paint the foreground of a flat logo in one brand color, keeping edges and transparency"""
+    array = _rgba(image)
+    target = np.array(ImageColor.getrgb(color)[:3], dtype=np.float32)
+    background = _background_color(array)
+    if background is None:
+        # Transparent canvas: alpha already separates the logo from the background
+        array[..., :3] = target
+    else:
+        strength = np.linalg.norm(array[..., :3] - background, axis=-1) / FOREGROUND_DISTANCE
+        strength = np.clip(strength, 0.0, 1.0)[..., None]
+        array[..., :3] = background * (1.0 - strength) + target * strength
+    return Image.fromarray(np.round(array).astype(np.uint8), "RGBA")
+
+def pad_to_aspect(image, ratio, color=None):
+    """Center the image on a canvas of the given aspect ratio, padding with a color or transparency"""
+    width, height = image.size
+    ratio_w, ratio_h = ratio
+    if width * ratio_h >= height * ratio_w:
+        canvas_size = (width, round(width * ratio_h / ratio_w))
+    else:
+        canvas_size = (round(height * ratio_w / ratio_h), height)
+    fill = ImageColor.getrgb(color)[:3] + (255,) if color else (0, 0, 0, 0)
+    canvas = Image.new("RGBA", canvas_size, fill)
+    offset = ((canvas_size[0] - width) // 2, (canvas_size[1] - height) // 2)
+    canvas.alpha_composite(image.convert("RGBA"), offset)
+    return canvas
+
+def add_background(image, color):
+    """Flatten transparency onto a solid background color"""
+    canvas = Image.new("RGBA", image.size, ImageColor.getrgb(color)[:3] + (255,))
+    canvas.alpha_composite(image.convert("RGBA"))
+    return canvas.convert("RGB")
+
+def grayscale(image):
+    """Convert to grayscale, keeping transparency"""
+    array = _rgba(image)
+    array[..., :3] = _luminance(array[..., :3])[..., None]
+    return Image.fromarray(np.round(array).astype(np.uint8), "RGBA")
+
+def monochrome(image, color="#000000", threshold=MONOCHROME_THRESHOLD):
+    """Reduce to a single ink color on white (or transparency) by luminance threshold"""
+    array = _rgba(image)
+    ink = np.array(ImageColor.getrgb(color)[:3], dtype=np.float32)
+    dark = _luminance(array[..., :3]) < threshold
+    array[..., :3] = np.where(dark[..., None], ink, 255.0)
+    array[..., 3] = np.where(dark, array[..., 3], np.where(array[..., 3] >= ALPHA_THRESHOLD, 255.0, 0.0))
+    return Image.fromarray(np.round(array).astype(np.uint8), "RGBA")
+
+def upscale(image, size):
+    """Enlarge an image so its longest side is `size`, with Lanczos resampling and light sharpening"""
+    scale = size / max(image.size)
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    upscaled = image.convert("RGBA").resize(target, Image.Resampling.LANCZOS)
+    return upscaled.filter(UPSCALE_SHARPEN)
+
+def apply_preset(image, preset, color="#000000", aspect_ratio="1:1 (Square)", pad_color=None):
+    """Apply a LOCAL_PRESETS edit to a PIL image"""
+    operation = LOCAL_PRESETS[preset]
+    if operation == "recolor":
+        return recolor(image, color)
+    if operation == "pad":
+        return pad_to_aspect(image, ASPECT_RATIOS[aspect_ratio], pad_color)
+    if operation == "background":
+        return add_background(image, color)
+    if operation == "grayscale":
+        return grayscale(image)
+    return monochrome(image, color)
+
+def apply_preset_bytes(image_bytes, preset, **options):
+    """Apply a preset to encoded image bytes and return PNG bytes (runs in worker processes)"""
+    image = open_image(image_bytes)
+    result = apply_preset(image, preset, **options)
+    img_buffer = io.BytesIO()
+    result.save(img_buffer, format="PNG")
+    return img_buffer.getvalue()
+
+def upscale_bytes(image_bytes, size):
+    """Upscale encoded image bytes and return PNG bytes (runs in worker processes)"""
+    result = upscale(open_image(image_bytes), size)
+    img_buffer = io.BytesIO()
+    result.save(img_buffer, format="PNG")
+    return img_buffer.getvalue()
+
+def get_executor():
+    """Return the shared process pool for local edits"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn avoids forking a multi-threaded server process
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def run_local_edit(image_bytes, preset, **options):
+    """Run a preset in the process pool and return the edited PIL image"""
+    future = get_executor().submit(apply_preset_bytes, image_bytes, preset, **options)
+    return Image.open(io.BytesIO(future.result()))
+
+def run_upscale(image_bytes, size):
+    """Run upscale in the process pool and return the enlarged PIL image"""
+    future = get_executor().submit(upscale_bytes, image_bytes, size)
+    return Image.open(io.BytesIO(future.result()))
+
+async def arun_local_edit(image_bytes, preset, **options):
+    """Async variant of run_local_edit"""
+    future = get_executor().submit(apply_preset_bytes, image_bytes, preset, **options)
+    return Image.open(io.BytesIO(await asyncio.wrap_future(future)))
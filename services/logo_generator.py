@@ -1,9 +1,314 @@
 import streamlit as st
 import requests
-import io
-from PIL import Image
 import os
 import json
+from services import bria_client
+from services.gallery import add_to_gallery, get_gallery
+from services.downloads import store_image, blob_path, read_blob, show_format_options, selected_format, image_download_button
+from services.local_edits import run_upscale
+from services.image_index import find_similar, MAX_SEARCH_DISTANCE
+from services.history import record_generation, find_previous_images, request_key
+from services.single_flight import single_flight, asingle_flight, encode_image_result, decode_image_result
+from services.usage import metered, mark_shared, QuotaExceededError
+from services.circuit_breaker import CircuitOpenError, show_backend_status
+from services.admission import queued, AdmissionRejectedError
+from services.image_ingest import open_upload, ImageRejectedError
+
+# Logos are explored as fast previews; higher resolutions are only made for a chosen result
+PREVIEW_RESOLUTION = 256
+HD_RESOLUTIONS = (512, 1024)
+HD_METHODS = ["Regenerate (same seed)", "Upscale locally"]
+
+def generate_logos(api_key, prompt, num_results, resolution, seed=None):
+    """Generate square logos with Bria and return the raw response and fetched images.
+
+    Identical requests already in flight share one Bria call. Pass the seed of
+    an earlier result to regenerate that logo, e.g. at a higher resolution.
+    """
+    def call():
+        data = bria_client.text_to_image(
+            api_key,
+            f"Professional logo: {prompt}",
+            num_results,
+            resolution,
+            resolution,
+            seed
+        )
+        return data, bria_client.load_images(bria_client.fetch_result_images(data))
+
+    key = request_key("logo", prompt, {"num_results": num_results, "resolution": resolution, "seed": seed})
+    result, shared = single_flight(key, call, encode_image_result, decode_image_result)
+    if shared:
+        mark_shared()
+    return result
+
+async def agenerate_logos(api_key, prompt, num_results, resolution, seed=None):
+    """Async variant of generate_logos for event-loop callers"""
+    async def call():
+        data = await bria_client.atext_to_image(
+            api_key,
+            f"Professional logo: {prompt}",
+            num_results,
+            resolution,
+            resolution,
+            seed
+        )
+        return data, bria_client.load_images(await bria_client.afetch_result_images(data))
+
+    key = request_key("logo", prompt, {"num_results": num_results, "resolution": resolution, "seed": seed})
+    result, shared = await asingle_flight(key, call, encode_image_result, decode_image_result)
+    if shared:
+        mark_shared()
+    return result
+
+@st.fragment
+def show_similar_logo_search():
+    """Search earlier logos of the current user by perceptual hash"""
+    with st.expander("Find Similar Logos"):
+        gallery = get_gallery()
+        source_labels = ["Upload an image"] + [entry["label"] for entry in gallery]
+        similar_source = st.selectbox(
+            "Search With",
+            options=range(len(source_labels)),
+            index=len(gallery),
+            format_func=lambda i: source_labels[i],
+            key="similar_source"
+        )
+        similar_upload = None
+        if similar_source == 0:
+            similar_upload = st.file_uploader(
+                "Logo Image",
+                type=["jpg", "jpeg", "png", "webp"],
+                key="similar_upload"
+            )
+        max_distance = st.slider(
+            "Match Tolerance",
+            min_value=0,
+            max_value=MAX_SEARCH_DISTANCE,
+            value=10,
+            key="similar_distance",
+            help="Maximum number of differing bits between perceptual hashes."
+        )
+        if st.button("Find Similar", key="find_similar_button"):
+            if similar_source > 0:
+                query_image = gallery[similar_source - 1]["image"]
+            elif similar_upload:
+                try:
+                    query_image = open_upload(similar_upload)
+                except ImageRejectedError as e:
+                    st.error(str(e))
+                    return
+            else:
+                st.error("Please upload a logo image or generate one first.")
+                return
+            try:
+                matches = find_similar(query_image, max_distance=max_distance, username=st.session_state.get("username", ""))
+            except Exception as e:
+                st.error(f"Error searching similar logos: {str(e)}")
+                return
+            matches = [match for match in matches if os.path.exists(match["path"])]
+            if not matches:
+                st.info("No similar logos found.")
+            result_cols = st.columns(3)
+            for i, match in enumerate(matches):
+                with result_cols[i % 3]:
+                    st.image(match["path"], caption=f"{match['label']} (distance {match['distance']})", use_column_width=True)
+
+@st.fragment
+def show_logo_options():
+    """Generation options; changing them reruns only this fragment"""
+    with st.container():
+        st.markdown('<div class="sub-header">Generation Options</div>', unsafe_allow_html=True)
+        st.selectbox(
+            "Number of Logos to Generate",
+            options=[1, 2],
+            index=0,
+            key="num_results"
+        )
+        st.checkbox(
+            "Reuse earlier results for repeated prompts",
+            value=True,
+            key="reuse_previous_logos",
+            help="Show your stored logos for an identical prompt and resolution instead of calling Bria again."
+        )
+        st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
+        st.write("More settings coming soon (e.g., styles, colors).")
+
+def run_logo_generation(api_key, prompt):
+    """Generate preview logos for a submitted prompt and keep references to them in session state"""
+    resolution = PREVIEW_RESOLUTION
+    num_results = st.session_state.get("num_results", 1)
+    reuse_previous = st.session_state.get("reuse_previous_logos", True)
+    try:
+        username = st.session_state.get("username", "")
+        params = {"num_results": num_results, "resolution": resolution}
+        previous = find_previous_images("logo", prompt, params, username) if reuse_previous else None
+        if previous:
+            data, fetched_images = previous
+        else:
+            # Bria AI API request
+            with metered(username, "logo", num_results, resolution), queued("logo"):
+                data, fetched_images = generate_logos(api_key, prompt, num_results, resolution)
+
+        if not ("result" in data and data["result"]):
+            st.session_state.logo_results = None
+            st.error(
+                "No images generated. Try a more specific prompt, e.g., "
+                "'A minimalist logo for a coffee shop, brown and green, with a coffee bean icon'."
+            )
+            return
+
+        logos = []
+        image_ids = []
+        image_seeds = []
+        seeds = bria_client.result_seeds(data)
+        for i, image in enumerate(fetched_images):
+            logo = {"index": i + 1, "blob_id": None, "is_duplicate": False, "hd_blob_id": None,
+                    "seed": seeds[i] if i < len(seeds) else None}
+            if image is not None:
+                image_id, is_duplicate = add_to_gallery(image, "logo", f"Logo {i+1}: {prompt}")
+                image_ids.append(image_id)
+                image_seeds.append(logo["seed"])
+                # Encode once to disk; session state only keeps the blob reference
+                logo["blob_id"] = store_image(image)
+                logo["is_duplicate"] = is_duplicate and not previous
+            logos.append(logo)
+        if not previous:
+            record_generation("logo", prompt, params=params, image_ids=image_ids, username=username, seeds=image_seeds)
+
+        st.session_state.logo_results = {
+            "data": data,
+            "prompt": prompt,
+            "resolution": resolution,
+            "reused": previous is not None,
+            "logos": logos
+        }
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else None
+        if status_code == 401:
+            st.error("Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/.")
+        elif status_code == 429:
+            st.error("API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan.")
+        else:
+            st.error(f"Error generating logo: {str(e)}")
+    except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
+def upgrade_logo_to_hd(api_key, prompt, logo, method, resolution):
+    """Produce a higher resolution version of one preview logo, by seeded regeneration or local upscaling"""
+    if method == HD_METHODS[0] and logo["seed"] is None:
+        # Without a seed Bria would draw a different logo, so upscale instead and say so
+        method = HD_METHODS[1]
+        logo["hd_fallback"] = True
+    if method == HD_METHODS[0]:
+        with metered(st.session_state.get("username", ""), "logo_hd", 1, resolution), queued("logo"):
+            data, images = generate_logos(api_key, prompt, 1, resolution, seed=logo["seed"])
+        image = images[0] if images else None
+        if image is None:
+            raise ValueError("Bria returned no image for the HD regeneration.")
+    else:
+        image = run_upscale(read_blob(logo["blob_id"]), resolution)
+    image_id, _ = add_to_gallery(image, "logo", f"Logo {logo['index']} HD: {prompt}")
+    record_generation(
+        "logo", prompt,
+        params={"num_results": 1, "resolution": resolution, "seed": logo["seed"], "method": method},
+        image_ids=[image_id],
+        username=st.session_state.get("username", "")
+    )
+    logo["hd_blob_id"] = store_image(image)
+    logo["hd_method"] = method
+    logo["hd_resolution"] = resolution
+
+def show_logo_results(api_key, download_column):
+    """Show the latest logos with HD upgrade actions and their download buttons"""
+    results = st.session_state.get("logo_results")
+    if not results:
+        return
+    if results["reused"]:
+        st.info("Showing your earlier logos for this exact prompt. Untick 'Reuse earlier results' to generate new ones.")
+
+    # Debug: Show raw API response
+    with st.expander("Debug: View Raw API Response"):
+        st.json(results["data"])
+
+    resolution = results["resolution"]
+    hd_resolutions = [hd_resolution for hd_resolution in HD_RESOLUTIONS if hd_resolution > resolution]
+    upgradable = hd_resolutions and any(logo["blob_id"] for logo in results["logos"])
+    if upgradable:
+        hd_method = st.radio(
+            "HD Upgrade Method",
+            options=HD_METHODS,
+            index=0,
+            horizontal=True,
+            key="hd_upgrade_method",
+            help="Regenerating reuses the preview's seed for a Bria render at the chosen size; upscaling runs locally at no API cost."
+        )
+    for logo in results["logos"]:
+        if logo["blob_id"] is None:
+            st.error(f"No image URL found for result {logo['index']}. Please try a different prompt.")
+            continue
+        st.image(blob_path(logo["blob_id"]), caption=f"Generated Logo {logo['index']} ({resolution}x{resolution})", use_column_width=True)
+        if logo["is_duplicate"]:
+            st.caption("This logo closely matches one you generated before.")
+        if upgradable and not logo.get("hd_blob_id"):
+            if hd_method == HD_METHODS[0] and logo["seed"] is None:
+                st.caption("No seed was recorded for this logo, so it will be upscaled locally.")
+            hd_resolution = st.selectbox(
+                f"HD Size for Logo {logo['index']}",
+                options=hd_resolutions,
+                index=len(hd_resolutions) - 1,
+                format_func=lambda size: f"{size}x{size}",
+                key=f"upgrade_logo_resolution_{logo['index']}"
+            )
+            if st.button(f"Upgrade Logo {logo['index']} to HD", key=f"upgrade_logo_button_{logo['index']}"):
+                try:
+                    with st.spinner("Creating HD version..."):
+                        upgrade_logo_to_hd(api_key, results["prompt"], logo, hd_method, hd_resolution)
+                except requests.exceptions.HTTPError as e:
+                    status_code = e.response.status_code if e.response is not None else None
+                    st.error(bria_client.error_message(status_code, "upgrading logo"))
+                except (QuotaExceededError, CircuitOpenError, AdmissionRejectedError) as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.error(f"An error occurred: {str(e)}")
+        if logo.get("hd_blob_id"):
+            if logo.get("hd_fallback"):
+                st.warning(f"No seed was recorded for Logo {logo['index']}, so it was upscaled locally instead of regenerated.")
+            st.image(
+                blob_path(logo["hd_blob_id"]),
+                caption=f"Logo {logo['index']} HD ({logo['hd_resolution']}x{logo['hd_resolution']}, {logo['hd_method'].lower()})",
+                use_column_width=True
+            )
+
+    # Display download buttons in right column
+    with download_column:
+        st.markdown('<div class="sub-header">Download Logos</div>', unsafe_allow_html=True)
+        show_format_options("logo_download", default="png8")
+        output_format, quality = selected_format("logo_download", default="png8")
+        for logo in results["logos"]:
+            if logo["blob_id"] is None:
+                continue
+            st.markdown('<div class="download-button">', unsafe_allow_html=True)
+            image_download_button(
+                f"Download Logo {logo['index']}",
+                logo["blob_id"],
+                f"generated_logo_{logo['index']}",
+                key=f"download_logo_button_{logo['index']}",
+                output_format=output_format,
+                quality=quality
+            )
+            if logo.get("hd_blob_id"):
+                image_download_button(
+                    f"Download Logo {logo['index']} HD",
+                    logo["hd_blob_id"],
+                    f"generated_logo_{logo['index']}_hd",
+                    key=f"download_logo_hd_button_{logo['index']}",
+                    output_format=output_format,
+                    quality=quality
+                )
+            st.markdown('</div>', unsafe_allow_html=True)
 
 def show_logo_generator():
     # Custom CSS for professional styling
@@ -32,14 +337,6 @@ def show_logo_generator():
             padding: 8px 16px;
             font-weight: bold;
         }
-        .generate-base>button {
-            background-color: #3498db;
-            color: white;
-        }
-        .generate-hd>button {
-            background-color: #2ecc71;
-            color: white;
-        }
         .generate-fast>button {
             background-color: #e67e22;
             color: white;
@@ -69,6 +366,7 @@ def show_logo_generator():
 
     # Main header
     st.markdown('<div class="main-header">Logo Generator</div>', unsafe_allow_html=True)
+    show_backend_status("bria")
     st.markdown(
         """
         <div class="sub-header">
@@ -90,16 +388,7 @@ def show_logo_generator():
 
     # Right column: Dedicated section for controls
     with col2:
-        with st.container():
-            st.markdown('<div class="sub-header">Generation Options</div>', unsafe_allow_html=True)
-            num_results = st.selectbox(
-                "Number of Logos to Generate",
-                options=[1, 2],
-                index=0,
-                key="num_results"
-            )
-            st.markdown('<div class="sub-header">Additional Options</div>', unsafe_allow_html=True)
-            st.write("More settings coming soon (e.g., styles, colors).")
+        show_logo_options()
 
     # Left column: Form and image display
     with col1:
@@ -109,101 +398,22 @@ def show_logo_generator():
                 placeholder="e.g., A modern logo for a tech startup, blue and silver, geometric design",
                 key="logo_prompt"
             )
-            # Create columns for multiple generate buttons
-            btn_col1, btn_col2, btn_col3 = st.columns(3)
-            with btn_col1:
-                st.markdown('<div class="generate-base">', unsafe_allow_html=True)
-                generate_base = st.form_submit_button("Generate Base")
-                st.markdown('</div>', unsafe_allow_html=True)
-            with btn_col2:
-                st.markdown('<div class="generate-hd">', unsafe_allow_html=True)
-                generate_hd = st.form_submit_button("Generate HD")
-                st.markdown('</div>', unsafe_allow_html=True)
-            with btn_col3:
-                st.markdown('<div class="generate-fast">', unsafe_allow_html=True)
-                generate_fast = st.form_submit_button("Generate Fast")
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            if generate_base or generate_hd or generate_fast:
+            st.caption(
+                f"Logos are generated as fast {PREVIEW_RESOLUTION}x{PREVIEW_RESOLUTION} previews; "
+                "upgrade the one you like to HD below."
+            )
+            st.markdown('<div class="generate-fast">', unsafe_allow_html=True)
+            generate_fast = st.form_submit_button("Generate Fast")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+            if generate_fast:
                 if not prompt:
                     st.error("Please enter a brand description.")
                 else:
-                    # Set resolution based on button
-                    if generate_base:
-                        resolution = 512  # Standard quality
-                    elif generate_hd:
-                        resolution = 1024  # High quality
-                    else:  # generate_fast
-                        resolution = 256  # Fast generation
-
-                    # Bria AI API request
-                    model_version = "2.3"
-                    url = f"https://engine.prod.bria-api.com/v1/text-to-image/base/{model_version}"
-                    payload = {
-                        "prompt": f"Professional logo: {prompt}",
-                        "num_results": num_results,
-                        "sync": True,
-                        "height": resolution,
-                        "width": resolution
-                    }
-                    headers = {
-                        "Content-Type": "application/json",
-                        "api_token": api_key
-                    }
-
-                    try:
-                        response = requests.post(url, json=payload, headers=headers)
-                        response.raise_for_status()
-                        data = response.json()
-
-                        # Debug: Show raw API response
-                        with st.expander("Debug: View Raw API Response"):
-                            st.json(data)
-
-                        if "result" in data and data["result"]:
-                            # Store images for download in right column
-                            images = []
-                            for i, result in enumerate(data["result"]):
-                                if "urls" in result and result["urls"]:
-                                    # Fetch image from URL
-                                    image_url = result["urls"][0]
-                                    image_response = requests.get(image_url)
-                                    image_response.raise_for_status()
-                                    image = Image.open(io.BytesIO(image_response.content))
-                                    images.append(image)
-                                    
-                                    # Display the image in left column
-                                    st.image(image, caption=f"Generated Logo {i+1} ({resolution}x{resolution})", use_column_width=True)
-                                else:
-                                    st.error(f"No image URL found for result {i+1}. Please try a different prompt.")
-
-                            # Display download buttons in right column
-                            with col2:
-                                st.markdown('<div class="sub-header">Download Logos</div>', unsafe_allow_html=True)
-                                for i, image in enumerate(images):
-                                    img_buffer = io.BytesIO()
-                                    image.save(img_buffer, format="PNG")
-                                    img_buffer.seek(0)
-                                    st.markdown('<div class="download-button">', unsafe_allow_html=True)
-                                    st.download_button(
-                                        label=f"Download Logo {i+1} as PNG",
-                                        data=img_buffer,
-                                        file_name=f"generated_logo_{i+1}.png",
-                                        mime="image/png",
-                                        key=f"download_logo_button_{i+1}"
-                                    )
-                                    st.markdown('</div>', unsafe_allow_html=True)
-                        else:
-                            st.error(
-                                "No images generated. Try a more specific prompt, e.g., "
-                                "'A minimalist logo for a coffee shop, brown and green, with a coffee bean icon'."
-                            )
-                    except requests.exceptions.HTTPError as e:
-                        if response.status_code == 401:
-                            st.error("Invalid Bria AI API key. Please verify your API key or obtain a new one from https://www.bria.ai/.")
-                        elif response.status_code == 429:
-                            st.error("API rate limit exceeded. Please wait and try again or upgrade your Bria AI plan.")
-                        else:
-                            st.error(f"Error generating logo: {str(e)}")
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+                    run_logo_generation(api_key, prompt)
+
+        # Results persist in session state, so other widgets no longer wipe them
+        show_logo_results(api_key, col2)
+
+        # Search earlier logos by visual similarity
+        show_similar_logo_search()
\ No newline at end of file
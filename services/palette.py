@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image
+
+# Longest side of the downsampled image the palette is computed from
+SAMPLE_SIZE = 128
+# Pixels more transparent than this are treated as background
+ALPHA_THRESHOLD = 128
+# A border this uniform (per-channel std) is treated as a solid background
+BACKGROUND_STD = 12.0
+BACKGROUND_DISTANCE = 30.0
+# Clusters smaller than this are usually anti-aliasing between two colors
+MIN_SHARE = 0.01
+
+def _pixels(image, sample_size=SAMPLE_SIZE, alpha_threshold=ALPHA_THRESHOLD):
+    """Downsample an image and return its opaque RGB pixels plus its border pixels"""
+    image = image.copy()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    image.thumbnail((sample_size, sample_size), Image.Resampling.BOX)
+    array = np.asarray(image.convert("RGBA"), dtype=np.float32)
+    border = np.concatenate([array[0], array[-1], array[:, 0], array[:, -1]])
+    opaque = array[..., 3] >= alpha_threshold
+    border = border[border[:, 3] >= alpha_threshold][:, :3]
+    return array[opaque][:, :3], border
+
+def _drop_background(pixels, border):
+    # A uniform opaque border (e.g. the white canvas of a generated logo) is not a brand color
+    if len(border) == 0 or np.max(border.std(axis=0)) > BACKGROUND_STD:
+        return pixels
+    background = np.median(border, axis=0)
+    keep = np.linalg.norm(pixels - background, axis=1) > BACKGROUND_DISTANCE
+    return pixels[keep] if keep.any() else pixels
+
+def _kmeans_plus_plus(points, k, rng):
+    centers = [points[rng.integers(len(points))]]
+    distances = np.sum((points - centers[0]) ** 2, axis=1)
+    for _ in range(1, k):
+        total = distances.sum()
+        if total == 0:
+            break
+        centers.append(points[rng.choice(len(points), p=distances / total)])
+        distances = np.minimum(distances, np.sum((points - centers[-1]) ** 2, axis=1))
+    return np.array(centers)
+
+def _assign(points, centers):
+    # Squared distances via |p|^2 - 2 p.c + |c|^2, one matrix product for all pixels
+    distances = (
+        np.sum(points ** 2, axis=1)[:, None]
+        - 2.0 * points @ centers.T
+        + np.sum(centers ** 2, axis=1)[None, :]
+    )
+    return np.argmin(distances, axis=1)
+
+def minibatch_kmeans(points, k, batch_size=1024, iterations=30, seed=0):
+    """Cluster points with mini-batch k-means and return (centers, labels)"""
+    rng = np.random.default_rng(seed)
+    unique = np.unique(points, axis=0)
+    k = min(k, len(unique))
+    centers = _kmeans_plus_plus(unique, k, rng).astype(np.float64)
+    counts = np.zeros(len(centers))
+    for _ in range(iterations):
+        batch = points[rng.integers(len(points), size=min(batch_size, len(points)))]
+        labels = _assign(batch, centers)
+        # Per-center learning rate 1 / (points seen so far), applied in one step per batch
+        batch_counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+        seen = batch_counts > 0
+        counts[seen] += batch_counts[seen]
+        rate = batch_counts[seen] / counts[seen]
+        centers[seen] += rate[:, None] * (sums[seen] / batch_counts[seen][:, None] - centers[seen])
+    return centers, _assign(points, centers)
+
+def to_hex(color):
+    r, g, b = (int(round(c)) for c in np.clip(color, 0, 255))
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+def extract_palette(image, num_colors=6, sample_size=SAMPLE_SIZE, alpha_threshold=ALPHA_THRESHOLD,
+                    ignore_background=True, seed=0):
+    """Return the dominant colors of an image as [(hex, share)], most common first"""
+    pixels, border = _pixels(image, sample_size, alpha_threshold)
+    if len(pixels) == 0:
+        return []
+    if ignore_background:
+        pixels = _drop_background(pixels, border)
+    centers, labels = minibatch_kmeans(pixels.astype(np.float64), num_colors, seed=seed)
+    shares = np.bincount(labels, minlength=len(centers)) / len(labels)
+    order = np.argsort(-shares)
+    return [(to_hex(centers[i]), float(shares[i])) for i in order if shares[i] >= MIN_SHARE]
+
+def split_palette(palette, num_primary=3):
+    """Split a palette into comma-separated primary and secondary hex strings"""
+    hex_codes = [hex_code for hex_code, _ in palette]
+    return ", ".join(hex_codes[:num_primary]), ", ".join(hex_codes[num_primary:])
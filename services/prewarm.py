@@ -0,0 +1,108 @@
+import os
+import time
+import socket
+import asyncio
+import threading
+from services import bria_client
+from services.llm import get_llm
+from services.history import init_history_db
+from services.image_index import init_index_db
+from services.llm_cache import init_cache_db
+from services.sessions import init_sessions_db
+from services.single_flight import init_flight_db
+from services.usage import init_usage_db
+from services.downloads import init_blob_owners_db
+from services.style_guide_pdf import font_files, get_styles
+from services.brand_style_guide import SECTION_MAX_TOKENS
+
+GEMINI_HOST = "generativelanguage.googleapis.com"
+# The (max_tokens, tool) combinations the tools ask get_llm for
+LLM_CONFIGS = [
+    (200, "caption"),
+    (1000, "brand_story"),
+    (2000, "style_guide"),
+    (SECTION_MAX_TOKENS, "style_guide")
+]
+# A process is only ready once these steps succeed; the others just make the first request faster
+REQUIRED_STEPS = ("sqlite",)
+
+_report = {}
+_done = threading.Event()
+_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+
+def warm_sqlite():
+    for init in (init_history_db, init_index_db, init_cache_db, init_sessions_db, init_flight_db, init_usage_db,
+                 init_blob_owners_db):
+        init()
+
+def warm_reportlab():
+    font_files()
+    get_styles()
+
+def warm_llm_clients():
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise LookupError("GOOGLE_API_KEY is not set.")
+    for max_tokens, tool in LLM_CONFIGS:
+        get_llm(api_key, max_tokens=max_tokens, tool=tool)
+    socket.getaddrinfo(GEMINI_HOST, 443)
+
+PREWARM_STEPS = {
+    "sqlite": warm_sqlite,
+    "reportlab": warm_reportlab,
+    "llm_clients": warm_llm_clients,
+    "bria_connections": bria_client.warm_connections
+}
+
+def _record(name, start, error=None):
+    entry = {"ok": error is None, "ms": int((time.perf_counter() - start) * 1000)}
+    if error is not None:
+        entry["error"] = str(error)
+    _report[name] = entry
+
+def prewarm():
+    """Run the warm-up steps once per process and return readiness().
+
+    Concurrent and later callers wait for the first run instead of repeating it.
+    A failed step is reported but does not stop the others.
+    """
+    with _lock:
+        if not _done.is_set():
+            for name, step in PREWARM_STEPS.items():
+                start = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    _record(name, start, e)
+                else:
+                    _record(name, start)
+            _done.set()
+    return readiness()
+
+def start_prewarm():
+    """Start prewarm in a background thread, once per process, without waiting for it"""
+    global _started
+    with _start_lock:
+        if _started or _done.is_set():
+            return
+        _started = True
+    threading.Thread(target=prewarm, name="brandforge-prewarm", daemon=True).start()
+
+async def aprewarm():
+    """prewarm for event-loop servers, which also opens the loop's async Bria connection"""
+    await asyncio.to_thread(prewarm)
+    start = time.perf_counter()
+    try:
+        await bria_client.awarm_connections()
+    except Exception as e:
+        _record("bria_async_connections", start, e)
+    else:
+        _record("bria_async_connections", start)
+    return readiness()
+
+def readiness():
+    """Whether this process has finished warming up, with the outcome of every step"""
+    ready = _done.is_set() and all(_report.get(name, {}).get("ok") for name in REQUIRED_STEPS)
+    return {"ready": ready, "steps": dict(_report)}
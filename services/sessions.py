@@ -0,0 +1,118 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from services.db import get_connection
+
+# Shared by every process that validates tokens; without it tokens only survive until a restart
+SESSION_SECRET = os.getenv("BRANDFORGE_SESSION_SECRET", "").encode("utf-8") or secrets.token_bytes(32)
+SESSION_TTL = 7 * 24 * 3600
+COOKIE_NAME = "brandforge_session"
+# Expired rows are deleted this many at a time so the write lock is held only briefly
+SWEEP_BATCH_SIZE = 500
+SWEEP_INTERVAL = 300
+
+_db_ready = False
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+def init_sessions_db():
+    """Create the sessions table if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions
+                 (token_hash TEXT PRIMARY KEY, username TEXT, expires_at REAL)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_sessions_expires
+                 ON sessions (expires_at)''')
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def _sign(payload):
+    digest = hmac.new(SESSION_SECRET, payload.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+def _token_hash(token):
+    # Only a hash is stored, so a leaked database holds no usable tokens
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def create_session(username, ttl=SESSION_TTL):
+    """Issue a signed session token for a user who just logged in; returns (token, expires_at)"""
+    init_sessions_db()
+    expires_at = int(time.time() + ttl)
+    payload = f"{secrets.token_urlsafe(24)}.{expires_at}"
+    token = f"{payload}.{_sign(payload)}"
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO sessions (token_hash, username, expires_at) VALUES (?, ?, ?)",
+              (_token_hash(token), username, expires_at))
+    conn.commit()
+    conn.close()
+    sweep_expired_sessions()
+    return token, expires_at
+
+def validate_session(token):
+    """Return the username a token belongs to, or None if it is forged, expired or revoked.
+
+    The signature and expiry are checked first, so bad tokens never reach the database.
+    """
+    if not token:
+        return None
+    payload, _, signature = token.rpartition(".")
+    _, _, expires_at = payload.rpartition(".")
+    if not hmac.compare_digest(_sign(payload), signature):
+        return None
+    try:
+        if int(expires_at) < time.time():
+            return None
+    except ValueError:
+        return None
+    init_sessions_db()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT username FROM sessions WHERE token_hash = ? AND expires_at >= ?",
+              (_token_hash(token), time.time()))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def revoke_session(token):
+    """Log a token out before it expires"""
+    if not token:
+        return
+    init_sessions_db()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM sessions WHERE token_hash = ?", (_token_hash(token),))
+    conn.commit()
+    conn.close()
+
+def sweep_expired_sessions(force=False):
+    """Delete expired sessions in batches, at most once per SWEEP_INTERVAL unless forced"""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < SWEEP_INTERVAL:
+            return 0
+        _last_sweep = now
+    init_sessions_db()
+    conn = get_connection()
+    c = conn.cursor()
+    deleted = 0
+    try:
+        while True:
+            c.execute('''DELETE FROM sessions WHERE rowid IN
+                         (SELECT rowid FROM sessions WHERE expires_at < ? LIMIT ?)''', (now, SWEEP_BATCH_SIZE))
+            conn.commit()
+            deleted += c.rowcount
+            if c.rowcount < SWEEP_BATCH_SIZE:
+                break
+    finally:
+        conn.close()
+    return deleted
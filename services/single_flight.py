@@ -0,0 +1,215 @@
+import io
+import os
+import json
+import time
+import uuid
+import base64
+import asyncio
+import weakref
+import threading
+from PIL import Image
+from services.db import get_connection
+
+# Cross-process coalescing through SQLite; off unless enabled
+SHARED_ENABLED = os.getenv("BRANDFORGE_SINGLE_FLIGHT_SHARED", "0") == "1"
+# A lock older than this is treated as abandoned by a crashed process
+LOCK_TTL = 180
+# How long a finished result stays readable by processes that waited on it
+RESULT_TTL = 60
+POLL_INTERVAL = 0.25
+
+_db_ready = False
+
+class _Call:
+    """An in-flight call that other threads can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_calls = {}
+_calls_lock = threading.Lock()
+# In-flight tasks per event loop
+_async_calls = weakref.WeakKeyDictionary()
+
+def init_flight_db():
+    """Create the cross-process lock and result tables if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS flight_locks
+                 (request_key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS flight_results
+                 (request_key TEXT PRIMARY KEY, payload BLOB, expires_at REAL)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_flight_results_expires
+                 ON flight_results (expires_at)''')
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def _try_acquire(key, owner):
+    init_flight_db()
+    now = time.time()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM flight_locks WHERE request_key = ? AND expires_at < ?", (key, now))
+    c.execute("INSERT OR IGNORE INTO flight_locks (request_key, owner, expires_at) VALUES (?, ?, ?)",
+              (key, owner, now + LOCK_TTL))
+    acquired = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return acquired
+
+def _is_locked(key):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM flight_locks WHERE request_key = ? AND expires_at >= ?", (key, time.time()))
+    locked = c.fetchone() is not None
+    conn.close()
+    return locked
+
+def _release(key, owner, payload=None):
+    now = time.time()
+    conn = get_connection()
+    c = conn.cursor()
+    if payload is not None:
+        c.execute("DELETE FROM flight_results WHERE expires_at < ?", (now,))
+        c.execute("INSERT OR REPLACE INTO flight_results (request_key, payload, expires_at) VALUES (?, ?, ?)",
+                  (key, payload, now + RESULT_TTL))
+    c.execute("DELETE FROM flight_locks WHERE request_key = ? AND owner = ?", (key, owner))
+    conn.commit()
+    conn.close()
+
+def _load_result(key):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT payload FROM flight_results WHERE request_key = ? AND expires_at >= ?", (key, time.time()))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def _run_shared(key, fn, encode, decode):
+    """Run fn unless another process is already running the same key, then reuse its result"""
+    owner = uuid.uuid4().hex
+    deadline = time.time() + LOCK_TTL
+    while not _try_acquire(key, owner):
+        if time.time() >= deadline:
+            # Another process keeps re-taking the lock; stop waiting on it
+            return fn(), False
+        while _is_locked(key) and time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+        payload = _load_result(key)
+        if payload is not None:
+            return decode(payload), True
+        # The other process failed or timed out; try to run it here instead
+    payload = None
+    try:
+        result = fn()
+        payload = encode(result)
+        return result, False
+    finally:
+        _release(key, owner, payload)
+
+async def _arun_shared(key, factory, encode, decode):
+    """Async variant of _run_shared"""
+    owner = uuid.uuid4().hex
+    deadline = time.time() + LOCK_TTL
+    while not await asyncio.to_thread(_try_acquire, key, owner):
+        if time.time() >= deadline:
+            return await factory(), False
+        while await asyncio.to_thread(_is_locked, key) and time.time() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+        payload = await asyncio.to_thread(_load_result, key)
+        if payload is not None:
+            return await asyncio.to_thread(decode, payload), True
+    payload = None
+    try:
+        result = await factory()
+        payload = await asyncio.to_thread(encode, result)
+        return result, False
+    finally:
+        await asyncio.to_thread(_release, key, owner, payload)
+
+def single_flight(key, fn, encode=None, decode=None):
+    """Run fn() once for concurrent callers with the same key and share the outcome.
+
+    Threads of this process that ask for a key already in flight wait for it
+    and receive the same result or exception. When SHARED_ENABLED is set and
+    encode/decode are given, other processes are coalesced through SQLite too.
+    Returns (result, shared).
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    try:
+        if SHARED_ENABLED and encode is not None and decode is not None:
+            call.result, shared = _run_shared(key, fn, encode, decode)
+        else:
+            call.result, shared = fn(), False
+        return call.result, shared
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+def _forget(calls, key, task):
+    if calls.get(key) is task:
+        del calls[key]
+    # Mark the exception as retrieved in case every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+async def _with_flag(aw):
+    return await aw, False
+
+async def asingle_flight(key, factory, encode=None, decode=None):
+    """Async variant of single_flight; factory is called with no arguments and returns a coroutine"""
+    calls = _async_calls.setdefault(asyncio.get_running_loop(), {})
+    task = calls.get(key)
+    shared = task is not None
+    if task is None:
+        if SHARED_ENABLED and encode is not None and decode is not None:
+            task = asyncio.ensure_future(_arun_shared(key, factory, encode, decode))
+        else:
+            task = asyncio.ensure_future(_with_flag(factory()))
+        calls[key] = task
+        task.add_done_callback(lambda t: _forget(calls, key, t))
+    # Shield so one disconnected client doesn't cancel the call for everyone waiting on it
+    result, shared_elsewhere = await asyncio.shield(task)
+    return result, shared or shared_elsewhere
+
+def encode_image_result(result):
+    """Serialize a (data, images) generation result for other processes"""
+    data, images = result
+    encoded = []
+    for image in images:
+        if image is None:
+            encoded.append(None)
+            continue
+        img_buffer = io.BytesIO()
+        image.save(img_buffer, format="PNG", compress_level=1)
+        encoded.append(base64.b64encode(img_buffer.getvalue()).decode("ascii"))
+    return json.dumps({"data": data, "images": encoded}).encode("utf-8")
+
+def decode_image_result(payload):
+    """Inverse of encode_image_result"""
+    decoded = json.loads(payload)
+    images = [
+        Image.open(io.BytesIO(base64.b64decode(image))) if image is not None else None
+        for image in decoded["images"]
+    ]
+    return decoded["data"], images
@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import zlib
+import uuid
+import difflib
+import weakref
+import tempfile
+from collections import deque
+
+# Latest versions kept as plain text; older ones become compressed diffs
+HISTORY_KEEP_FULL = 3
+# Compressed diffs kept in memory before older ones spill to disk
+HISTORY_MAX_IN_MEMORY = 20
+# Hard cap on retained versions, oldest dropped first
+HISTORY_MAX_VERSIONS = 100
+SPILL_DIR = os.path.join(tempfile.gettempdir(), "brandforge_history")
+
+def _tokens(text):
+    return re.findall(r"\S+|\s+", text)
+
+def encode_diff(successor, text):
+    """Compress `text` as word-level edits against its successor version"""
+    a = _tokens(successor)
+    b = _tokens(text)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return zlib.compress(json.dumps(ops).encode("utf-8"))
+
+def apply_diff(successor, blob):
+    """Rebuild a version from its successor and the blob made by encode_diff"""
+    a = _tokens(successor)
+    parts = []
+    for op in json.loads(zlib.decompress(blob).decode("utf-8")):
+        parts.append("".join(a[op[0]:op[1]]) if isinstance(op, list) else op)
+    return "".join(parts)
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class StoryHistory:
+    """Bounded story version history for session state.
+
+    The newest `keep_full` versions are stored as text. Each older version is
+    a compressed reverse diff against the version after it, and diffs beyond
+    `max_in_memory` are appended to a per-session spill file, which is
+    rewritten without dropped diffs once they take up more than half of it.
+    Versions are only decoded when requested with get().
+    """
+
+    def __init__(self, keep_full=HISTORY_KEEP_FULL, max_in_memory=HISTORY_MAX_IN_MEMORY,
+                 max_versions=HISTORY_MAX_VERSIONS):
+        self.keep_full = max(1, keep_full)
+        self.max_in_memory = max_in_memory
+        self.max_versions = max_versions
+        self._actions = []
+        self._full = deque()
+        self._diffs = deque()
+        self._spilled = deque()
+        self._spill_path = None
+        self._spill_dead_bytes = 0
+
+    def __len__(self):
+        return len(self._actions)
+
+    def append(self, action, story):
+        """Record a new newest version"""
+        self._actions.append(action)
+        self._full.append(story)
+        if len(self._full) > self.keep_full:
+            oldest = self._full.popleft()
+            self._diffs.append(encode_diff(self._full[0], oldest))
+        if len(self._diffs) > self.max_in_memory:
+            self._spill(self._diffs.popleft())
+        while len(self._actions) > self.max_versions:
+            self._drop_oldest()
+
+    def labels(self):
+        """Return display labels for every version without decoding any of them"""
+        return [f"{action} Story {i + 1}" for i, action in enumerate(self._actions)]
+
+    def get(self, index):
+        """Return (action, story) for the version at `index`, oldest first"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("story history index out of range")
+        num_old = len(self._spilled) + len(self._diffs)
+        if index >= num_old:
+            return self._actions[index], self._full[index - num_old]
+        # Walk back from the oldest full version, applying each reverse diff
+        text = self._full[0]
+        for position in range(num_old - 1, index - 1, -1):
+            text = apply_diff(text, self._blob(position))
+        return self._actions[index], text
+
+    def _blob(self, position):
+        if position >= len(self._spilled):
+            return self._diffs[position - len(self._spilled)]
+        offset, length = self._spilled[position]
+        with open(self._spill_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _spill(self, blob):
+        if self._spill_path is None:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            self._spill_path = os.path.join(SPILL_DIR, f"{uuid.uuid4().hex}.bin")
+            # Remove the spill file once the session drops this history
+            weakref.finalize(self, _remove_file, self._spill_path)
+        with open(self._spill_path, "ab") as f:
+            offset = f.tell()
+            f.write(blob)
+        self._spilled.append((offset, len(blob)))
+
+    def _compact_spill(self):
+        # Copy the diffs still referenced to a new file; offsets are rebuilt as they are written
+        tmp_path = f"{self._spill_path}.tmp"
+        spilled = deque()
+        with open(self._spill_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for offset, length in self._spilled:
+                src.seek(offset)
+                spilled.append((dst.tell(), length))
+                dst.write(src.read(length))
+        os.replace(tmp_path, self._spill_path)
+        self._spilled = spilled
+        self._spill_dead_bytes = 0
+
+    def _drop_oldest(self):
+        self._actions.pop(0)
+        if self._spilled:
+            _, length = self._spilled.popleft()
+            self._spill_dead_bytes += length
+            live_bytes = sum(length for _, length in self._spilled)
+            if self._spill_dead_bytes > live_bytes:
+                self._compact_spill()
+        elif self._diffs:
+            self._diffs.popleft()
+        else:
+            self._full.popleft()
@@ -0,0 +1,59 @@
+import re
+from services.text_utils import STOPWORDS, tokenize, stem
+
+# Weights of the ranking signals; each signal is scored from 0 to 1
+RANKING_WEIGHTS = {
+    "length_fit": 0.4,
+    "keyword_coverage": 0.4,
+    "readability": 0.2
+}
+# Flesch reading ease range that reads well for a general audience
+READABILITY_RANGE = (60, 80)
+# Prompt words that describe the request rather than the brand
+PROMPT_STOPWORDS = STOPWORDS | {"brand", "narrative", "targeting", "focusing", "emphasizing", "ages", "values"}
+
+def prompt_keywords(prompt):
+    """Content words of the prompt, such as the brand name and its values"""
+    return {stem(w) for w in tokenize(prompt) if len(w) >= 4 and w not in PROMPT_STOPWORDS}
+
+def _syllables(word):
+    groups = len(re.findall(r"[aeiouy]+", word))
+    if word.endswith("e") and not word.endswith("le") and groups > 1:
+        groups -= 1
+    return max(groups, 1)
+
+def flesch_reading_ease(text):
+    words = tokenize(text)
+    if not words:
+        return 0.0
+    sentences = max(len(re.findall(r"[.!?]+(?:\s|$)", text)), 1)
+    syllables = sum(_syllables(w) for w in words)
+    return 206.835 - 1.015 * len(words) / sentences - 84.6 * syllables / len(words)
+
+def score_story(story, keywords, word_count):
+    """Score one story on length fit, keyword coverage and readability"""
+    words = tokenize(story)
+    length_fit = max(0.0, 1 - abs(len(words) - word_count) / word_count)
+    story_stems = {stem(w) for w in words}
+    keyword_coverage = len(keywords & story_stems) / len(keywords) if keywords else 1.0
+    low, high = READABILITY_RANGE
+    ease = flesch_reading_ease(story)
+    readability = max(0.0, 1 - max(low - ease, ease - high, 0) / 40)
+    signals = {
+        "length_fit": length_fit,
+        "keyword_coverage": keyword_coverage,
+        "readability": readability
+    }
+    return {
+        "score": sum(RANKING_WEIGHTS[name] * value for name, value in signals.items()),
+        "word_count": len(words),
+        "reading_ease": ease,
+        **signals
+    }
+
+def rank_stories(stories, prompt, word_count):
+    """Return one dict per story with its scores, best first"""
+    keywords = prompt_keywords(prompt)
+    ranked = [{"story": story, **score_story(story, keywords, word_count)} for story in stories]
+    ranked.sort(key=lambda candidate: candidate["score"], reverse=True)
+    return ranked
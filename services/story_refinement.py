@@ -0,0 +1,128 @@
+import re
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import HumanMessage
+from services.circuit_breaker import BREAKERS
+from services.text_utils import STOPWORDS, tokenize, stem
+
+TARGETED_REFINE_SYSTEM_PROMPT = (
+    "You are an editor revising selected paragraphs of a brand story. "
+    "You receive a short outline of the whole story for context, the paragraphs to revise, each starting with a tag such as [P2], and the user's feedback. "
+    "Rewrite only the tagged paragraphs so they address the feedback while staying consistent with the rest of the story. "
+    "Return every revised paragraph starting with its original tag, and nothing else."
+)
+
+# Stories shorter than this are cheaper to rewrite in full
+MIN_PARAGRAPHS_FOR_TARGETING = 3
+OUTLINE_SENTENCE_CHARS = 160
+
+# Only count as a reference when followed by e.g. "paragraph", so "make the first line punchier" does not
+ORDINALS = {
+    "first": 0, "second": 1, "third": 2, "fourth": 3, "fifth": 4, "sixth": 5,
+    "opening": 0, "last": -1, "final": -1, "closing": -1
+}
+# Names of a whole paragraph that are references on their own
+SECTION_NAMES = {"opening": 0, "intro": 0, "introduction": 0, "conclusion": -1}
+
+def split_paragraphs(story):
+    """Split a story into paragraphs on blank lines"""
+    return [p.strip() for p in re.split(r"\n\s*\n", story.strip()) if p.strip()]
+
+def select_target_paragraphs(paragraphs, feedback):
+    """Pick the paragraph indexes the feedback refers to, or None if it concerns the whole story"""
+    if not feedback or len(paragraphs) < MIN_PARAGRAPHS_FOR_TARGETING:
+        return None
+    text = feedback.lower()
+
+    # Explicit references such as "paragraph 2", "the opening" or "the last paragraph"
+    targets = set()
+    for number in re.findall(r"\b(?:paragraph|para|p)\s*#?(\d+)\b", text):
+        if 1 <= int(number) <= len(paragraphs):
+            targets.add(int(number) - 1)
+    for words in re.findall(r"\b([a-z]+(?:(?:\s*,\s*|\s+and\s+)[a-z]+)*)\s+(?:paragraph|para|section)s?\b", text):
+        for word in re.split(r"\s*,\s*|\s+and\s+", words):
+            if word in ORDINALS:
+                targets.add(ORDINALS[word] % len(paragraphs))
+            elif word == "middle":
+                targets.add(len(paragraphs) // 2)
+    for word, index in SECTION_NAMES.items():
+        if re.search(rf"\b{word}\b", text):
+            targets.add(index % len(paragraphs))
+    if targets:
+        return sorted(targets)
+
+    # Otherwise rank paragraphs by overlap with the feedback's content words
+    terms = {stem(w) for w in tokenize(text) if len(w) >= 3 and w not in STOPWORDS}
+    if not terms:
+        return None
+    scores = []
+    for index, paragraph in enumerate(paragraphs):
+        words = {stem(w) for w in tokenize(paragraph)}
+        scores.append((len(terms & words), index))
+    matched = [index for score, index in sorted(scores, reverse=True) if score > 0]
+    # Feedback touching most paragraphs is effectively a full rewrite
+    max_targets = (len(paragraphs) + 1) // 2
+    if not matched or len(matched) > max_targets:
+        return None
+    return sorted(matched)
+
+def build_outline(paragraphs, targets):
+    """Summarize the story as the opening sentence of each paragraph"""
+    lines = []
+    for index, paragraph in enumerate(paragraphs):
+        sentence = re.split(r"(?<=[.!?])\s", paragraph, maxsplit=1)[0]
+        if len(sentence) > OUTLINE_SENTENCE_CHARS:
+            sentence = sentence[:OUTLINE_SENTENCE_CHARS].rsplit(" ", 1)[0] + "..."
+        marker = " (to revise)" if index in targets else ""
+        lines.append(f"[P{index + 1}]{marker} {sentence}")
+    return "\n".join(lines)
+
+def parse_revised_paragraphs(content, targets):
+    """Map each tagged paragraph in the model output back to its index"""
+    revised = {}
+    pieces = re.split(r"^\s*\[P(\d+)\]\s*", content.strip(), flags=re.M)
+    for number, text in zip(pieces[1::2], pieces[2::2]):
+        index = int(number) - 1
+        if index in targets and text.strip():
+            revised[index] = text.strip()
+    return revised
+
+def refine_story_targeted(llm, story, feedback):
+    """Revise only the paragraphs the feedback concerns and splice them back into the story.
+
+    Returns (story, targets); targets is None when the feedback applies to the
+    whole story or the reply does not revise every target paragraph, in which
+    case the story is returned unchanged so the caller can fall back to a full
+    rewrite.
+    """
+    paragraphs = split_paragraphs(story)
+    targets = select_target_paragraphs(paragraphs, feedback)
+    if targets is None:
+        return story, None
+
+    tagged = "\n\n".join(f"[P{index + 1}] {paragraphs[index]}" for index in targets)
+    # Feedback is its own message so the prompt cache only reuses answers to the same feedback
+    messages = [
+        HumanMessage(content=f"Story outline:\n{build_outline(paragraphs, targets)}\n\nParagraphs to revise:\n{tagged}"),
+        HumanMessage(content=f"User feedback: {feedback}")
+    ]
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", TARGETED_REFINE_SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="messages")
+    ])
+    with BREAKERS["gemini"].call():
+        response = (prompt | llm).invoke({"messages": messages})
+
+    revised = parse_revised_paragraphs(response.content, targets)
+    if len(revised) < len(targets):
+        return story, None
+    for index, text in revised.items():
+        paragraphs[index] = text
+    return "\n\n".join(paragraphs), targets
+
+def summarize_usage(usage_metadata):
+    """Total the per-model usage reported by get_usage_metadata_callback"""
+    totals = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    for usage in usage_metadata.values():
+        for field in totals:
+            totals[field] += usage.get(field, 0)
+    return totals
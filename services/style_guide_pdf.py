@@ -0,0 +1,317 @@
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+from functools import lru_cache
+from xml.sax.saxutils import escape
+from PIL import Image
+import reportlab
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Flowable
+from services.style_guide_schema import SECTION_FIELDS, section_text
+
+PAGE_SIZES = {
+    "Letter (8.5x11)": letter,
+    "A4 (210x297mm)": A4
+}
+# Logos are downsampled once to this resolution at their largest printed size
+PRINT_DPI = 300
+TITLE_LOGO_WIDTH = 2 * inch
+HEADER_LOGO_WIDTH = 0.5 * inch
+USAGE_LOGO_WIDTH = 1.5 * inch
+MAX_PDF_LOGOS = 3
+# Section flowables and downsampled logos kept per flowable cache
+MAX_CACHED_FLOWABLES = 32
+LOGO_JPEG_QUALITY = 85
+SWATCH_WIDTH = 0.6 * inch
+SPECIMEN_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ abcdefghijklmnopqrstuvwxyz 0123456789"
+# TrueType fonts found here can be used for typography specimens
+FONT_DIRS = [
+    os.path.join(os.path.dirname(reportlab.__file__), "fonts"),
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts"),
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts")
+]
+
+_font_lock = threading.Lock()
+
+def _font_key(name):
+    key = re.sub(r"[^a-z0-9]", "", name.lower())
+    return key[:-len("regular")] if key.endswith("regular") and key != "regular" else key
+
+@lru_cache(maxsize=1)
+def font_files():
+    """Map normalized family names to installed .ttf files; scanned once per process"""
+    files = {}
+    for font_dir in FONT_DIRS:
+        for root, _, names in os.walk(font_dir):
+            for name in sorted(names):
+                stem, ext = os.path.splitext(name)
+                if ext.lower() == ".ttf":
+                    files.setdefault(_font_key(stem), os.path.join(root, name))
+    return files
+
+@lru_cache(maxsize=None)
+def register_font(family):
+    """Register an installed font with reportlab once and return its name, or None if unavailable.
+
+    TrueType fonts are embedded as subsets holding only the glyphs a PDF uses.
+    """
+    key = _font_key(family)
+    path = font_files().get(key)
+    if not path:
+        return None
+    name = f"BrandForge-{key}"
+    with _font_lock:
+        try:
+            pdfmetrics.registerFont(TTFont(name, path))
+        except (TTFError, OSError):
+            return None
+    return name
+
+@lru_cache(maxsize=1)
+def get_styles():
+    """Paragraph styles shared by every style guide PDF"""
+    styles = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#2c3e50')
+        ),
+        "section": ParagraphStyle(
+            'SectionTitle',
+            parent=styles['Heading2'],
+            fontSize=18,
+            spaceAfter=12,
+            spaceBefore=20,
+            textColor=colors.HexColor('#34495e')
+        ),
+        "subsection": ParagraphStyle(
+            'SubsectionTitle',
+            parent=styles['Heading3'],
+            fontSize=13,
+            spaceAfter=6,
+            spaceBefore=10,
+            textColor=colors.HexColor('#34495e')
+        ),
+        "body": ParagraphStyle(
+            'BodyText',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=6,
+            leading=14
+        ),
+        "cell": ParagraphStyle(
+            'CellText',
+            parent=styles['Normal'],
+            fontSize=9,
+            leading=11
+        ),
+        "caption": ParagraphStyle(
+            'Caption',
+            parent=styles['Italic'],
+            fontSize=9,
+            textColor=colors.HexColor('#7f8c8d')
+        )
+    }
+
+def logo_key(image):
+    return hashlib.sha256(f"{image.mode}{image.size}".encode() + image.tobytes()).hexdigest()
+
+def section_key(guide, section):
+    """Content hash of the fields behind one section"""
+    fields = guide.model_dump(include=set(SECTION_FIELDS[section]))
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _cached(cache, key, build):
+    if cache is None:
+        return build()
+    if key not in cache:
+        cache[key] = build()
+        for stale in list(cache)[:-MAX_CACHED_FLOWABLES]:
+            del cache[stale]
+    return cache[key]
+
+class PDFLogo:
+    """A logo downsampled once and shared by every place it is drawn.
+
+    reportlab names image XObjects by content, so drawing the same reader on
+    several pages embeds the image a single time.
+    """
+
+    def __init__(self, image, key=None, max_width=TITLE_LOGO_WIDTH):
+        self.key = key or logo_key(image)
+        image = image.copy()
+        max_pixels = round(max_width / inch * PRINT_DPI)
+        image.thumbnail((max_pixels, max_pixels), Image.Resampling.LANCZOS)
+        self.aspect = image.height / image.width
+        img_buffer = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P") and image.convert("RGBA").getextrema()[3][0] < 255:
+            image.convert("RGBA").save(img_buffer, format="PNG")
+            self.mask = "auto"
+        else:
+            # Opaque logos are embedded as JPEG, which the PDF stores as-is
+            image.convert("RGB").save(img_buffer, format="JPEG", quality=LOGO_JPEG_QUALITY, optimize=True)
+            self.mask = None
+        img_buffer.seek(0)
+        self.reader = ImageReader(img_buffer)
+
+    def draw(self, canv, x, y, width):
+        canv.drawImage(self.reader, x, y, width, width * self.aspect, mask=self.mask)
+
+class LogoRow(Flowable):
+    """One or more logos side by side"""
+
+    def __init__(self, logos, width, gap=0.25 * inch):
+        super().__init__()
+        self.logos = logos
+        self.logo_width = width
+        self.gap = gap
+
+    def wrap(self, available_width, available_height):
+        self.width = len(self.logos) * (self.logo_width + self.gap) - self.gap
+        self.height = max(logo.aspect for logo in self.logos) * self.logo_width
+        return self.width, self.height
+
+    def draw(self):
+        for i, logo in enumerate(self.logos):
+            logo.draw(self.canv, i * (self.logo_width + self.gap), 0, self.logo_width)
+
+def swatch_table(color_entries, width):
+    """A table with one row per color: swatch, name, hex code and usage"""
+    styles = get_styles()
+    rows = [["", "Color", "Hex", "Usage"]]
+    commands = [
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 9),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LINEBELOW", (0, 0), (-1, -1), 0.25, colors.HexColor('#d5d8dc')),
+        ("TOPPADDING", (0, 1), (-1, -1), 6),
+        ("BOTTOMPADDING", (0, 1), (-1, -1), 6)
+    ]
+    for i, color in enumerate(color_entries, start=1):
+        rows.append(["", Paragraph(escape(color.name), styles["cell"]), color.hex,
+                     Paragraph(escape(color.usage), styles["cell"])])
+        commands.append(("BACKGROUND", (0, i), (0, i), colors.HexColor(color.hex)))
+    column_widths = [SWATCH_WIDTH, 1.4 * inch, 0.8 * inch, width - SWATCH_WIDTH - 2.2 * inch]
+    return Table(rows, colWidths=column_widths, rowHeights=[None] + [0.45 * inch] * len(color_entries),
+                 style=TableStyle(commands), hAlign="LEFT")
+
+def font_specimens(fonts):
+    """Sample lines for each named font, in the font itself where it is installed"""
+    styles = get_styles()
+    flowables = []
+    for family in fonts:
+        font_name = register_font(family)
+        label = escape(family)
+        if font_name:
+            flowables.append(Paragraph(f'<font name="{font_name}" size="16">{label}</font>', styles["body"]))
+            flowables.append(Paragraph(f'<font name="{font_name}">{SPECIMEN_TEXT}</font>', styles["body"]))
+        else:
+            flowables.append(Paragraph(f'<font size="16">{label}</font>', styles["body"]))
+            flowables.append(Paragraph("Not installed on the server; shown in Helvetica.", styles["caption"]))
+        flowables.append(Spacer(1, 8))
+    return flowables
+
+def _paragraphs(text, style):
+    return [Paragraph(escape(line), style) for line in text.split("\n") if line.strip()]
+
+def section_flowables(guide, section, width, logos=(), fonts=()):
+    """Flowables for one section of the guide"""
+    styles = get_styles()
+    flowables = [Paragraph(section.upper(), styles["section"])]
+    if section == "Color Palette":
+        flowables.append(Paragraph("Primary Colors", styles["subsection"]))
+        flowables.append(swatch_table(guide.primary_colors, width))
+        if guide.secondary_colors:
+            flowables.append(Paragraph("Secondary Colors", styles["subsection"]))
+            flowables.append(swatch_table(guide.secondary_colors, width))
+        flowables.append(Spacer(1, 10))
+        flowables.extend(_paragraphs(guide.color_guidelines, styles["body"]))
+    else:
+        flowables.extend(_paragraphs(section_text(guide, section), styles["body"]))
+        if section == "Typography" and fonts:
+            flowables.append(Paragraph("Font Specimens", styles["subsection"]))
+            flowables.extend(font_specimens(fonts))
+        if section == "Logo Usage" and logos:
+            flowables.append(Spacer(1, 10))
+            flowables.append(LogoRow(logos, USAGE_LOGO_WIDTH))
+    flowables.append(Spacer(1, 20))
+    return flowables
+
+def generate_style_guide_pdf(output, brand_name, guide, page_size, include_sections, generation_date,
+                             logos=(), fonts=(), flowable_cache=None):
+    """Write a style guide PDF to `output`, a path or binary file object.
+
+    `logos` are PIL images, at most MAX_PDF_LOGOS of which are embedded;
+    `fonts` are family names shown as specimens in the Typography section.
+    A `flowable_cache` dict reused across builds keeps the laid-out content
+    of unchanged sections, so only edited sections are built again. It
+    must not be shared between threads.
+    """
+    doc = SimpleDocTemplate(output, pagesize=PAGE_SIZES.get(page_size, letter), pageCompression=1,
+                            title=f"{brand_name} Brand Style Guide")
+    styles = get_styles()
+    pdf_logos = []
+    for logo in list(logos)[:MAX_PDF_LOGOS]:
+        key = logo_key(logo)
+        pdf_logos.append(_cached(flowable_cache, ("logo", key), lambda: PDFLogo(logo, key)))
+    sections = [section for section in include_sections if section in SECTION_FIELDS]
+
+    story = []
+    # Title page
+    if pdf_logos:
+        story.append(LogoRow(pdf_logos[:1], TITLE_LOGO_WIDTH))
+        story.append(Spacer(1, 30))
+    story.append(Paragraph(escape(brand_name.upper()), styles["title"]))
+    story.append(Paragraph("BRAND STYLE GUIDE", styles["title"]))
+    story.append(Spacer(1, 50))
+    story.append(Paragraph(f"Generated on {escape(str(generation_date))}", styles["body"]))
+    story.append(PageBreak())
+
+    # Table of contents (simplified)
+    story.append(Paragraph("TABLE OF CONTENTS", styles["section"]))
+    story.append(Spacer(1, 20))
+    for section in sections:
+        story.append(Paragraph(f"• {section}", styles["body"]))
+    story.append(PageBreak())
+
+    logo_keys = tuple(logo.key for logo in pdf_logos)
+    for section in sections:
+        key = (section, section_key(guide, section), doc.width,
+               logo_keys if section == "Logo Usage" else (), tuple(fonts) if section == "Typography" else ())
+        flowables = _cached(flowable_cache, key, lambda section=section: section_flowables(
+            guide, section, doc.width, pdf_logos, fonts
+        ))
+        for flowable in flowables:
+            # Set by a previous build when the flowable was pushed to the next page
+            flowable.__dict__.pop("_postponed", None)
+        story.extend(flowables)
+
+    def draw_header(canv, doc):
+        # Reuses the title page logo's XObject on every page
+        if pdf_logos:
+            canv.saveState()
+            pdf_logos[0].draw(canv, doc.pagesize[0] - doc.rightMargin - HEADER_LOGO_WIDTH,
+                              doc.pagesize[1] - doc.topMargin + 12, HEADER_LOGO_WIDTH)
+            canv.restoreState()
+
+    doc.build(story, onLaterPages=draw_header)
+    return output
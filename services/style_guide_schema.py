@@ -0,0 +1,90 @@
+import re
+import json
+from pydantic import BaseModel, Field, ValidationError, create_model, field_validator
+
+HEX_COLOR = re.compile(r"^#?([0-9A-Fa-f]{3}|[0-9A-Fa-f]{6})$")
+
+class ColorEntry(BaseModel):
+    name: str = Field(min_length=1, description="Short color name, e.g. 'Ocean Blue'")
+    hex: str = Field(description="Hex code in the form #RRGGBB")
+    usage: str = Field(min_length=1, description="Where and how to use the color")
+
+    @field_validator("hex")
+    @classmethod
+    def normalize_hex(cls, value):
+        match = HEX_COLOR.match(value.strip())
+        if not match:
+            raise ValueError("must be a hex color such as #1A2B3C")
+        digits = match.group(1)
+        if len(digits) == 3:
+            digits = "".join(c * 2 for c in digits)
+        return f"#{digits.upper()}"
+
+class StyleGuide(BaseModel):
+    brand_overview: str = Field(min_length=1, description="Mission and vision, target audience, personality and values")
+    primary_colors: list[ColorEntry] = Field(min_length=1, description="Main brand colors")
+    secondary_colors: list[ColorEntry] = Field(description="Supporting and accent colors")
+    color_guidelines: str = Field(min_length=1, description="Color combinations and accessibility considerations")
+    typography: str = Field(min_length=1, description="Primary and secondary font families, hierarchy and sizing")
+    logo_usage: str = Field(min_length=1, description="Variations, clear space, minimum size, placement and misuse")
+    imagery_guidelines: str = Field(min_length=1, description="Photography style, icons, graphic elements and patterns")
+    voice_and_tone: str = Field(min_length=1, description="Voice characteristics, tone by context and writing style")
+    applications: str = Field(min_length=1, description="Digital, print and environmental applications")
+
+# PDF and preview sections, each backed by one or more StyleGuide fields
+SECTION_FIELDS = {
+    "Brand Overview": ["brand_overview"],
+    "Color Palette": ["primary_colors", "secondary_colors", "color_guidelines"],
+    "Typography": ["typography"],
+    "Logo Usage": ["logo_usage"],
+    "Imagery Guidelines": ["imagery_guidelines"],
+    "Voice & Tone": ["voice_and_tone"],
+    "Applications": ["applications"]
+}
+
+def load_json_object(text):
+    """Parse a model response as a JSON object, tolerating code fences; {} if it is not one"""
+    text = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", text or "")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def invalid_fields(data):
+    """Validate a raw style guide dict and return {field: error message} for each failing top-level field"""
+    try:
+        StyleGuide.model_validate(data)
+    except ValidationError as e:
+        errors = {}
+        for error in e.errors():
+            field = error["loc"][0] if error["loc"] else "__root__"
+            location = ".".join(str(part) for part in error["loc"][1:])
+            message = f"{location}: {error['msg']}" if location else error["msg"]
+            errors.setdefault(field, []).append(message)
+        return {field: "; ".join(messages) for field, messages in errors.items()}
+    return {}
+
+def repair_schema(fields):
+    """A model holding only the given StyleGuide fields, for re-requesting just those"""
+    return create_model(
+        "StyleGuideRepair",
+        **{name: (StyleGuide.model_fields[name].annotation, StyleGuide.model_fields[name]) for name in fields}
+    )
+
+def format_colors(colors):
+    return "\n".join(f"- {color.name} ({color.hex}): {color.usage}" for color in colors)
+
+def section_text(guide, section):
+    """Plain-text body of one section"""
+    if section == "Color Palette":
+        parts = [f"Primary colors:\n{format_colors(guide.primary_colors)}"]
+        if guide.secondary_colors:
+            parts.append(f"Secondary colors:\n{format_colors(guide.secondary_colors)}")
+        parts.append(guide.color_guidelines)
+        return "\n\n".join(parts)
+    return getattr(guide, SECTION_FIELDS[section][0])
+
+def style_guide_text(guide):
+    """Render the whole guide as text for previews, downloads and history"""
+    return "\n\n".join(f"{section.upper()}\n{section_text(guide, section)}" for section in SECTION_FIELDS)
@@ -0,0 +1,17 @@
+import re
+
+# Common words that say nothing about which part of a story a text is about
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "make", "more", "less", "it's", "its", "into", "about",
+    "story", "paragraph", "part", "should", "could", "would", "please", "also", "very", "some", "add",
+    "from", "than", "then", "them", "they", "their", "there", "have", "has", "was", "were", "are",
+    "our", "your", "you", "but", "not", "too", "all", "any", "can", "just", "like", "feel", "bit"
+}
+
+def tokenize(text):
+    """Lowercase words of a text, keeping apostrophes"""
+    return re.findall(r"[a-z']+", text.lower())
+
+def stem(word):
+    """Crude stem that treats words sharing their first five letters as the same"""
+    return word[:5]
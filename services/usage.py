@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import sqlite3
+import atexit
+import threading
+import contextlib
+import contextvars
+from langchain_core.callbacks import get_usage_metadata_callback
+from services.db import get_connection
+
+# Quotas can be switched off, e.g. for local development
+QUOTAS_ENABLED = os.getenv("BRANDFORGE_QUOTAS", "1") == "1"
+QUOTA_WINDOW = 24 * 3600
+# Counters are pre-aggregated per user, tool and hour, so a quota check sums at most 24 rows
+BUCKET_SECONDS = 3600
+# Limit per QUOTA_WINDOW and the unit it is counted in; tools not listed are recorded but not limited
+QUOTAS = {
+    "logo": (100, "images"),
+    "logo_hd": (20, "images"),
+    "edit": (100, "images"),
+    "brand_kit": (100, "images"),
+    "caption": (50_000, "tokens"),
+    "brand_story": (100_000, "tokens"),
+    "style_guide": (100_000, "tokens")
+}
+# Ledger rows are written in one transaction once this many are buffered, or after FLUSH_INTERVAL
+FLUSH_SIZE = 50
+FLUSH_INTERVAL = 5.0
+
+_db_ready = False
+_buffer = []
+# Unflushed units per (username, tool, bucket), so quotas see calls that are still buffered
+_pending = {}
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+# Timer and sharing state of the innermost metered block of the current thread or task
+_active_meter = contextvars.ContextVar("active_meter", default=None)
+
+class QuotaExceededError(Exception):
+    """Raised before an external call that would take a user over their quota"""
+
+    def __init__(self, tool, used, limit, unit, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            f"You have used {used:,} of your {limit:,} {unit} for {tool.replace('_', ' ')} in the last 24 hours. "
+            f"Please try again in about {max(retry_after // 60, 1)} minutes."
+        )
+
+def init_usage_db():
+    """Create the usage ledger and counter tables if needed"""
+    global _db_ready
+    if _db_ready:
+        return
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS usage_ledger
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, tool TEXT, resolution INTEGER,
+                  units INTEGER, tokens INTEGER, latency_ms INTEGER, created_at REAL)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_usage_ledger_user
+                 ON usage_ledger (username, created_at)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS usage_counters
+                 (username TEXT, tool TEXT, bucket INTEGER, calls INTEGER, units INTEGER,
+                  PRIMARY KEY (username, tool, bucket))''')
+    conn.commit()
+    conn.close()
+    _db_ready = True
+
+def _bucket(timestamp):
+    return int(timestamp // BUCKET_SECONDS * BUCKET_SECONDS)
+
+def flush_usage():
+    """Write buffered ledger rows and counter increments in one transaction"""
+    global _last_flush
+    with _buffer_lock:
+        rows = _buffer[:]
+        counters = dict(_pending)
+        _buffer.clear()
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not rows:
+        return
+    init_usage_db()
+    conn = get_connection()
+    try:
+        with conn:
+            conn.executemany('''INSERT INTO usage_ledger
+                                (username, tool, resolution, units, tokens, latency_ms, created_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+            conn.executemany('''INSERT INTO usage_counters (username, tool, bucket, calls, units)
+                                VALUES (?, ?, ?, ?, ?)
+                                ON CONFLICT (username, tool, bucket)
+                                DO UPDATE SET calls = calls + excluded.calls, units = units + excluded.units''',
+                             [(*key, calls, units) for key, (calls, units) in counters.items()])
+    except Exception:
+        # Keep the rows for the next flush rather than losing them
+        with _buffer_lock:
+            _buffer[:0] = rows
+            for key, (calls, units) in counters.items():
+                pending = _pending.setdefault(key, [0, 0])
+                pending[0] += calls
+                pending[1] += units
+        raise
+    finally:
+        conn.close()
+
+atexit.register(flush_usage)
+
+def record_usage(username, tool, units, resolution=None, tokens=0, latency_ms=0):
+    """Buffer one external call for the ledger and the quota counters"""
+    now = time.time()
+    with _buffer_lock:
+        _buffer.append((username, tool, resolution, units, tokens, latency_ms, now))
+        pending = _pending.setdefault((username, tool, _bucket(now)), [0, 0])
+        pending[0] += 1
+        pending[1] += units
+        due = len(_buffer) >= FLUSH_SIZE or time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        try:
+            flush_usage()
+        except sqlite3.Error:
+            # The rows stay buffered and are retried on the next flush
+            pass
+
+def window_usage(username, tool, window=QUOTA_WINDOW):
+    """Return (units used, oldest bucket with usage) for a user and tool within the rolling window"""
+    init_usage_db()
+    start = _bucket(time.time() - window) + BUCKET_SECONDS
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''SELECT COALESCE(SUM(units), 0), MIN(bucket) FROM usage_counters
+                 WHERE username = ? AND tool = ? AND bucket >= ?''', (username, tool, start))
+    used, oldest = c.fetchone()
+    conn.close()
+    with _buffer_lock:
+        for (pending_user, pending_tool, bucket), (_, units) in _pending.items():
+            if pending_user == username and pending_tool == tool and bucket >= start:
+                used += units
+                oldest = bucket if oldest is None else min(oldest, bucket)
+    return used, oldest
+
+def check_quota(username, tool, units=0):
+    """Raise QuotaExceededError if `units` more would exceed the user's quota for tool"""
+    if not QUOTAS_ENABLED or tool not in QUOTAS:
+        return
+    limit, unit = QUOTAS[tool]
+    used, oldest = window_usage(username, tool)
+    if used + units > limit or used >= limit:
+        retry_after = int(oldest + QUOTA_WINDOW - time.time()) if oldest is not None else BUCKET_SECONDS
+        raise QuotaExceededError(tool, used, limit, unit, max(retry_after, 60))
+
+def _ledger_entry(tool, units, resolution, usage, meter, usage_callback):
+    # Returns the (units, resolution, tokens, latency_ms) to record for a finished metered block
+    usage["usage_metadata"] = usage_callback.usage_metadata
+    tokens = sum(metadata.get("total_tokens", 0) for metadata in usage_callback.usage_metadata.values())
+    if QUOTAS.get(tool, (0, ""))[1] == "tokens":
+        units = tokens
+    if meter["shared"]:
+        units = 0
+    return units, resolution, tokens, int((time.perf_counter() - meter["start"]) * 1000)
+
+def mark_admitted():
+    """Restart the enclosing metered block's timer, so its latency excludes time spent queued"""
+    meter = _active_meter.get()
+    if meter is not None:
+        meter["start"] = time.perf_counter()
+
+def mark_shared():
+    """Note that the enclosing metered block received another caller's result instead of calling out"""
+    meter = _active_meter.get()
+    if meter is not None:
+        meter["shared"] = True
+
+@contextlib.contextmanager
+def metered(username, tool, units=0, resolution=None):
+    """Check the quota before an external call, then time it and record it in the ledger.
+
+    For tools counted in tokens, the Gemini token usage of the block is
+    counted; the yielded dict holds its "usage_metadata" afterwards. Calls
+    that raise are not recorded, and calls that only waited for another
+    caller's identical request (see mark_shared) are recorded without units.
+    """
+    check_quota(username, tool, units)
+    usage = {"usage_metadata": {}}
+    meter = {"start": time.perf_counter(), "shared": False}
+    token = _active_meter.set(meter)
+    try:
+        with get_usage_metadata_callback() as usage_callback:
+            yield usage
+    finally:
+        _active_meter.reset(token)
+    record_usage(username, tool, *_ledger_entry(tool, units, resolution, usage, meter, usage_callback))
+
+@contextlib.asynccontextmanager
+async def ametered(username, tool, units=0, resolution=None):
+    """Async variant of metered; the quota check and the ledger write run in a worker thread"""
+    await asyncio.to_thread(check_quota, username, tool, units)
+    usage = {"usage_metadata": {}}
+    meter = {"start": time.perf_counter(), "shared": False}
+    token = _active_meter.set(meter)
+    try:
+        with get_usage_metadata_callback() as usage_callback:
+            yield usage
+    finally:
+        _active_meter.reset(token)
+    entry = _ledger_entry(tool, units, resolution, usage, meter, usage_callback)
+    await asyncio.to_thread(record_usage, username, tool, *entry)